@@ -13,11 +13,21 @@ def merge_arrays(arr1, arr2):
 
     return list(merged_set)
 
+# Shared lookups, building a PyPIQuery per module reloaded everything every time
+names = None
+pypi = None
+
 def filter_module(module):
-    from helpers.py_pi_query import PyPIQuery
-    pypi = PyPIQuery()
+    global names, pypi
+    from helpers.package_index import PackageNameIndex
+    if names is None: names = PackageNameIndex()
 
-    query = pypi.query_module(module)
+    if names.available():
+        query = module in names
+    else:
+        from helpers.py_pi_query import PyPIQuery
+        if pypi is None: pypi = PyPIQuery()
+        query = pypi.query_module(module)
     
     if not query:
         print(f"{module} = False")
@@ -1,11 +1,14 @@
 # Helper file to build a docker file based off of our model intuitions
 import docker
 from time import sleep
+from urllib.parse import urlparse
 # from docker import APIClient
 from io import BytesIO
 
+from helpers.system_packages import SystemPackages
+
 class DockerHelper():
-    def __init__(self, logging=False, image_name="", dockerfile_name="", container_name = "") -> None:
+    def __init__(self, logging=False, image_name="", dockerfile_name="", container_name = "", index_url=None) -> None:
         # Stores the dockerfile information for output
         self.dockerfile_out = ""
         # The name of the docker image- This is unique based on snippet name and python version
@@ -19,6 +22,23 @@ class DockerHelper():
         self.logging = logging
         # When an error occurs, we want to know what it was on a previous run
         self.previous_error = {"error_message": '', "module": ''}
+        # Optional local index (helpers/pypi_snapshot.py) to install from instead of pypi.org
+        # This must be reachable from inside the build, e.g. http://host.docker.internal:8080
+        self.index_url = index_url.rstrip('/') if index_url else None
+        # Debian packages the pinned modules need to build or run
+        self.system = SystemPackages(logging=logging)
+
+    # The pip arguments that pick the index to install from
+    def pip_index_args(self):
+        if self.index_url:
+            return f'"--index-url","{self.index_url}/simple","--trusted-host","{urlparse(self.index_url).hostname}"'
+        return '"--trusted-host","pypi.python.org"'
+
+    # One apt-get layer for every system package, sorted so the same set reuses the cached layer
+    # Older python images are on Debian releases that moved to archive.debian.org, so fall back to it
+    def apt_install(self, packages):
+        archive = "sed -i -e 's|deb.debian.org|archive.debian.org|g' -e 's|security.debian.org|archive.debian.org|g' -e '/-updates/d' /etc/apt/sources.list && apt-get -o Acquire::Check-Valid-Until=false update"
+        return f"RUN (apt-get update || ({archive})) && apt-get install -y --no-install-recommends {' '.join(packages)} && rm -rf /var/lib/apt/lists/*\n"
 
     def query_docker(self):
         return self.client.api.images()
@@ -44,8 +64,17 @@ class DockerHelper():
         self.dockerfile_out += f"""# Set the working directory to /app\n"""
         self.dockerfile_out += f"""WORKDIR /app\n"""
 
+        # System packages for the pinned modules, plus any an earlier build said were missing
+        system_packages = sorted(set(self.system.for_modules(llm_out['python_modules'])) | set(llm_out.get('system_packages', [])))
+        if system_packages:
+            self.dockerfile_out += f"""# Install the system packages the python modules need\n"""
+            self.dockerfile_out += self.apt_install(system_packages)
+        llm_out['system_packages'] = system_packages
+
         self.dockerfile_out += f"""# Add install commands for all of the python modules\n"""
-        self.dockerfile_out += f"""RUN ["pip","install","--upgrade","pip"]\n"""
+        # A local snapshot only holds the packages we recorded, so keep the image's own pip
+        if not self.index_url:
+            self.dockerfile_out += f"""RUN ["pip","install","--upgrade","pip"]\n"""
         # Loop through the modules and add these to the docker file as pip installs
         python_modules = llm_out['python_modules']
         if self.logging: print(python_modules)
@@ -60,9 +89,9 @@ class DockerHelper():
             # if self.logging: print(type(data))
             # if self.logging: print(data)
             if type(version) == str:
-                self.dockerfile_out += f"""RUN ["pip","install","--trusted-host","pypi.python.org","--default-timeout=100","{name}=={version}"]\n"""
+                self.dockerfile_out += f"""RUN ["pip","install",{self.pip_index_args()},"--default-timeout=100","{name}=={version}"]\n"""
             else:
-                self.dockerfile_out += f"""RUN ["pip","install","--trusted-host","pypi.python.org","--default-timeout=100","{name}=={version[0]}"]\n"""
+                self.dockerfile_out += f"""RUN ["pip","install",{self.pip_index_args()},"--default-timeout=100","{name}=={version[0]}"]\n"""
 
         # Copys the snippet to the app dir for running
         self.dockerfile_out += f"""# Copy the specified directory to /app\n"""
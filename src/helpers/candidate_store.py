@@ -0,0 +1,138 @@
+# Shared store of candidate version lists
+# Replaces the modules/<dep>_<python>.txt files that were written into every
+# snippet folder. Lists are keyed by (package, python version, metadata revision)
+# and stored content-addressed, so identical lists are written once and any
+# number of workers can read them without locks.
+#
+# Layout:
+#   objects/<sha[:2]>/<sha>                  serialised VersionStore, never modified
+#   refs/<package>/<python>/<revision>       sha of the list for that revision
+#   refs/<package>/<python>/HEAD             the newest revision we've seen
+import argparse
+import hashlib
+import os
+import re
+import tempfile
+
+from packaging.utils import canonicalize_name
+
+from helpers.pypi_cache import CACHE_DIR
+from helpers.version_store import VersionStore
+
+# Bump when the candidate selection changes so old lists aren't reused
+STORE_FORMAT = 1
+
+# Revision used for lists imported from the old per-snippet files
+LEGACY_REVISION = 'legacy'
+
+class CandidateStore:
+
+    def __init__(self, store_dir=None, logging=False) -> None:
+        self.logging = logging
+        self.store_dir = store_dir if store_dir else f"{CACHE_DIR}/candidates"
+        os.makedirs(f"{self.store_dir}/objects", exist_ok=True)
+        os.makedirs(f"{self.store_dir}/refs", exist_ok=True)
+
+    # Writes a file so readers either see the old content or the new, never half of it
+    def atomic_write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+    def read_file(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def ref_dir(self, package, python_version):
+        name = re.sub(r'[^a-z0-9-]', '-', canonicalize_name(package))
+        return f"{self.store_dir}/refs/{name}/{python_version}"
+
+    def object_path(self, sha):
+        return f"{self.store_dir}/objects/{sha[:2]}/{sha}"
+
+    def revision_key(self, revision):
+        return str(revision) if revision == LEGACY_REVISION else f"{STORE_FORMAT}-{revision}"
+
+    # Stores a list of versions and points the (package, python, revision) key at it
+    def put(self, package, python_version, revision, versions):
+        store = versions if isinstance(versions, VersionStore) else VersionStore(versions)
+        data = store.to_bytes()
+        sha = hashlib.sha256(data).hexdigest()
+
+        # Objects are immutable, if it's there another worker already wrote the same list
+        if not os.path.isfile(self.object_path(sha)):
+            self.atomic_write(self.object_path(sha), data)
+
+        ref_dir = self.ref_dir(package, python_version)
+        revision = self.revision_key(revision)
+        self.atomic_write(f"{ref_dir}/{revision}", sha.encode())
+        # Legacy imports never replace a list computed from live metadata
+        if revision != LEGACY_REVISION or not os.path.isfile(f"{ref_dir}/HEAD"):
+            self.atomic_write(f"{ref_dir}/HEAD", revision.encode())
+        return sha
+
+    # Gets the VersionStore for a key, using the newest revision when none is given
+    # Returns None if we've never stored a list for it
+    def get(self, package, python_version, revision=None):
+        ref_dir = self.ref_dir(package, python_version)
+        if revision is None:
+            head = self.read_file(f"{ref_dir}/HEAD")
+            if head is None: return None
+            revision = head.decode()
+        else:
+            revision = self.revision_key(revision)
+
+        sha = self.read_file(f"{ref_dir}/{revision}")
+        if sha is None: return None
+        data = self.read_file(self.object_path(sha.decode()))
+        if data is None: return None
+        return VersionStore.from_bytes(data)
+
+    # Imports the <module>_<python>.txt files from an old per-snippet modules folder
+    # Returns how many lists were imported
+    def migrate_folder(self, folder):
+        imported = 0
+        for file_name in os.listdir(folder):
+            match = re.match(r'^(.+)_(\d+\.\d+)\.txt$', file_name)
+            if not match: continue
+            with open(os.path.join(folder, file_name), 'r') as f:
+                versions = VersionStore.from_string(f.read())
+            if len(versions) == 0: continue
+            self.put(match.group(1), match.group(2), LEGACY_REVISION, versions)
+            imported += 1
+            if self.logging: print(f"Imported {file_name}")
+        return imported
+
+    # Walks a results tree and imports every 'modules' folder found in it
+    def migrate(self, root):
+        imported = 0
+        for folder, dirs, files in os.walk(root):
+            if os.path.basename(folder) == 'modules':
+                imported += self.migrate_folder(folder)
+        return imported
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Shared candidate version store')
+    parser.add_argument('-m', '--migrate', type=str, help="Import the modules/*.txt files found under this folder")
+    parser.add_argument('-s', '--store', type=str, nargs="?", default=None, help="Store location, defaults to ./cache/candidates")
+    parser.add_argument('-v', '--verbose', action="store_true", help="Verbose logging of information")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    store = CandidateStore(store_dir=args.store, logging=args.verbose)
+    if args.migrate:
+        print(f"Imported {store.migrate(args.migrate)} version lists from {args.migrate}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Decides whether a release can actually be installed on a python:X.Y image
+# Uses the requires_python metadata and wheel filename tags of each file,
+# the same information pip uses when it picks a distribution.
+from packaging import tags
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+
+# Newest manylinux glibc available in the official python:X.Y images
+# End of life images are frozen on the Debian release they were last built on
+MANYLINUX_GLIBC = {
+    '2.6': (2, 13),
+    '2.7': (2, 28),
+    '3.3': (2, 19),
+    '3.4': (2, 24),
+    '3.5': (2, 28),
+    '3.6': (2, 31),
+}
+DEFAULT_GLIBC = (2, 36)
+
+# Legacy manylinux names and the glibc they correspond to
+LEGACY_MANYLINUX = {(2, 17): 'manylinux2014', (2, 12): 'manylinux2010', (2, 5): 'manylinux1'}
+
+# File types pip can install. Eggs and Windows installers are ignored
+SDIST_SUFFIXES = ('.tar.gz', '.zip', '.tar.bz2', '.tgz', '.tar')
+
+class CompatibilityChecker:
+
+    # python_version: the X.Y of the image, full_version: X.Y.Z the image ships with
+    def __init__(self, python_version, full_version=None, arch='x86_64') -> None:
+        self.python_version = python_version
+        major, minor = (int(part) for part in python_version.split('.')[:2])
+        self.full_version = full_version if full_version else f"{python_version}.0"
+        self.supported_tags = self.image_tags((major, minor), arch)
+        # Caches so each distinct specifier or tag string is only evaluated once
+        self.specifier_results = {}
+        self.tag_results = {}
+
+    # Every tag the interpreter in the image will accept, pip's own ordering isn't needed
+    def image_tags(self, python_version, arch):
+        major, minor = python_version
+        max_glibc = MANYLINUX_GLIBC.get(f"{major}.{minor}", DEFAULT_GLIBC)
+        platforms = []
+        for glibc_minor in range(max_glibc[1], 4, -1):
+            platforms.append(f"manylinux_2_{glibc_minor}_{arch}")
+            if (2, glibc_minor) in LEGACY_MANYLINUX:
+                platforms.append(f"{LEGACY_MANYLINUX[(2, glibc_minor)]}_{arch}")
+        platforms.append(f"linux_{arch}")
+
+        # The docker images are built with wide unicode (2.7) and pymalloc (<3.8)
+        if major == 2:
+            abis = [f"cp{major}{minor}mu"]
+        elif minor < 8:
+            abis = [f"cp{major}{minor}m"]
+        else:
+            abis = [f"cp{major}{minor}"]
+
+        supported = set(tags.cpython_tags(python_version=python_version, abis=abis, platforms=platforms))
+        supported.update(tags.compatible_tags(python_version=python_version, interpreter=f"cp{major}{minor}", platforms=platforms))
+        return supported
+
+    # True if the requires_python specifier allows the image's interpreter
+    def requires_python_ok(self, requires_python):
+        if not requires_python: return True
+        if requires_python not in self.specifier_results:
+            try:
+                self.specifier_results[requires_python] = SpecifierSet(requires_python).contains(self.full_version, prereleases=True)
+            except InvalidSpecifier:
+                # pip ignores specifiers it can't parse, so do the same
+                self.specifier_results[requires_python] = True
+        return self.specifier_results[requires_python]
+
+    # True if the file is an sdist or a wheel with a tag the image supports
+    def file_ok(self, filename):
+        if filename.endswith('.whl'):
+            tag = '-'.join(filename[:-4].split('-')[-3:])
+            if tag not in self.tag_results:
+                try:
+                    self.tag_results[tag] = not self.supported_tags.isdisjoint(tags.parse_tag(tag))
+                except Exception:
+                    self.tag_results[tag] = False
+            return self.tag_results[tag]
+        return filename.lower().endswith(SDIST_SUFFIXES)
+
+    def installable(self, filename, requires_python):
+        return self.requires_python_ok(requires_python) and self.file_ok(filename)
@@ -0,0 +1,279 @@
+# Persistent graph of what each release depends on
+# Every (package, version) we look at has its Requires-Dist lines stored in a
+# SQLite file shared by every run, with the markers left as written so one
+# fetch serves every Python version. Markers are evaluated for the target
+# Python when the graph is read. Releases we haven't seen are fetched in
+# parallel, a level of the graph at a time.
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import HeaderParser
+from urllib.parse import urljoin
+
+from packaging.markers import InvalidMarker
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name
+
+from helpers.py_pi_query import PyPIQuery
+from helpers.pypi_cache import CACHE_DIR
+from helpers.version_store import VersionStore
+
+GRAPH_FILE = f"{CACHE_DIR}/dependency_graph.sqlite"
+
+# How far below the pins clashes are looked for
+MAX_DEPTH = 3
+
+# Releases of an unpinned module checked for one that agrees with the pins
+PICK_TRIES = 5
+
+class DependencyGraph:
+
+    # pypi: the PyPIQuery whose cache, release indexes and checkers we share
+    def __init__(self, pypi, graph_file=GRAPH_FILE, workers=8, logging=False) -> None:
+        self.logging = logging
+        self.pypi = pypi
+        self.graph_file = graph_file
+        self.workers = max(1, workers)
+        # (name, version) -> Requires-Dist lines and (name, version, python) -> {dep: SpecifierSet}
+        self.raw = {}
+        self.evaluated = {}
+        self.installable = {}
+        # Releases whose requirements we couldn't read, sdist only ones, never stored in the graph file
+        self.unknown = set()
+        # (name, specifier, python, pins) -> the version pick() chose
+        self.picks = {}
+        os.makedirs(os.path.dirname(self.graph_file) or '.', exist_ok=True)
+        self.create_tables()
+
+    # Opens a new connection for every operation, like PyPICache
+    def connect(self):
+        return sqlite3.connect(self.graph_file, timeout=60)
+
+    def create_tables(self):
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # A node row means we've fetched the release, even if it has no edges
+            conn.execute('CREATE TABLE IF NOT EXISTS nodes (package TEXT, version TEXT, source TEXT, fetched_at REAL, PRIMARY KEY (package, version)) WITHOUT ROWID')
+            conn.execute('CREATE TABLE IF NOT EXISTS edges (package TEXT, version TEXT, requirement TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS edges_release ON edges (package, version)')
+
+    # Marker environment of a python:X.Y image
+    def environment(self, python_version):
+        checker = self.pypi.get_checker(python_version)
+        return {
+            'python_version': python_version,
+            'python_full_version': checker.full_version,
+            'implementation_name': 'cpython',
+            'platform_python_implementation': 'CPython',
+            'sys_platform': 'linux',
+            'platform_system': 'Linux',
+            'os_name': 'posix',
+            'platform_machine': 'x86_64',
+            'extra': '',
+        }
+
+    # Installable versions of a module for a Python version, as a VersionStore, empty if it isn't on PyPI
+    def installable_versions(self, name, python_version):
+        key = (name, python_version)
+        if key not in self.installable:
+            index = self.pypi.get_release_index(name)
+            if not index:
+                self.installable[key] = VersionStore()
+            else:
+                mask = index.installable(self.pypi.get_checker(python_version))
+                self.installable[key] = VersionStore(version for version, ok in zip(index.versions, mask) if ok)
+        return self.installable[key]
+
+    # Requires-Dist of a release from the per-release JSON, or the PEP 658 metadata file of a wheel
+    # for indexes that don't serve the per-release JSON. Returns (lines, source)
+    def fetch_release(self, name, version):
+        data = self.pypi.cache.get_json(f"pypi/{name}/{version}/json")
+        # A null requires_dist means no requirements only if a wheel was uploaded, sdist only releases aren't read by PyPI
+        if data and (data['info'].get('requires_dist') is not None or any(details.get('packagetype') == 'bdist_wheel' for details in data.get('urls', []))):
+            return data['info'].get('requires_dist') or [], 'json'
+
+        data = self.pypi.cache.get_json(f"pypi/{name}/json")
+        files = [details for details in (data or {}).get('releases', {}).get(version, []) if details.get('core-metadata') or details.get('data-dist-info-metadata')]
+        # Only wheels have it, so for releases with just an sdist we can't tell
+        if not files: return [], 'none'
+        files.sort(key=lambda details: not details['filename'].endswith('-none-any.whl'))
+        # Wheels of one release share their requirements, so any of them will do
+        for details in files[:3]:
+            try:
+                response = self.pypi.cache.session.get(urljoin(f"{self.pypi.cache.index_url}/pypi/{name}/json", details['url']) + '.metadata', timeout=self.pypi.cache.timeout)
+                response.raise_for_status()
+                return HeaderParser().parsestr(response.text).get_all('Requires-Dist') or [], 'metadata'
+            except Exception as e:
+                if self.logging: print(f"Unable to get the metadata for {details['filename']}: {e}")
+        return None, 'error'
+
+    # Makes sure every release is in the graph, fetching the missing ones in parallel
+    def ensure(self, releases):
+        releases = [release for release in dict.fromkeys(releases) if release not in self.raw]
+        if not releases: return
+        with self.connect() as conn:
+            for name, version in releases:
+                # Earlier runs stored sdist only releases as having no requirements, those are looked at again
+                row = conn.execute('SELECT source FROM nodes WHERE package = ? AND version = ?', (name, version)).fetchone()
+                if row and row[0] != 'none':
+                    self.raw[(name, version)] = [line for (line,) in conn.execute('SELECT requirement FROM edges WHERE package = ? AND version = ?', (name, version))]
+
+        missing = [release for release in releases if release not in self.raw]
+        if not missing: return
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(missing))) as executor:
+            fetched = list(executor.map(lambda release: self.fetch_release(*release), missing))
+
+        with self.connect() as conn:
+            for (name, version), (lines, source) in zip(missing, fetched):
+                # Failed fetches aren't stored, so they're tried again next run
+                if lines is None:
+                    self.raw[(name, version)] = []
+                    continue
+                # Nor are releases we can't read the requirements of, no requirements isn't the same as unknown
+                if source == 'none':
+                    self.raw[(name, version)] = []
+                    self.unknown.add((name, version))
+                    continue
+                self.raw[(name, version)] = lines
+                conn.execute('INSERT OR REPLACE INTO nodes (package, version, source, fetched_at) VALUES (?, ?, ?, ?)', (name, version, source, time.time()))
+                conn.execute('DELETE FROM edges WHERE package = ? AND version = ?', (name, version))
+                conn.executemany('INSERT INTO edges (package, version, requirement) VALUES (?, ?, ?)', [(name, version, line) for line in lines])
+        if self.logging: print(f"Fetched {len(missing)} releases into the dependency graph in {time.perf_counter() - start:.2f}s")
+
+    # Whether we know what a release requires, False for the sdist only ones
+    def known(self, name, version):
+        return (canonicalize_name(name), version) not in self.unknown
+
+    # The requirements a release brings in on the given Python, as {name: SpecifierSet}
+    # Empty for releases whose requirements are unknown, see known()
+    # Extras and markers that don't apply to the image are left out
+    def requirements(self, name, version, python_version):
+        name = canonicalize_name(name)
+        key = (name, version, python_version)
+        if key in self.evaluated:
+            return self.evaluated[key]
+
+        self.ensure([(name, version)])
+        environment = self.environment(python_version)
+        found = {}
+        for line in self.raw[(name, version)]:
+            try:
+                requirement = Requirement(line)
+                if requirement.marker is not None and not requirement.marker.evaluate(environment): continue
+            except (InvalidRequirement, InvalidMarker):
+                # pip would skip metadata it can't parse, so do we
+                continue
+            dep = canonicalize_name(requirement.name)
+            found[dep] = found[dep] & requirement.specifier if dep in found else requirement.specifier
+        self.evaluated[key] = found
+        return found
+
+    # The version pip would most likely pick for an unpinned module: the newest installable one that fits
+    # pinned: when given, the newest few are checked and the first that agrees with the pins wins,
+    # as pip would backtrack to it. Releases with unknown requirements can't be said to agree, so they're skipped
+    # The answer is kept per (module, specifier, Python, pins), clashes() asks the same question at every level
+    def pick(self, name, specifier, python_version, pinned=None):
+        key = (name, str(specifier), python_version, tuple(sorted(pinned.items())) if pinned else None)
+        if key not in self.picks:
+            self.picks[key] = self.find_pick(name, specifier, python_version, pinned)
+        return self.picks[key]
+
+    def find_pick(self, name, specifier, python_version, pinned):
+        versions = self.installable_versions(name, python_version)
+        allowed = list(specifier.filter(list(versions)))
+        if not allowed: return None
+        if pinned:
+            newest = allowed[::-1][:PICK_TRIES]
+            self.ensure([(name, version) for version in newest])
+            for version in newest:
+                if not self.known(name, version): continue
+                requirements = self.requirements(name, version, python_version)
+                if all(specifier.contains(pinned[dep], prereleases=True) for dep, specifier in requirements.items() if dep in pinned):
+                    return version
+        return allowed[-1]
+
+    # Which pins clash, directly or through the modules they pull in
+    # pins: {module: version}
+    # Unpinned modules are followed through the release pip would most likely pick, MAX_DEPTH levels down
+    # Returns a list of dicts, one per module nothing can satisfy:
+    #   module       the module the requirements disagree on
+    #   pinned       its pin, None if it isn't pinned
+    #   required_by  [(path, specifier)], path being the chain of releases from a pin
+    def clashes(self, pins, python_version, max_depth=MAX_DEPTH):
+        pinned = {canonicalize_name(module): version for module, version in pins.items()}
+        # dep -> [(path, SpecifierSet)]
+        constraints = {}
+        chosen = dict(pinned)
+        level = [((name, version), (f"{name}=={version}",)) for name, version in pinned.items()]
+
+        for depth in range(max_depth):
+            if not level: break
+            self.ensure([release for release, path in level])
+            next_level = []
+            for (name, version), path in level:
+                for dep, specifier in self.requirements(name, version, python_version).items():
+                    constraints.setdefault(dep, []).append((path, specifier))
+                    if dep in chosen: continue
+                    combined = SpecifierSet()
+                    for other_path, other in constraints[dep]:
+                        combined &= other
+                    picked = self.pick(dep, combined, python_version, pinned)
+                    if picked is None: continue
+                    chosen[dep] = picked
+                    next_level.append(((dep, picked), path + (f"{dep}=={picked}",)))
+            level = next_level
+
+        found = []
+        for dep, requirements in constraints.items():
+            if dep in pinned:
+                broken = [(path, specifier) for path, specifier in requirements if not specifier.contains(pinned[dep], prereleases=True)]
+                if broken:
+                    found.append({'module': dep, 'pinned': pinned[dep], 'required_by': [(' -> '.join(path), str(specifier)) for path, specifier in broken]})
+                continue
+            combined = SpecifierSet()
+            for path, specifier in requirements:
+                combined &= specifier
+            if self.pick(dep, combined, python_version) is None:
+                found.append({'module': dep, 'pinned': None, 'required_by': [(' -> '.join(path), str(specifier)) for path, specifier in requirements]})
+        return found
+
+    # One line per clash, for the logs and prompts
+    def describe(self, clashes):
+        lines = []
+        for clash in clashes:
+            wanted = '; '.join(f"{path} needs {clash['module']}{specifier or ' (any)'}" for path, specifier in clash['required_by'])
+            pinned = f" but it's pinned to {clash['pinned']}" if clash['pinned'] else ''
+            lines.append(f"{wanted}{pinned}")
+        return lines
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Find transitive clashes between pins')
+    parser.add_argument('pins', type=str, nargs="+", help="Pins to check, e.g. tensorflow==1.15.0 numpy==1.24.4")
+    parser.add_argument('-p', '--python', type=str, nargs="?", default='3.8', const='3.8', help="Python version of the image, defaults to 3.8")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    pins = dict(pin.split('==', 1) for pin in args.pins)
+    graph = DependencyGraph(PyPIQuery(), logging=True)
+    start = time.perf_counter()
+    clashes = graph.clashes(pins, args.python)
+    print(f"First query: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # Again with the edges read back from the graph file, as the next run would see them
+    graph = DependencyGraph(graph.pypi)
+    start = time.perf_counter()
+    graph.clashes(pins, args.python)
+    print(f"Graph read from disk: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for line in graph.describe(clashes):
+        print(line)
+    if not clashes: print('No clashes')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# Checks a set of pins against PyPI metadata before anything is built
+# The LLM picks a version per module, and a bad pick (a version that doesn't
+# exist for the image's Python, or one whose requires_dist clashes with another
+# pin) used to cost a failed Docker build per mistake. This backtracks over the
+# installable versions of each pinned module, closest to the LLM's pick first,
+# using requires_dist/requires_python from the shared DependencyGraph.
+import argparse
+import time
+
+from packaging.utils import canonicalize_name
+
+from helpers.dependency_graph import DependencyGraph
+from helpers.py_pi_query import PyPIQuery
+from helpers.version_store import VersionStore, version_key
+
+# Versions whose metadata we look at per pinned module before giving up on it
+MAX_CANDIDATES = 25
+
+# Backtracking steps before the search gives up, the pins are then left as they were
+MAX_STEPS = 200
+
+# Seconds the search may take before the pins are left as they were, it runs before every first build
+TIME_BUDGET = 5.0
+
+# Candidates per pinned module whose metadata is fetched up front, in one go
+PREFETCH = 5
+
+# Whether a version is a PEP 440 pre-release
+def is_prerelease(version):
+    key = version_key(version)
+    return key[0] == 1 and key[1].is_prerelease
+
+class DependencyResolver:
+
+    # pypi: the PyPIQuery whose cache, release indexes and checkers we share
+    # graph: the DependencyGraph the requirements come from, one on the shared graph file if None
+    # time_budget: seconds before the search gives up and the pins are kept
+    def __init__(self, pypi, graph=None, time_budget=TIME_BUDGET, logging=False) -> None:
+        self.logging = logging
+        self.pypi = pypi
+        self.graph = graph if graph is not None else DependencyGraph(pypi, logging=logging)
+        self.time_budget = time_budget
+        # pins_moved: pins changed before the first build, each would likely have been a failed build
+        self.stats = {'resolved': 0, 'repaired': 0, 'conflicts': 0, 'gave_up': 0, 'pins_moved': 0, 'time': 0.0}
+
+    # Installable versions of a module for a Python version, as a VersionStore
+    def installable_versions(self, name, python_version):
+        return self.graph.installable_versions(name, python_version)
+
+    # The requirements a release brings in on the given Python, as {name: SpecifierSet}
+    def requirements(self, name, version, python_version):
+        return self.graph.requirements(name, version, python_version)
+
+    # Candidate versions of a pinned module: the pin (or the closest installable release) first, then outwards from it
+    # Pre-releases are left out unless the pin is one
+    def domain(self, name, pinned, python_version):
+        versions = self.installable_versions(name, python_version)
+        if not is_prerelease(pinned):
+            versions = VersionStore([version for version in versions if not is_prerelease(version)], presorted=True)
+        if not len(versions): return []
+        centre = versions.index(pinned)
+        centre = centre if centre >= 0 else min(versions.position(pinned), len(versions) - 1)
+        ordered = [versions[centre]]
+        for offset in range(1, len(versions)):
+            # Newer first, a hallucinated pin is most often too new for the image but close to a real one
+            for idx in (centre + offset, centre - offset):
+                if 0 <= idx < len(versions): ordered.append(versions[idx])
+        return ordered
+
+    # Checks and repairs a set of pins
+    # pins: {module: version} as chosen by the LLM
+    # Returns a dict with:
+    #   ok          True if a consistent set was found
+    #   assignment  the pins to build with, the original ones if nothing was found
+    #   changes     {module: (old, new)} for every pin that had to move
+    #   conflict    lines explaining why no set was found, empty when ok
+    #   time        seconds spent
+    #   steps       versions tried
+    #   gave_up     True when the step or time limit ran out, the pins are then kept as they were
+    def resolve(self, pins, python_version):
+        start = time.perf_counter()
+        names = {canonicalize_name(module): module for module in pins}
+        order = list(names)
+        domains = {name: self.domain(name, pins[names[name]], python_version) for name in order}
+        state = {'steps': 0, 'blame': {}, 'start': start, 'deadline': start + self.time_budget, 'gave_up': False}
+
+        # Fetch the first few candidates of every pin together, most searches never look further
+        self.graph.ensure([(name, version) for name in order for version in domains[name][:PREFETCH]])
+        # When a pin has to move, try the versions the other pins ask for first
+        wanted = {}
+        for name in order:
+            if not domains[name]: continue
+            for dep, specifier in self.requirements(name, domains[name][0], python_version).items():
+                if dep in domains and dep != name: wanted[dep] = wanted[dep] & specifier if dep in wanted else specifier
+        for dep, specifier in wanted.items():
+            first, rest = domains[dep][:1], domains[dep][1:]
+            domains[dep] = first + sorted(rest, key=lambda version: not specifier.contains(version, prereleases=True))
+
+        # Modules nobody can install for this Python can't be fixed by moving other pins
+        conflict = [f"{names[name]} has no release installable on Python {python_version}" for name in order if not domains[name]]
+        assignment = None
+        # Allow one more pin to move each round, so the answer changes as few pins as it can
+        for budget in range(len(order) + 1 if not conflict else 0):
+            assignment = self.search(order, 0, {}, {}, domains, budget, python_version, state)
+            if assignment is not None or state['gave_up']: break
+        if assignment is None and not conflict:
+            conflict = self.explain(order, names, state)
+
+        result = {
+            'ok': assignment is not None,
+            'assignment': {names[name]: assignment[name] for name in order} if assignment else dict(pins),
+            'changes': {},
+            'conflict': conflict,
+            'time': time.perf_counter() - start,
+            'steps': state['steps'],
+            'gave_up': state['gave_up'],
+        }
+        for module in pins:
+            if result['assignment'][module] != pins[module]:
+                result['changes'][module] = (pins[module], result['assignment'][module])
+
+        self.stats['resolved'] += 1
+        self.stats['time'] += result['time']
+        if result['changes']: self.stats['repaired'] += 1
+        self.stats['pins_moved'] += len(result['changes'])
+        if state['gave_up']:
+            self.stats['gave_up'] += 1
+        elif not result['ok']:
+            self.stats['conflicts'] += 1
+        if self.logging: print(f"Resolved {len(pins)} pins in {result['time']:.2f}s ({result['steps']} steps), changed {result['changes']}, conflict {result['conflict']}")
+        return result
+
+    # Depth first search over the pinned modules in order
+    # constraints: {name: [(SpecifierSet, 'module==version')]} from the releases chosen so far
+    # budget: how many more pins may move away from the first version in their domain
+    def search(self, order, idx, assignment, constraints, domains, budget, python_version, state):
+        if idx == len(order):
+            return dict(assignment) if self.unpinned_ok(assignment, constraints, python_version, state) else None
+        name = order[idx]
+        tried = 0
+        for position, version in enumerate(domains[name]):
+            moved = position > 0
+            if moved and budget == 0: break
+
+            # Ruled out by a release we've already chosen, no metadata needed
+            rejected = [source for specifier, source in constraints.get(name, []) if not specifier.contains(version, prereleases=True)]
+            if rejected:
+                state['blame'].setdefault(name, set()).update(rejected)
+                continue
+
+            tried += 1
+            state['steps'] += 1
+            if tried > MAX_CANDIDATES: return None
+            if self.out_of_budget(state): return None
+
+            # Its own requirements have to agree with the releases we've already chosen
+            requirements = self.requirements(name, version, python_version)
+            clashes = [dep for dep, specifier in requirements.items() if dep in assignment and not specifier.contains(assignment[dep], prereleases=True)]
+            if clashes:
+                for dep in clashes:
+                    state['blame'].setdefault(name, set()).add(f"{dep}=={assignment[dep]}")
+                continue
+
+            assignment[name] = version
+            added = []
+            for dep, specifier in requirements.items():
+                constraints.setdefault(dep, []).append((specifier, f"{name}=={version}"))
+                added.append(dep)
+            found = self.search(order, idx + 1, assignment, constraints, domains, budget - moved, python_version, state)
+            if found is not None: return found
+            for dep in added:
+                constraints[dep].pop()
+            del assignment[name]
+        return None
+
+    # Whether the search has used up its steps or time, remembered so every level unwinds
+    def out_of_budget(self, state):
+        if state['steps'] > MAX_STEPS or time.perf_counter() > state['deadline']:
+            state['gave_up'] = True
+        return state['gave_up']
+
+    # The finished assignment can still clash through the modules the pins pull in
+    def unpinned_ok(self, assignment, constraints, python_version, state):
+        if self.out_of_budget(state): return False
+        clashes = self.graph.clashes(assignment, python_version)
+        for clash in clashes:
+            state['blame'].setdefault(clash['module'], set()).update(path.split(' -> ')[0] for path, specifier in clash['required_by'])
+        return not clashes
+
+    # The pins that ruled out every candidate of some module, as readable lines
+    def explain(self, order, names, state):
+        if state['gave_up']:
+            return [f"Gave up after {state['steps']} steps in {time.perf_counter() - state['start']:.1f}s"]
+        lines = []
+        for name, sources in state['blame'].items():
+            label = names.get(name, name)
+            lines.append(f"{label} is ruled out by {', '.join(sorted(sources))}")
+        return lines if lines else ['No combination of the candidate versions is consistent']
+
+    def report(self):
+        return f"Resolver: {self.stats['resolved']} runs, {self.stats['repaired']} repaired, {self.stats['conflicts']} conflicts, {self.stats['gave_up']} gave up, {self.stats['pins_moved']} pins moved before the first build, {self.stats['time']:.2f}s"
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Check a set of pins against PyPI metadata')
+    parser.add_argument('pins', type=str, nargs="+", help="Pins to check, e.g. numpy==2.0.0 pandas==0.25.3")
+    parser.add_argument('-p', '--python', type=str, nargs="?", default='3.8', const='3.8', help="Python version of the image, defaults to 3.8")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    pins = dict(pin.split('==', 1) for pin in args.pins)
+    resolver = DependencyResolver(PyPIQuery(), logging=False)
+    result = resolver.resolve(pins, args.python)
+    print(f"ok: {result['ok']}")
+    print(f"assignment: {result['assignment']}")
+    for module, (old, new) in result['changes'].items():
+        print(f"{module}: {old} -> {new}")
+    for line in result['conflict']:
+        print(line)
+    print(f"{result['steps']} steps in {result['time']:.2f}s{' (gave up)' if result['gave_up'] else ''}")
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,57 @@
 # # Get all the python files in a project
+import argparse
 import os
-import sys
-import importlib.util
-import sysconfig
+import time
 import requests
 
+from helpers.import_extractor import extract_file, extract_files
+from helpers.package_index import PackageNameIndex
+from helpers.pypi_cache import PYPI_URL
+from helpers.stdlib_modules import get_stdlib_tables
+
+# Folders that never hold the project's own code
+SKIP_DIRS = {'.git', '.hg', '.svn', '.tox', '.nox', '.venv', 'venv', 'env', '__pycache__', 'site-packages', 'node_modules', 'build', 'dist', '.eggs'}
+
+# Below this many files a process pool costs more than it saves
+POOL_MIN_FILES = 64
+
 class DepsScraper():
 
     def __init__(self, logging=False) -> None:
         self.logging = logging
+        # Local list of every project on PyPI, when it's been built we don't need the network
+        self.names = PackageNameIndex()
+        self.session = requests.Session()
+        # Standard library names for every Python we build
+        self.stdlib = get_stdlib_tables()
 
 
     # Method to check if a module is part of the standard library
     # If it is, then it doesn't exist as a regular import
     # and shouldn't be included.
-    # Takes module name as an import
-    def is_module_in_standard_library(self, module_name):
-        # spec = importlib.util.find_spec(module_name)
-        # return spec is not None #and spec.origin == "built-in"
-        
-        # Check if the module is built-in
-        if module_name in sys.builtin_module_names:
+    # Takes module name as an import and the Python version we're building for
+    # Uses the bundled tables, so 2.7 targets get the 2.7 standard library not the host's
+    def is_module_in_standard_library(self, module_name, python_version=None):
+        if module_name == 'io' or module_name == 'stringio' or module_name == 'os':
             return True
-        elif module_name == 'io' or module_name == 'stringio' or module_name == 'os':
-            return True
-        
-        # Check if the module is part of the standard library
-        module_spec = importlib.util.find_spec(module_name)
-        if module_spec is None or module_spec.origin is None:
-            return False
-        std_lib_path = sysconfig.get_paths()['stdlib']
-        return module_spec.origin.startswith(std_lib_path)
-
-        # # Try to find the module specification
-        # module_spec = importlib.util.find_spec(module_name)
-        # if module_spec is None or module_spec.origin is None:
-        #     return False
-
-        # # Get the standard library paths
-        # std_lib_path = sysconfig.get_paths()['stdlib']
-        # purelib_path = sysconfig.get_paths()['purelib']
-        # platlib_path = sysconfig.get_paths()['platlib']
-
-        # # Normalize paths for comparison
-        # module_origin = os.path.normcase(module_spec.origin)
-        # std_lib_path = os.path.normcase(std_lib_path)
-        # purelib_path = os.path.normcase(purelib_path)
-        # platlib_path = os.path.normcase(platlib_path)
-
-        # # Check if the module's origin is within any of the standard library paths
-        # return (module_origin.startswith(std_lib_path) or 
-        #         module_origin.startswith(purelib_path) or 
-        #         module_origin.startswith(platlib_path))
+        return self.stdlib.is_stdlib(module_name, python_version)
 
     # Check to see if a package is on pypi
     # If it is then it's something we can install
-    def is_package_on_pypi(self, package_name):
-        pypi_url = f"https://pypi.org/pypi/{package_name}/json"
+    def is_package_on_pypi(self, package_name, python_version=None):
+        if self.names.available():
+            if not package_name in self.names:
+                return False
+            return not self.is_module_in_standard_library(package_name, python_version)
+
+        pypi_url = f"{PYPI_URL}/pypi/{package_name}/json"
 
         try:
-            response = requests.get(pypi_url)
+            response = self.session.get(pypi_url)
             response.raise_for_status()  # Raise an HTTPError for bad responses (e.g., 404 Not Found)
             # If the module is on pypi then we know we can import it
             # We then check if it's standard library
-            if self.is_module_in_standard_library(package_name):
+            if self.is_module_in_standard_library(package_name, python_version):
                 return False
             else:
                 return True
@@ -81,10 +69,10 @@ class DepsScraper():
         python_files = []
         for root, dirs, files in os.walk(folder_path):
             for dir in dirs:
-                print(dir)
+                if self.logging: print(dir)
                 project_dirs.append(dir)
             for file_name in files:
-                print(file_name)
+                if self.logging: print(file_name)
                 file_path = os.path.join(root, file_name)
                 
                 file = file_path.split('/')[-1:][0]
@@ -123,9 +111,10 @@ class DepsScraper():
     """
         Cleans the dependency list. Removes dot notation and Uppercase modules
         dep_list: List of dependencies to clean
+        python_version: the Python we're building for, the host's if None
         return: returns the clean set of modules
     """
-    def clean_deps(self, dep_list):
+    def clean_deps(self, dep_list, python_version=None):
         imports = []
         for dep in dep_list:
             # import_name = self.dot_notation(dep, [])
@@ -135,51 +124,109 @@ class DepsScraper():
                 elif dep[0].isdigit():
                     pass
                 else:
-                    if not self.is_module_in_standard_library(dep):
+                    if not self.is_module_in_standard_library(dep, python_version):
                         imports = self.append_to_list(imports, dep)
         return imports
 
-    # Looks for specific words in an file
+    # Finds the modules a file imports
     # file_path: path to the file we're crawling
-    # target_word: the word we're looking for in the file
+    # target_word: kept for older callers, only 'import' statements are looked at
+    # folders: local package folders, imports from these are skipped
+    # Returns the dotted module names in the order they first appear, relative imports are left out
     def find_word_in_file(self, file_path, target_word, folders):
         imports = []
-        block_quote = False
         try:
-            with open(file_path, 'r') as file:
-                for line_number, line in enumerate(file, start=1):
-                    block_quote = self.block_quote(block_quote, line)
-                    if not block_quote:
-                        if target_word in line:
-                            if self.logging: print(f'Found "{target_word}" in {file_path} at line {line_number}:')
-                            # if self.logging: print(line.strip())  # Print the entire line
-                            if not '#' in line:
-                                stripped = line.strip().split(' ')
-                                for i in range(0, len(stripped)):
-                                    if i == 0 and stripped[i] == 'import':
-                                        # if self.logging: print(f"A: {stripped}")
-                                        # # if stripped[i+1] == '': print(f"BAD_WORD: {file_path}")
-                                        # import_name = self.dot_notation(stripped[i+1], folders)
-                                        # if import_name:
-                                        #     if 'models' in stripped:
-                                        #         print(stripped)
-                                        #         print('woof')
-                                        imports = self.append_to_list(imports, stripped[i+1])
-                                    elif i > 0 and stripped[i] == 'import':
-                                        if self.logging: print(f"B: {stripped}")
-                                        # if stripped[i-1] == '': print(f"BAD_WORD: {file_path}")
-                                        # import_name = self.dot_notation(stripped[i-1], folders)
-                                        # if import_name:
-                                        #     if 'models' in stripped:
-                                        #         print(stripped)
-                                        #         print('meow')
-                                        #     if import_name.istitle():
-                                        #         pass
-                                        #     else:
-                                        imports = self.append_to_list(imports, stripped[i-1])
-
+            file_path, found, parser = extract_file(file_path)
+            if self.logging: print(f"Found {len(found)} imports in {file_path} using {parser}")
+            for details in found:
+                if details['level'] > 0 or not details['module']: continue
+                if details['top'] in folders: continue
+                imports = self.append_to_list(imports, details['module'])
         except FileNotFoundError:
             print(f"File not found: {file_path}")
         except Exception as e:
             print(f"An error occurred: {e}")
         return imports
+
+    # The Python files in a project and the names its own modules can be imported as
+    # Every .py file and every folder holding Python code counts as local, whatever
+    # the sys.path the project runs with. Virtualenvs, VCS and build folders are skipped.
+    def project_files(self, folder_path):
+        python_files = []
+        local_names = set()
+        for root, dirs, files in os.walk(folder_path):
+            dirs[:] = [dir for dir in dirs if dir not in SKIP_DIRS and not dir.endswith('.egg-info')]
+            sources = [file_name for file_name in files if file_name.endswith('.py')]
+            if sources and os.path.abspath(root) != os.path.abspath(folder_path):
+                local_names.add(os.path.basename(root))
+            for file_name in sources:
+                python_files.append(os.path.join(root, file_name))
+                local_names.add(file_name[:-3])
+        return python_files, local_names
+
+    # Finds the modules a whole project imports, with the files in parallel
+    # folder_path: project folder or repo checkout
+    # processes: worker processes, the CPU count if None
+    # Returns a dict with:
+    #   deps        dotted module names, each once, in the order of the files
+    #   provenance  module -> the files importing it
+    #   local       the project's own module names, left out of deps
+    #   files       how many Python files were scanned
+    def scan_project(self, folder_path, processes=None):
+        python_files, local_names = self.project_files(folder_path)
+        python_files.sort()
+        if len(python_files) >= POOL_MIN_FILES and processes != 1:
+            results = extract_files(python_files, processes)
+        else:
+            results = {}
+            for file_path in python_files:
+                file_path, found, parser = extract_file(file_path)
+                results[file_path] = (found, parser)
+
+        deps = []
+        provenance = {}
+        for file_path in python_files:
+            found, parser = results[file_path]
+            for details in found:
+                if details['level'] > 0 or not details['module']: continue
+                if details['top'] in local_names: continue
+                if not details['module'] in provenance:
+                    deps.append(details['module'])
+                    provenance[details['module']] = []
+                if not file_path in provenance[details['module']]:
+                    provenance[details['module']].append(file_path)
+
+        if self.logging: print(f"Found {len(deps)} modules in {len(python_files)} files, {len(local_names)} local names skipped")
+        return {'deps': deps, 'provenance': provenance, 'local': sorted(local_names), 'files': len(python_files)}
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Scan a project for the modules it imports')
+    parser.add_argument('-d', '--dir', type=str, help="Project folder or repo checkout to scan")
+    parser.add_argument('-p', '--processes', type=int, nargs="?", default=None, help="Worker processes, defaults to the CPU count")
+    parser.add_argument('-b', '--benchmark', action="store_true", help="Time the scan against calling find_word_in_file on every file")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    scraper = DepsScraper()
+    start = time.perf_counter()
+    project = scraper.scan_project(args.dir, args.processes)
+    scanned = time.perf_counter() - start
+    for module in project['deps']:
+        print(f"{module}: {len(project['provenance'][module])} files")
+    print(f"{len(project['deps'])} modules from {project['files']} files in {scanned:.2f}s")
+
+    if args.benchmark:
+        python_files, local_names = scraper.project_files(args.dir)
+        start = time.perf_counter()
+        deps = []
+        for file_path in python_files:
+            for module in scraper.find_word_in_file(file_path, 'import', list(local_names)):
+                deps = scraper.append_to_list(deps, module)
+        serial = time.perf_counter() - start
+        print(f"File by file: {serial:.2f}s, {len(deps)} modules ({project['files'] / serial:.0f} files/s)")
+        print(f"Project scan: {scanned:.2f}s ({project['files'] / scanned:.0f} files/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# Reads the module, version and offered versions straight out of pip and Docker errors
+# pip formats its errors precisely, e.g.
+#   Could not find a version that satisfies the requirement X==Y (from versions: ...)
+#   No matching distribution found for X
+#   The command 'pip install ... X==Y' returned a non-zero code: 1
+# so a table of compiled patterns answers most "which module failed" questions
+# the error handlers used to ask the LLM. The first rule that matches wins. Its
+# module is only used as is when the rule is confident enough, the rest are
+# passed to the LLM as a hint. Colons are optional in the patterns as the
+# output_data_<ver>.yml logs have them stripped.
+import argparse
+import os
+import re
+
+from helpers.system_packages import read_iterations
+
+# A pip requirement name, and the extras that can follow it
+NAME = r"[A-Za-z0-9][A-Za-z0-9._-]*"
+EXTRAS = r"(?:\[[^\]]*\])?"
+
+# Rules below this confidence are only a hint for the LLM
+MIN_CONFIDENCE = 0.8
+
+# The imports in a traceback's source lines, to tell a package from one of its submodules
+IMPORT = re.compile(r"^\s*(?:from\s+([A-Za-z_][\w.]*)\s+import|import\s+([A-Za-z_][\w.]*))", re.MULTILINE)
+
+# name: the rule, reported with the result
+# error_type: what process_error would call the error
+# pattern: groups are named module, version and versions
+# confidence: how often the rule's module is the one to change, roughly
+# import_name: the module is an import name, which Python 2 gives without its package
+RULES = [
+    {'name': 'could_not_find', 'error_type': 'VersionNotFound', 'confidence': 0.95,
+     'pattern': rf"Could not find a version that satisfies the requirement (?P<module>{NAME}){EXTRAS}\s*(?:==\s*(?P<version>[^\s(]+))?[^(\n]*\(from versions:?\s*(?P<versions>[^)]*)\)"},
+    {'name': 'no_matching_distribution', 'error_type': 'VersionNotFound', 'confidence': 0.9,
+     'pattern': rf"No matching distribution found for (?P<module>{NAME}){EXTRAS}(?:\s*==\s*(?P<version>[^\s\\\"']+))?"},
+    {'name': 'invalid_requirement', 'error_type': 'InvalidVersion', 'confidence': 0.7,
+     'pattern': rf"Invalid requirement:?\s*'(?P<module>{NAME}){EXTRAS}(?:\s*==\s*(?P<version>[^']*))?'"},
+    {'name': 'conflict_requires', 'error_type': 'DependencyConflict', 'confidence': 0.7,
+     'pattern': rf"requires (?P<module>{NAME}){EXTRAS}[^,\n]*, but you have {NAME} (?P<version>\S+) which is incompatible"},
+    {'name': 'conflict_cannot_install', 'error_type': 'DependencyConflict', 'confidence': 0.6,
+     'pattern': rf"Cannot install (?P<module>{NAME}){EXTRAS}\s*==\s*(?P<version>[^\s,]+)"},
+    {'name': 'build_wheel', 'error_type': 'NonZeroCode', 'confidence': 0.85,
+     'pattern': rf"(?:Failed building wheel for|Could not build wheels for|Failed to build) (?P<module>{NAME})"},
+    {'name': 'non_zero_pip', 'error_type': 'NonZeroCode', 'confidence': 0.85,
+     'pattern': rf"The command '[^']*pip\"?,?\s*\"?install[^']*?[\s\"](?P<module>{NAME}){EXTRAS}\s*==\s*(?P<version>[^\s'\"]+)\"?\]?' returned a non-zero code"},
+    {'name': 'no_module_named', 'import_name': True, 'error_type': 'ModuleNotFound', 'confidence': 0.9,
+     'pattern': r"No module named:?\s*'?(?P<module>[A-Za-z_]\w*)"},
+    {'name': 'cannot_import_name', 'import_name': True, 'error_type': 'ImportError', 'confidence': 0.8,
+     'pattern': r"cannot import name:?\s*'?\w+'?\s+from\s+'?(?P<module>[A-Za-z_]\w*)"},
+    {'name': 'module_attribute', 'import_name': True, 'error_type': 'AttributeError', 'confidence': 0.75,
+     'pattern': r"AttributeError:?\s*module:?\s*'(?P<module>[A-Za-z_]\w*)[\w.]*' has no attribute"},
+    {'name': 'site_packages_syntax', 'error_type': 'SyntaxError', 'confidence': 0.8,
+     'pattern': r"site-packages/(?P<module>[A-Za-z_]\w*)[^\n]*\n(?:[^\n]*\n){0,3}?\s*SyntaxError"},
+]
+
+class ErrorRules:
+
+    def __init__(self, rules=RULES, logging=False) -> None:
+        self.logging = logging
+        self.rules = [dict(rule, compiled=re.compile(rule['pattern'], re.IGNORECASE)) for rule in rules]
+        self.stats = {'matched': 0, 'unmatched': 0}
+
+    # The first rule that matches, as a dict with:
+    #   error_type  what process_error would call it
+    #   module      the pip name, or the top level import name for the run time errors
+    #   version     the failing version, None if the log doesn't say
+    #   versions    the versions pip offered, oldest to newest, None if it didn't list them
+    #   rule        the rule's name
+    #   confidence  the rule's confidence
+    #   package     the top level import when the module is only a submodule of it, e.g. 'django' for
+    #               Python 2's "No module named simple" from 'from django.test.simple import ...', else None
+    # None when no rule matches
+    # error_types: only try rules for these error types
+    def match(self, message, error_types=None):
+        for rule in self.rules:
+            if error_types and rule['error_type'] not in error_types: continue
+            found = rule['compiled'].search(message)
+            if not found: continue
+            groups = found.groupdict()
+            versions = groups.get('versions')
+            if versions is not None:
+                versions = [version.strip() for version in versions.split(',') if version.strip() and version.strip() not in ('none', '...')]
+            result = {
+                'error_type': rule['error_type'],
+                'module': groups['module'],
+                'version': groups.get('version') or None,
+                'versions': versions,
+                'rule': rule['name'],
+                'confidence': rule['confidence'],
+                'package': self.package_of(groups['module'], message) if rule.get('import_name') else None,
+            }
+            self.stats['matched'] += 1
+            if self.logging: print(f"Rule {rule['name']} matched {result['module']}=={result['version']}")
+            return result
+        self.stats['unmatched'] += 1
+        return None
+
+    # The top level package of the import the module is a submodule of, None if it isn't one
+    def package_of(self, module, message):
+        for found in IMPORT.finditer(message):
+            parts = (found.group(1) or found.group(2)).split('.')
+            if module in parts[1:]: return parts[0]
+        return None
+
+    # Whether the module can be used without asking the LLM
+    def trusted(self, result):
+        return result['confidence'] >= MIN_CONFIDENCE and result['package'] is None
+
+    def hit_rate(self):
+        total = self.stats['matched'] + self.stats['unmatched']
+        return self.stats['matched'] / total if total else 0.0
+
+    def report(self):
+        return f"Error rules: {self.stats['matched']} matched, {self.stats['unmatched']} left to the LLM ({self.hit_rate():.0%} hit rate)"
+
+# How often the rules answer the failed iterations in a results corpus
+# consistent: the module the rule found is one the iteration had pinned, a sanity check for build errors
+def corpus_report(rules, root):
+    totals = {}
+    for folder, dirs, files in os.walk(root):
+        for run in read_iterations(folder):
+            for python_modules, error_type, error in run:
+                error_type = error_type.strip()
+                if error_type in ('None', ''): continue
+                counts = totals.setdefault(error_type, {'errors': 0, 'matched': 0, 'consistent': 0, 'rules': {}})
+                counts['errors'] += 1
+                result = rules.match(error)
+                if not result: continue
+                counts['matched'] += 1
+                counts['rules'][result['rule']] = counts['rules'].get(result['rule'], 0) + 1
+                pinned = [name.lower().replace('_', '-') for name in re.findall(r"'([^']+)':", python_modules)]
+                if result['module'].lower().replace('_', '-') in pinned: counts['consistent'] += 1
+    return totals
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Pull the failing module out of pip and Docker errors without the LLM')
+    parser.add_argument('-e', '--error', type=str, help="File with a build or run log to match")
+    parser.add_argument('-d', '--dir', type=str, help="Results folder to report the hit rate on")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    rules = ErrorRules()
+    if args.error:
+        with open(args.error, 'r', errors='replace') as f:
+            print(rules.match(f.read()))
+    if args.dir:
+        totals = corpus_report(rules, args.dir)
+        errors = sum(counts['errors'] for counts in totals.values())
+        matched = sum(counts['matched'] for counts in totals.values())
+        for error_type, counts in sorted(totals.items(), key=lambda item: -item[1]['errors']):
+            rules_used = ', '.join(f"{name} {count}" for name, count in sorted(counts['rules'].items(), key=lambda item: -item[1]))
+            print(f"{error_type}: {counts['matched']}/{counts['errors']} matched, {counts['consistent']} on a pinned module ({rules_used})")
+        print(f"Overall: {matched}/{errors} failed iterations answered without the LLM ({matched / errors if errors else 0.0:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# Finds the imports in Python source
+# Uses the ast when the host can parse the file, and falls back to the tokenizer
+# for Python 2 sources (print statements, 'except X, e', ...) that it can't.
+# Every import comes back as a dict:
+#   module       dotted module name, '' for 'from . import x'
+#   top          first part of the module name, what we install
+#   names        the names taken with 'from x import ...'
+#   level        number of leading dots on a relative import
+#   line         (first line, last line) of the statement
+#   guarded      inside a try that handles the ImportError
+#   conditional  inside an if, except, def, class, with or loop rather than at module level
+#   dynamic      a literal __import__('x') or importlib.import_module('x')
+import argparse
+import ast
+import io
+import multiprocessing as mp
+import os
+import time
+import tokenize
+
+# Handlers that mean the import is allowed to fail
+IMPORT_ERRORS = {'ImportError', 'ModuleNotFoundError', 'Exception', 'BaseException'}
+
+# Blocks that make an import conditional
+CONDITIONAL_NODES = (ast.If, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.With, ast.AsyncWith, ast.For, ast.AsyncFor, ast.While)
+CONDITIONAL_KEYWORDS = {'if', 'elif', 'else', 'except', 'def', 'class', 'with', 'for', 'while', 'async'}
+BLOCK_KEYWORDS = CONDITIONAL_KEYWORDS | {'try', 'finally'}
+
+def make_import(module, line, level=0, names=(), guarded=False, conditional=False, dynamic=False):
+    return {
+        'module': module,
+        'top': module.split('.')[0],
+        'names': list(names),
+        'level': level,
+        'line': line,
+        'guarded': guarded,
+        'conditional': conditional,
+        'dynamic': dynamic,
+    }
+
+# True if one of the try's handlers catches ImportError
+def handles_import_error(node):
+    for handler in node.handlers:
+        if handler.type is None: return True
+        types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+        for handler_type in types:
+            name = handler_type.attr if isinstance(handler_type, ast.Attribute) else getattr(handler_type, 'id', None)
+            if name in IMPORT_ERRORS: return True
+    return False
+
+# Module name of a literal __import__('x') / importlib.import_module('x') call, None otherwise
+def dynamic_import(node):
+    func = node.func
+    name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+    if name not in ('__import__', 'import_module') or not node.args: return None
+    arg = node.args[0]
+    if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and arg.value and not arg.value.startswith('.'):
+        return arg.value
+    return None
+
+class ImportVisitor(ast.NodeVisitor):
+
+    def __init__(self) -> None:
+        self.imports = []
+        self.guarded = 0
+        self.conditional = 0
+
+    def span(self, node):
+        return (node.lineno, getattr(node, 'end_lineno', node.lineno))
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append(make_import(alias.name, self.span(node), guarded=self.guarded > 0, conditional=self.conditional > 0))
+
+    def visit_ImportFrom(self, node):
+        names = [alias.name for alias in node.names]
+        self.imports.append(make_import(node.module or '', self.span(node), node.level, names, self.guarded > 0, self.conditional > 0))
+
+    def visit_Call(self, node):
+        module = dynamic_import(node)
+        if module:
+            self.imports.append(make_import(module, self.span(node), guarded=self.guarded > 0, conditional=self.conditional > 0, dynamic=True))
+        self.generic_visit(node)
+
+    # Only the try body is guarded, the handlers and else/finally aren't
+    def visit_Try(self, node):
+        guarded = handles_import_error(node)
+        self.guarded += guarded
+        for child in node.body:
+            self.visit(child)
+        self.guarded -= guarded
+        # Handlers only run when something failed
+        self.conditional += 1
+        for child in node.handlers:
+            self.visit(child)
+        self.conditional -= 1
+        for child in node.orelse + node.finalbody:
+            self.visit(child)
+
+    visit_TryStar = visit_Try
+
+    def generic_visit(self, node):
+        conditional = isinstance(node, CONDITIONAL_NODES)
+        self.conditional += conditional
+        super().generic_visit(node)
+        self.conditional -= conditional
+
+def extract_with_ast(source, filename='<snippet>'):
+    visitor = ImportVisitor()
+    visitor.visit(ast.parse(source, filename))
+    return visitor.imports
+
+# Tokenizer based extraction for sources the host can't parse (mostly Python 2)
+# Works a logical line at a time, so it copes with the syntax ast rejects
+# Without the handlers we can't tell what a try catches, any try counts as guarded
+def extract_with_tokens(source):
+    imports = []
+    blocks = []          # kind of each open indented block
+    pending = None       # kind of the block the current line opens
+    line = []
+
+    def finish(tokens):
+        nonlocal pending
+        words = [token for token in tokens if token.type not in (tokenize.COMMENT, tokenize.NL)]
+        if not words: return
+        strings = [token.string for token in words]
+        guarded = 'try' in blocks
+        conditional = any(kind in CONDITIONAL_KEYWORDS for kind in blocks)
+        # Opens a block, anything after the ':' is a one line body ('if x: import y')
+        if strings[0] in BLOCK_KEYWORDS and ':' in strings:
+            pending = strings[0]
+            guarded = guarded or pending == 'try'
+            conditional = conditional or pending in CONDITIONAL_KEYWORDS
+            words = words[strings.index(':') + 1:]
+        imports.extend(parse_statement(words, guarded, conditional))
+
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.INDENT:
+                blocks.append(pending)
+                pending = None
+            elif token.type == tokenize.DEDENT:
+                if blocks: blocks.pop()
+            elif token.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                finish(line)
+                line = []
+            else:
+                line.append(token)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        finish(line)
+    return imports
+
+# Imports in one logical line of tokens
+def parse_statement(words, guarded, conditional):
+    strings = [token.string for token in words]
+    imports = []
+    for statement in split_statements(words):
+        if not statement: continue
+        keyword = statement[0].string
+        span = (statement[0].start[0], statement[-1].end[0])
+        if keyword == 'import':
+            for module in dotted_names(statement[1:]):
+                imports.append(make_import(module, span, guarded=guarded, conditional=conditional))
+        elif keyword == 'from' and 'import' in [token.string for token in statement]:
+            split = [token.string for token in statement].index('import')
+            source = ''.join(token.string for token in statement[1:split])
+            level = len(source) - len(source.lstrip('.'))
+            imports.append(make_import(source.lstrip('.'), span, level, dotted_names(statement[split + 1:]), guarded, conditional))
+
+    # Literal __import__('x') / import_module('x') calls anywhere on the line
+    for idx in range(len(strings) - 2):
+        if strings[idx] in ('__import__', 'import_module') and strings[idx + 1] == '(' and words[idx + 2].type == tokenize.STRING:
+            try:
+                module = ast.literal_eval(words[idx + 2].string)
+            except (ValueError, SyntaxError):
+                continue
+            if isinstance(module, str) and module and not module.startswith('.'):
+                imports.append(make_import(module, (words[idx].start[0], words[idx + 2].end[0]), guarded=guarded, conditional=conditional, dynamic=True))
+    return imports
+
+# Splits 'import a; import b' into statements
+def split_statements(words):
+    statements = [[]]
+    for token in words:
+        if token.string == ';':
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    return statements
+
+# 'a.b as c, d' -> ['a.b', 'd']
+def dotted_names(tokens):
+    names = []
+    current = ''
+    skip = False
+    for token in tokens:
+        if token.string in ('(', ')'): continue
+        if token.string == ',':
+            if current: names.append(current)
+            current, skip = '', False
+        elif token.string == 'as':
+            skip = True
+        elif not skip and (token.type == tokenize.NAME or token.string in ('.', '*')):
+            current += token.string
+    if current: names.append(current)
+    return names
+
+# Imports in a source string, and which parser found them ('ast' or 'tokenize')
+def extract_imports(source, filename='<snippet>'):
+    try:
+        return extract_with_ast(source, filename), 'ast'
+    except (SyntaxError, ValueError):
+        return extract_with_tokens(source), 'tokenize'
+
+def read_source(file_path):
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def extract_file(file_path):
+    imports, parser = extract_imports(read_source(file_path), file_path)
+    return file_path, imports, parser
+
+# Extracts every file on a process pool, returns {path: (imports, parser)}
+def extract_files(file_paths, processes=None, chunksize=16):
+    results = {}
+    with mp.Pool(processes=processes) as pool:
+        for file_path, imports, parser in pool.imap_unordered(extract_file, file_paths, chunksize=chunksize):
+            results[file_path] = (imports, parser)
+    return results
+
+def python_files(folder):
+    for root, dirs, files in os.walk(folder):
+        for file_name in files:
+            if file_name.endswith('.py'):
+                yield os.path.join(root, file_name)
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Extract imports from Python files')
+    parser.add_argument('-f', '--file', type=str, help="A single file to print the imports of")
+    parser.add_argument('-d', '--dir', type=str, help="A corpus folder to benchmark the batch mode on")
+    parser.add_argument('-p', '--processes', type=int, nargs="?", default=None, help="Worker processes, defaults to the CPU count")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    if args.file:
+        file_path, imports, parser = extract_file(args.file)
+        print(f"Parsed with {parser}")
+        for found in imports:
+            print(found)
+
+    if args.dir:
+        file_paths = list(python_files(args.dir))
+        start = time.perf_counter()
+        for file_path in file_paths:
+            extract_file(file_path)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = extract_files(file_paths, args.processes)
+        pooled = time.perf_counter() - start
+
+        fallbacks = sum(1 for imports, parser in results.values() if parser == 'tokenize')
+        total = sum(len(imports) for imports, parser in results.values())
+        print(f"{len(file_paths)} files, {total} imports, {fallbacks} needed the tokenizer fallback")
+        print(f"Serial: {serial:.2f}s ({len(file_paths) / serial:.0f} files/s)")
+        print(f"Pool: {pooled:.2f}s ({len(file_paths) / pooled:.0f} files/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# Persistent cache for LLM responses
+# The same prompt is often asked again, by a sibling process working on another
+# Python version or by a batch that's re-run after a crash. Parsed responses are
+# kept in a SQLite file shared by every process, keyed by the model, temperature,
+# rendered prompt and output schema, and the least recently used ones are
+# evicted once the file holds more than max_entries.
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from helpers.pypi_cache import CACHE_DIR, FLUSH_EVERY, open_caches
+
+LLM_CACHE_FILE = f"{CACHE_DIR}/llm_responses.sqlite"
+
+# off     never cache
+# temp0   only cache models run at temperature 0, where the answer wouldn't change anyway
+# always  cache at any temperature, retries still go to the model
+POLICIES = ('off', 'temp0', 'always')
+
+class LLMCache:
+
+    def __init__(self, cache_file=LLM_CACHE_FILE, policy='temp0', max_entries=50000, logging=False) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown LLM cache policy {policy}, expected one of {', '.join(POLICIES)}")
+        self.logging = logging
+        self.cache_file = cache_file
+        self.policy = policy
+        self.max_entries = max_entries
+        # Counters for this process, the persistent totals live in the stats table
+        self.counters = {'hit': 0, 'miss': 0, 'refresh': 0}
+        # Seconds the model took for the responses we served from the cache
+        self.saved = 0.0
+        # Counts and last use times not yet in the file, written in one go so a hit never takes the write lock
+        self.unflushed = {}
+        self.touched = {}
+        self.lock = threading.Lock()
+        if self.policy != 'off':
+            open_caches.append(self)
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            self.create_tables()
+
+    # Opens a new connection for every operation, like PyPICache
+    def connect(self):
+        return sqlite3.connect(self.cache_file, timeout=60)
+
+    def create_tables(self):
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, elapsed REAL, created_at REAL, used_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value REAL)')
+
+    # Whether responses of a model run at this temperature are cached
+    def enabled(self, temperature):
+        if self.policy == 'off': return False
+        if self.policy == 'temp0': return float(temperature) == 0.0
+        return True
+
+    # schema: anything that changes how the response is parsed, e.g. the pydantic model's name
+    def key(self, model, temperature, prompt, schema):
+        text = json.dumps([model, float(temperature), prompt, schema])
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    # Bumps a counter locally, the shared stats table catches up on flush()
+    def count(self, name, value=1):
+        with self.lock:
+            self.unflushed[name] = self.unflushed.get(name, 0) + value
+            pending = self.unflushed.get('hit', 0) + self.unflushed.get('miss', 0)
+        if pending >= FLUSH_EVERY: self.flush()
+
+    # Writes the pending counts and last use times in one transaction, at the end of a run
+    def flush(self):
+        with self.lock:
+            counts, self.unflushed = self.unflushed, {}
+            touched, self.touched = self.touched, {}
+        if not counts and not touched: return
+        try:
+            with self.connect() as conn:
+                conn.executemany('UPDATE responses SET used_at = ? WHERE key = ?', [(used_at, key) for key, used_at in touched.items()])
+                conn.executemany('INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?', [(name, value, value) for name, value in counts.items()])
+        except sqlite3.Error as e:
+            if self.logging: print(f"Unable to update LLM cache stats: {e}")
+
+    # The parsed response for a key, None if it isn't cached
+    # Only reads the file, the last use time for the LRU is kept until flush()
+    def get(self, key):
+        with self.connect() as conn:
+            row = conn.execute('SELECT response, elapsed FROM responses WHERE key = ?', (key,)).fetchone()
+        if not row:
+            with self.lock:
+                self.counters['miss'] += 1
+            self.count('miss')
+            return None
+        with self.lock:
+            self.counters['hit'] += 1
+            self.saved += row[1]
+            self.touched[key] = time.time()
+        self.count('hit')
+        self.count('saved_seconds', row[1])
+        return json.loads(row[0])
+
+    # elapsed: how long the model took, reported as time saved when the response is served again
+    def put(self, key, model, response, elapsed):
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO responses (key, model, response, elapsed, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)', (key, model, json.dumps(response), elapsed, now, now))
+            # Least recently used first out
+            conn.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    # Calls the model through call() unless the response is cached
+    # refresh: skip the lookup and replace the cached response, used by retries that want a new answer
+    def fetch(self, model, temperature, prompt, schema, call, refresh=False):
+        if not self.enabled(temperature):
+            return call()
+        key = self.key(model, temperature, prompt, schema)
+        if refresh:
+            with self.lock:
+                self.counters['refresh'] += 1
+        else:
+            response = self.get(key)
+            if response is not None:
+                if self.logging: print(f"LLM response served from the cache")
+                return response
+        start = time.perf_counter()
+        response = call()
+        # Nothing worth keeping, the caller will ask again
+        if response:
+            self.put(key, model, response, time.perf_counter() - start)
+        return response
+
+    def report(self):
+        return f"LLM cache ({self.policy}): {self.counters['hit']} hits, {self.counters['miss']} misses, {self.counters['refresh']} refreshed, {self.saved:.1f}s of model time saved"
+
+    def stats(self):
+        self.flush()
+        with self.connect() as conn:
+            return {name: value for name, value in conn.execute('SELECT name, value FROM stats')}
+
+    def clear(self):
+        with self.lock:
+            self.unflushed, self.touched = {}, {}
+        with self.connect() as conn:
+            conn.execute('DELETE FROM responses')
+            conn.execute('DELETE FROM stats')
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Inspect the shared LLM response cache')
+    parser.add_argument('-c', '--cache', type=str, nargs="?", default=LLM_CACHE_FILE, const=LLM_CACHE_FILE, help=f"Path to the cache file, defaults to {LLM_CACHE_FILE}")
+    parser.add_argument('--clear', action="store_true", help="Remove all cached responses and counters")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    cache = LLMCache(cache_file=args.cache, policy='always')
+    if args.clear:
+        cache.clear()
+        print('Cache cleared')
+        return
+
+    stats = cache.stats()
+    with cache.connect() as conn:
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM responses').fetchone()
+        models = conn.execute('SELECT model, COUNT(*) FROM responses GROUP BY model ORDER BY COUNT(*) DESC').fetchall()
+    print(f"Entries: {entries} ({size / 1024 / 1024:.1f} MB)")
+    for model, count in models:
+        print(f"  {model}: {count}")
+    hits, misses = stats.get('hit', 0), stats.get('miss', 0)
+    print(f"hit: {int(hits)}")
+    print(f"miss: {int(misses)}")
+    print(f"Hit rate: {hits / (hits + misses) if hits + misses else 0.0:.1%}")
+    print(f"Model time saved: {stats.get('saved_seconds', 0.0):.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Cuts Docker build and run logs down to the part an error prompt needs
+# The raw build output is a stream of {"stream": ...} JSON objects full of ANSI
+# escapes, download progress and pip chatter, and prompt processing time on a
+# CPU bound Ollama grows with every token of it. The compacted log keeps the
+# failing command, the ERROR lines and the tail of the last traceback, shortens
+# long version lists, and is held to a token budget.
+import argparse
+import json
+import os
+import re
+import time
+
+from helpers.system_packages import read_iterations
+
+# Rough tokens for a budget, most tokenizers average about four characters of log per token
+CHARS_PER_TOKEN = 4
+
+# Budget for the error passed into the handler prompts
+MAX_TOKENS = 800
+
+# Lines of the last traceback that are kept, the bottom is where the error is
+TRACEBACK_LINES = 25
+
+# Versions kept from the start and end of a '(from versions: ...)' list
+HEAD_VERSIONS = 3
+TAIL_VERSIONS = 20
+
+ANSI = re.compile(r'(?:\x1b|\\u001b|␛)\[[0-9;]*[A-Za-z]')
+
+# Lines that never say why a build failed
+NOISE = re.compile(r'^\s*(?:'
+                   r'Collecting |Downloading |Using cached |Requirement already satisfied|Installing collected packages|'
+                   r'Building wheels? for |Created wheel for |Stored in directory|Successfully (?:installed|built|uninstalled|tagged)|'
+                   r'Attempting uninstall|Found existing installation|Uninstalling |Running setup\.py (?:install|bdist_wheel) for|'
+                   r'Preparing metadata|Getting requirements to build|Installing build dependencies|Obtaining |'
+                   r'Step \d+/\d+|---> |Removing intermediate container|Sending build context|'
+                   r'\[notice\]|WARNING: Running pip as the .root. user|WARNING: You are using pip version|You should consider upgrading|'
+                   r'[\s|#=>\-━█░▏▎▍▌▋▊▉]*\d+(?:\.\d+)?\s*%|.*\d+/\d+ \[[=>.\s]*\]|.*(?:ETA|\dus/step)'
+                   r')')
+
+# Lines that say why it failed, kept wherever they are
+IMPORTANT = re.compile(r'ERROR|Error:|error:|Exception|returned a non-zero code|No module named|cannot import name|'
+                       r'No matching distribution|Could not find a version|conflict|requires|fatal error|not found', re.IGNORECASE)
+
+VERSION_LIST = re.compile(r'\(from versions:?\s*([^)]*)\)')
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+# The text of a Docker build stream, or the log itself when it isn't one
+# Each JSON object gives its stream, status or error text, anything else is kept as it is
+def decode_stream(raw):
+    if '{"' not in raw: return raw
+    decoder = json.JSONDecoder(strict=False)
+    parts = []
+    position = 0
+    while position < len(raw):
+        start = raw.find('{', position)
+        if start < 0:
+            parts.append(raw[position:])
+            break
+        parts.append(raw[position:start])
+        try:
+            found, end = decoder.raw_decode(raw, start)
+        except ValueError:
+            parts.append(raw[start])
+            position = start + 1
+            continue
+        if isinstance(found, dict):
+            detail = found.get('errorDetail')
+            error = detail.get('message') if isinstance(detail, dict) else None
+            parts.append(found.get('stream') or found.get('status') or '')
+            if error or found.get('error'): parts.append(f"\n{error or found['error']}\n")
+        position = end
+    return ''.join(parts)
+
+# Keeps the first and last few versions of a long '(from versions: ...)' list
+def shorten_versions(line):
+    def shorten(found):
+        versions = [version.strip() for version in found.group(1).split(',')]
+        if len(versions) <= HEAD_VERSIONS + TAIL_VERSIONS + 1: return found.group(0)
+        kept = versions[:HEAD_VERSIONS] + ['...'] + versions[-TAIL_VERSIONS:]
+        return f"(from versions: {', '.join(kept)})"
+    return VERSION_LIST.sub(shorten, line)
+
+class LogCompactor:
+
+    # max_tokens: budget for a compacted log, None leaves logs as they are
+    def __init__(self, max_tokens=MAX_TOKENS, logging=False) -> None:
+        self.logging = logging
+        self.max_tokens = max_tokens
+        # error type -> {'logs', 'raw', 'compact', 'time'} with the token counts and seconds spent handling
+        self.stats = {}
+
+    # The lines worth sending, in their original order
+    def select(self, lines):
+        keep = set()
+        # The last traceback, from its header to the end of the log
+        tracebacks = [idx for idx, line in enumerate(lines) if line.lstrip().startswith('Traceback (most recent call last)')]
+        if tracebacks:
+            start = tracebacks[-1]
+            keep.update(range(max(start, len(lines) - TRACEBACK_LINES), len(lines)))
+            keep.add(start)
+        for idx, line in enumerate(lines):
+            if IMPORTANT.search(line): keep.add(idx)
+        # Nothing stood out, so the end of the log is the best guess
+        if not keep:
+            keep.update(range(max(0, len(lines) - TRACEBACK_LINES), len(lines)))
+        return [lines[idx] for idx in sorted(keep)]
+
+    def compact(self, raw):
+        if self.max_tokens is None or not raw: return raw
+        text = ANSI.sub('', decode_stream(raw)).replace('\\n', '\n').replace('\r', '\n')
+        lines = []
+        for line in text.split('\n'):
+            line = line.rstrip()
+            if not line.strip() or NOISE.match(line): continue
+            line = shorten_versions(line)
+            # The same message often comes twice, from the stream and the errorDetail
+            if lines and lines[-1] == line: continue
+            lines.append(line)
+        lines = self.select(lines)
+
+        # Over budget: drop lines from the top, the failing command and the end of the log matter most
+        budget = self.max_tokens * CHARS_PER_TOKEN
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > budget:
+            command = next((idx for idx, line in enumerate(lines) if 'returned a non-zero code' in line), None)
+            lines.pop(0 if command != 0 else 1)
+        compacted = '\n'.join(lines)
+        if len(compacted) > budget:
+            compacted = compacted[-budget:]
+        return compacted
+
+    # Token counts and handling time for one error, for the report
+    def record(self, error_type, raw, compacted, seconds):
+        stats = self.stats.setdefault(error_type, {'logs': 0, 'raw': 0, 'compact': 0, 'time': 0.0})
+        stats['logs'] += 1
+        stats['raw'] += estimate_tokens(raw)
+        stats['compact'] += estimate_tokens(compacted)
+        stats['time'] += seconds
+
+    def report(self):
+        lines = []
+        for error_type, stats in self.stats.items():
+            saved = 1 - stats['compact'] / stats['raw'] if stats['raw'] else 0.0
+            lines.append(f"{error_type}: {stats['logs']} logs, {stats['raw']} -> {stats['compact']} tokens ({saved:.0%} fewer), {stats['time'] / stats['logs']:.1f}s per error")
+        return 'Log compaction: ' + ('; '.join(lines) if lines else 'nothing compacted')
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Compact Docker logs for error prompts')
+    parser.add_argument('-e', '--error', type=str, help="File with a build or run log to compact")
+    parser.add_argument('-d', '--dir', type=str, help="Results folder to report the token reduction per error type on")
+    parser.add_argument('-t', '--tokens', type=int, nargs="?", default=MAX_TOKENS, const=MAX_TOKENS, help=f"Token budget, defaults to {MAX_TOKENS}")
+    parser.add_argument('-m', '--model', type=str, default=None, help="Also time the non-zero error prompt on raw and compacted logs with this Ollama model")
+    parser.add_argument('-b', '--base', type=str, nargs="?", default='http://localhost:11434', const='http://localhost:11434', help="The ollama URL when --model is given")
+    parser.add_argument('-n', '--samples', type=int, nargs="?", default=3, const=3, help="Logs per error type sent to the model with --model")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    compactor = LogCompactor(max_tokens=args.tokens)
+    if args.error:
+        with open(args.error, 'r', errors='replace') as f:
+            raw = f.read()
+        compacted = compactor.compact(raw)
+        print(compacted)
+        print(f"\n{estimate_tokens(raw)} -> {estimate_tokens(compacted)} tokens")
+
+    if args.dir:
+        llm = None
+        if args.model:
+            from helpers.ollama_helper_tester import OllamaHelper
+            llm = OllamaHelper(base_url=args.base, model=args.model, temp=0.0, llm_cache='off')
+        latency = {}
+        for folder, dirs, files in os.walk(args.dir):
+            for run in read_iterations(folder):
+                for python_modules, error_type, error in run:
+                    error_type = error_type.strip()
+                    if error_type in ('None', ''): continue
+                    start = time.perf_counter()
+                    compacted = compactor.compact(error)
+                    compactor.record(error_type, error, compacted, time.perf_counter() - start)
+                    timed = latency.setdefault(error_type, {'raw': [], 'compact': []})
+                    if llm is not None and len(timed['raw']) < args.samples:
+                        for label, text in (('raw', error), ('compact', compacted)):
+                            start = time.perf_counter()
+                            llm.non_zero_error(text)
+                            timed[label].append(time.perf_counter() - start)
+        for error_type, stats in sorted(compactor.stats.items(), key=lambda item: -item[1]['logs']):
+            saved = 1 - stats['compact'] / stats['raw'] if stats['raw'] else 0.0
+            line = f"{error_type}: {stats['logs']} logs, {stats['raw'] / stats['logs']:.0f} -> {stats['compact'] / stats['logs']:.0f} tokens on average ({saved:.0%} fewer), {stats['time'] / stats['logs'] * 1000:.2f} ms to compact"
+            timed = latency.get(error_type, {})
+            if timed.get('raw'):
+                line += f", prompt {sum(timed['raw']) / len(timed['raw']):.1f}s raw vs {sum(timed['compact']) / len(timed['compact']):.1f}s compacted"
+            print(line)
+
+if __name__ == "__main__":
+    main()
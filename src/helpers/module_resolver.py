@@ -0,0 +1,97 @@
+# Resolves import names to the distribution we pip install
+# module_link.json is compiled once per process into a prefix trie over the
+# dotted import path, so 'paho.mqtt.client' and 'Crypto.Cipher' resolve without
+# re-reading the file on every lookup.
+import argparse
+import json
+import time
+
+MODULE_LINK_FILE = './helpers/ref_files/module_link.json'
+
+# Marks the distribution stored on a trie node
+REF = '\0ref'
+
+# One resolver per process per file
+_resolvers = {}
+
+def get_resolver(link_file=MODULE_LINK_FILE):
+    if link_file not in _resolvers:
+        _resolvers[link_file] = ModuleResolver(link_file)
+    return _resolvers[link_file]
+
+class ModuleResolver:
+
+    def __init__(self, link_file=MODULE_LINK_FILE) -> None:
+        with open(link_file) as f:
+            known_modules = json.load(f)
+
+        self.trie = {}
+        # Lookups are case-insensitive, where two keys only differ by case the lowercase one wins
+        for name in sorted(known_modules, key=lambda name: name == name.lower()):
+            node = self.trie
+            for part in name.lower().split('.'):
+                node = node.setdefault(part, {})
+            node[REF] = known_modules[name]['ref']
+
+    # Strips the junk the scrapers and the LLM can leave around a name
+    def clean(self, module):
+        return module.strip().replace(';', '').replace(',', '')
+
+    # Resolves a (dotted) import to a distribution name
+    # Uses the longest known prefix, otherwise the lowercase top-level package
+    def resolve(self, module):
+        parts = self.clean(module).lower().split('.')
+        node = self.trie
+        ref = None
+        for part in parts:
+            node = node.get(part)
+            if node is None: break
+            ref = node.get(REF, ref)
+        return ref if ref else parts[0]
+
+    # True if the name (or a prefix of it) is in module_link.json
+    def is_known(self, module):
+        node = self.trie
+        for part in self.clean(module).lower().split('.'):
+            node = node.get(part)
+            if node is None: return False
+            if REF in node: return True
+        return False
+
+    def resolve_many(self, modules):
+        return [self.resolve(module) for module in modules]
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Benchmark the import name resolver')
+    parser.add_argument('-n', '--lookups', type=int, nargs="?", default=100000, const=100000, help="How many lookups to time")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    names = ['google.appengine.ext', 'Crypto.Cipher', 'paho.mqtt.client', 'PIL', 'cv2', 'requests', 'numpy.linalg', 'yaml']
+
+    start = time.perf_counter()
+    resolver = ModuleResolver()
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for idx in range(args.lookups):
+        resolver.resolve(names[idx % len(names)])
+    lookup_time = time.perf_counter() - start
+
+    # The old approach, re-reading the json for every call
+    start = time.perf_counter()
+    for idx in range(1000):
+        with open(MODULE_LINK_FILE) as f:
+            json.load(f)
+    reload_time = (time.perf_counter() - start) / 1000
+
+    print(f"Startup: {build_time * 1000:.2f} ms")
+    print(f"Per lookup: {lookup_time / args.lookups * 1e6:.2f} us")
+    print(f"Per json reload (previous behaviour): {reload_time * 1e6:.2f} us")
+    for name, ref in zip(names, resolver.resolve_many(names)):
+        print(f"{name} -> {ref}")
+
+if __name__ == "__main__":
+    main()
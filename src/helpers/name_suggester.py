@@ -0,0 +1,259 @@
+# Suggests the distribution for an import name pip couldn't find
+# Character trigrams of every PyPI project name (plus the module_link.json
+# aliases) are kept in an inverted index on disk, so 'skimage', 'cv2' or a
+# misspelt 'beautifulsoup' get ranked candidates without asking the LLM.
+#
+# Index layout, one memory mapped .npy per column:
+#   codes      sorted trigram codes
+#   starts     where each trigram's postings begin (len(codes) + 1)
+#   postings   entry ids containing the trigram
+# Entries 0..len(aliases)-1 are the aliases, the rest are the PyPI names in index order.
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+from packaging.utils import canonicalize_name
+
+from helpers.module_resolver import MODULE_LINK_FILE, get_resolver
+from helpers.package_index import PackageNameIndex
+from helpers.pypi_cache import CACHE_DIR
+
+TRIGRAM_DIR = f"{CACHE_DIR}/name_trigrams"
+COLUMNS = ('codes', 'starts', 'postings')
+
+# Trigrams in more names than this ('-py', 'py-', ...) say little, skip them when we can
+MAX_POSTINGS = 5000
+
+# The LLM is skipped when the best fuzzy match scores at least this
+MIN_SCORE = 0.6
+
+# An import that's only a PyPI project name, not a known alias, is as likely a local module
+# ('utils', 'config', 'common') as that project, so it's ranked but left to the LLM
+PYPI_NAME_SCORE = 0.5
+
+# Pulls the missing import out of a ModuleNotFoundError / ImportError message
+MISSING_MODULE = re.compile(r"No module named '?([A-Za-z_][\w.]*)'?")
+
+# How many candidates get the exact score
+CANDIDATES = 50
+
+# Trigrams of a name, padded so the first and last characters count
+def trigrams(name):
+    padded = b'$' + name + b'$'
+    return {padded[idx:idx + 3] for idx in range(len(padded) - 2)}
+
+class NameSuggester:
+
+    def __init__(self, names=None, link_file=MODULE_LINK_FILE, trigram_dir=TRIGRAM_DIR, logging=False) -> None:
+        self.logging = logging
+        self.names = names if names is not None else PackageNameIndex()
+        self.resolver = get_resolver(link_file)
+        self.trigram_dir = trigram_dir
+
+        with open(link_file) as f:
+            known_modules = json.load(f)
+        # Alias spelling -> distribution, for the fuzzy matches on import names
+        self.alias_keys = sorted({canonicalize_name(name) for name in known_modules})
+        refs = {}
+        for name in known_modules:
+            refs.setdefault(canonicalize_name(name), known_modules[name]['ref'])
+        self.alias_refs = [refs[key] for key in self.alias_keys]
+
+        # First candidate checks, the name we suggested for each import we haven't seen the result of
+        self.pending = {}
+        self.stats = {'suggested': 0, 'first_right': 0, 'first_wrong': 0, 'llm_fallback': 0}
+        self.load()
+
+    # What the trigram files were built from, they're rebuilt when this changes
+    def stamp(self):
+        stamp = {'aliases': len(self.alias_keys), 'names': len(self.names)}
+        if self.names.available():
+            stat = os.stat(self.names.index_file)
+            stamp.update({'size': stat.st_size, 'mtime': stat.st_mtime})
+        return stamp
+
+    def load(self):
+        stamp_file = f"{self.trigram_dir}/stamp.json"
+        current = False
+        if os.path.isfile(stamp_file):
+            with open(stamp_file) as f:
+                current = json.load(f) == self.stamp()
+        if not current:
+            self.build()
+        for column in COLUMNS:
+            setattr(self, column, np.load(f"{self.trigram_dir}/{column}.npy", mmap_mode='r'))
+
+    def entries(self):
+        yield from (key.encode('utf-8') for key in self.alias_keys)
+        if self.names.available():
+            for idx in range(len(self.names)):
+                yield bytes(self.names.name_at(idx))
+
+    # Builds the inverted index with numpy, every entry's trigrams at once
+    def build(self):
+        start = time.perf_counter()
+        entries = list(self.entries())
+        padded = [b'$' + entry + b'$' for entry in entries]
+        sizes = np.array([len(entry) for entry in padded], dtype=np.int64)
+        buffer = np.frombuffer(b''.join(padded), dtype=np.uint8).astype(np.uint32)
+
+        codes = (buffer[:-2] << 16) | (buffer[1:-1] << 8) | buffer[2:]
+        # Drop the windows that run across two entries
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+        entry_ids = np.repeat(np.arange(len(entries), dtype=np.int32), sizes)[:-2]
+        positions = np.arange(len(codes))
+        valid = positions <= offsets[entry_ids + 1] - 3
+        codes, entry_ids = codes[valid], entry_ids[valid]
+
+        # One posting per (trigram, entry), sorted by trigram
+        pairs = np.unique((codes.astype(np.int64) << 32) | entry_ids.astype(np.int64))
+        pair_codes = (pairs >> 32).astype(np.uint32)
+        postings = (pairs & 0xFFFFFFFF).astype(np.int32)
+        unique_codes, first = np.unique(pair_codes, return_index=True)
+        starts = np.append(first, len(postings)).astype(np.int64)
+
+        os.makedirs(self.trigram_dir, exist_ok=True)
+        for column, data in zip(COLUMNS, (unique_codes, starts, postings)):
+            self.atomic_write(f"{self.trigram_dir}/{column}.npy", lambda f: np.save(f, data))
+        # Written last, so a reader only trusts the columns once they're all in place
+        self.atomic_write(f"{self.trigram_dir}/stamp.json", lambda f: f.write(json.dumps(self.stamp()).encode('utf-8')))
+        if self.logging: print(f"Built trigram index over {len(entries)} names in {time.perf_counter() - start:.1f}s")
+
+    # Writes a file through write(f) so readers either see the old content or the new, like CandidateStore
+    def atomic_write(self, path, write):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+    def entry_name(self, idx):
+        if idx < len(self.alias_keys):
+            return self.alias_refs[idx]
+        return self.names.name_at(idx - len(self.alias_keys)).decode('utf-8')
+
+    # The spelling an entry was indexed under
+    def entry_key(self, idx):
+        if idx < len(self.alias_keys):
+            return self.alias_keys[idx].encode('utf-8')
+        return self.names.name_at(idx - len(self.alias_keys))
+
+    # Ranked entries sharing the most trigrams with a name, as (distribution, score)
+    # The selective trigrams pick the candidates, which are then scored on all of them
+    def fuzzy(self, name, limit=5):
+        key = canonicalize_name(name).encode('utf-8')
+        query = trigrams(key)
+        codes = np.array(sorted(int.from_bytes(trigram, 'big') for trigram in query), dtype=np.uint32)
+        idx = np.searchsorted(self.codes, codes)
+        found = idx < len(self.codes)
+        found[found] = self.codes[idx[found]] == codes[found]
+        idx = idx[found]
+        if not len(idx): return []
+
+        sizes = self.starts[idx + 1] - self.starts[idx]
+        selective = idx[sizes <= MAX_POSTINGS]
+        # If every trigram is common we still have to look at them
+        idx = selective if len(selective) else idx
+        hits = np.concatenate([self.postings[self.starts[i]:self.starts[i + 1]] for i in idx])
+        ids, shared = np.unique(hits, return_counts=True)
+        keep = min(CANDIDATES, len(ids))
+        best = ids[np.argpartition(-shared, keep - 1)[:keep]]
+
+        # Jaccard similarity over the trigram sets, closer lengths break ties
+        scored = []
+        for idx in best:
+            entry = self.entry_key(int(idx))
+            other = trigrams(entry)
+            score = len(query & other) / len(query | other)
+            scored.append((-score, abs(len(entry) - len(key)), int(idx)))
+        scored.sort()
+
+        ranked = []
+        for score, distance, idx in scored:
+            candidate = self.entry_name(idx)
+            if candidate not in (name for name, score in ranked):
+                ranked.append((candidate, -score))
+            if len(ranked) == limit: break
+        return ranked
+
+    # Ranked candidate distributions for an import name
+    # Known aliases come first with a score of 1, then an exact project name with PYPI_NAME_SCORE
+    def suggest(self, module, limit=5):
+        top = module.split('.')[0]
+        found = []
+        if self.resolver.is_known(module):
+            found.append((self.resolver.resolve(module), 1.0))
+        if top in self.names:
+            found.append((canonicalize_name(top), PYPI_NAME_SCORE))
+
+        ranked = []
+        seen = set()
+        for name, score in found + self.fuzzy(top, limit):
+            if canonicalize_name(name) not in seen:
+                seen.add(canonicalize_name(name))
+                ranked.append((name, score))
+        return ranked[:limit]
+
+    # The candidate to use without asking the LLM, or None when we aren't confident enough
+    def confident(self, module):
+        ranked = self.suggest(module, limit=2)
+        if not ranked or ranked[0][1] < MIN_SCORE: return None
+        return ranked[0][0]
+
+    def missing_module(self, message):
+        match = MISSING_MODULE.search(message)
+        return match.group(1) if match else None
+
+    # Remembers which candidate we went with for an import
+    def record(self, module, candidate):
+        self.stats['suggested'] += 1
+        self.pending[module] = candidate
+
+    # Checks the previous suggestions against the next run's output
+    # If the same import is still missing the first candidate was wrong
+    def update(self, message):
+        missing = self.missing_module(message) if message else None
+        for module in list(self.pending):
+            if missing and missing.split('.')[0] == module.split('.')[0]:
+                self.stats['first_wrong'] += 1
+            else:
+                self.stats['first_right'] += 1
+            self.pending.pop(module)
+
+    def hit_rate(self):
+        checked = self.stats['first_right'] + self.stats['first_wrong']
+        return self.stats['first_right'] / checked if checked else 0.0
+
+    def report(self):
+        return f"Name suggestions: first candidate right {self.stats['first_right']}/{self.stats['first_right'] + self.stats['first_wrong']} ({self.hit_rate():.0%}), {self.stats['llm_fallback']} LLM fallbacks"
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Suggest distributions for unknown import names')
+    parser.add_argument('names', type=str, nargs="*", default=['sklearn', 'cv2', 'Image', 'yaml', 'beautifulsoup', 'requets', 'skimage', 'dateutil'], help="Import names to look up")
+    parser.add_argument('-n', '--lookups', type=int, nargs="?", default=1000, const=1000, help="How many lookups to time")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    start = time.perf_counter()
+    suggester = NameSuggester(logging=True)
+    print(f"Startup: {(time.perf_counter() - start) * 1000:.1f} ms over {len(suggester.alias_keys) + len(suggester.names)} names")
+
+    start = time.perf_counter()
+    for idx in range(args.lookups):
+        suggester.suggest(args.names[idx % len(args.names)])
+    print(f"Per lookup: {(time.perf_counter() - start) / args.lookups * 1e6:.0f} us")
+
+    for name in args.names:
+        print(f"{name}: {suggester.suggest(name)}")
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,17 @@ from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 import os
 
+from helpers.llm_cache import LLMCache
+
 class OllamaHelperBase():
     
-    def __init__(self, base_url="http://localhost:11434", model='llama3', temp=0.7, logging=False) -> None:
+    # llm_cache: when parsed responses are reused, one of helpers.llm_cache.POLICIES
+    def __init__(self, base_url="http://localhost:11434", model='llama3', temp=0.7, logging=False, llm_cache='temp0') -> None:
         self.logging = logging
+        self.model_name = model
+        self.temp = temp
+        # Responses shared with every other process and earlier runs
+        self.llm_cache = LLMCache(policy=llm_cache, logging=logging)
         if 'gpt' in model:
             load_dotenv()
             OPENAI_KEY = os.getenv('OPENAI_KEY')
@@ -18,6 +25,13 @@ class OllamaHelperBase():
         else:
             self.model = ChatOllama(base_url=base_url, model=model, format="json", temperature=temp)
     
+    # Runs prompt | model | parser, answered from the response cache when the policy allows
+    # refresh: ask the model again and replace the cached answer, for retries after a bad response
+    def invoke_chain(self, prompt, parser, refresh=False):
+        chain = prompt | self.model | parser
+        schema = getattr(getattr(parser, 'pydantic_object', None), '__name__', type(parser).__name__)
+        return self.llm_cache.fetch(self.model_name, self.temp, prompt.format(), schema, lambda: chain.invoke({}), refresh=refresh)
+
     # Reads the contents of the given file
     def read_python_file(self, file):
         with open(file, 'r') as file:
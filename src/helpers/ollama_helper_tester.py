@@ -2,9 +2,20 @@
 # TESTER FILE FOR PLAYING WITH NEW IDEAS
 import argparse
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from packaging.utils import canonicalize_name
+
+from helpers.name_suggester import NameSuggester
 from helpers.ollama_helper_base import OllamaHelperBase
 from helpers.py_pi_query import PyPIQuery
+from helpers.symbol_index import SymbolIndex
+from helpers.system_packages import SystemPackages
+from helpers.version_sampler import VersionSampler, parse_strategies
+from helpers.version_store import VersionStore
+from helpers.error_rules import ErrorRules
+from helpers.log_compactor import LogCompactor, MAX_TOKENS
 
 from langchain_core.messages import SystemMessage, HumanMessage
 
@@ -15,6 +26,9 @@ from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts import PromptTemplate
 
+# Per module prompts run at once when the batched prompt misses some modules
+VERSION_WORKERS = 4
+
 # PYDANTIC classes for JSON output
 class Module(BaseModel):
     module: str = Field(description="Name of the module")
@@ -36,10 +50,23 @@ class ModuleVersions(BaseModel):
 # Main Ollama helper class
 class OllamaHelper(OllamaHelperBase):
     # Init defines the url to the Ollama API, the model, temp, logging and where the module information is stored
-    def __init__(self, base_url="http://localhost:11434", model='llama3', temp=1.0, logging=False, base_modules='./modules') -> None:
-        super().__init__(base_url, model, temp, logging)
+    def __init__(self, base_url="http://localhost:11434", model='llama3', temp=1.0, logging=False, base_modules='./modules', llm_cache='temp0', sampler=None, compact_tokens=MAX_TOKENS) -> None:
+        super().__init__(base_url, model, temp, logging, llm_cache)
         self.base_modules = base_modules
         self.pypi = PyPIQuery(logging=logging, base_modules=base_modules)
+        # Local name index, tried before the LLM for missing modules
+        self.suggester = NameSuggester(logging=logging)
+        # Names each release exports, tried before sampling versions for AttributeErrors and ImportErrors
+        self.symbols = SymbolIndex(cache=self.pypi.cache, logging=logging)
+        # Build failures from missing headers or libraries, fixed with apt instead of another version
+        self.system = SystemPackages(logging=logging)
+        # Picks the next version to try in process, the LLM prompt is the fallback
+        # sampler: per error type strategies, e.g. 'ImportError=bisect,NonZeroCode=llm'
+        self.sampler = VersionSampler(self.pypi, parse_strategies(sampler), logging=logging)
+        # Reads the module out of pip and Python errors before the LLM is asked
+        self.rules = ErrorRules(logging=logging)
+        # Cuts the Docker log down to the error before it goes into a prompt, None sends the whole log
+        self.compactor = LogCompactor(max_tokens=compact_tokens, logging=logging)
 
     """_summary_
     Validates the json from the model using pydantic to parse it
@@ -65,9 +92,7 @@ class OllamaHelper(OllamaHelperBase):
             partial_variables={"raw_file": raw_file, "format_instructions": parser.get_format_instructions()}
         )
         
-        chain = prompt | self.model | parser
-
-        out = chain.invoke({})
+        out = self.invoke_chain(prompt, parser)
         
         print(out)
         return out
@@ -84,59 +109,109 @@ class OllamaHelper(OllamaHelperBase):
 
         return llm_eval
 
-    # Loops through the modules and request a version for each
+    # Gets a version for every module
+    # One prompt asks for all of them, then the modules it left out or answered with a version
+    # that isn't listed are asked for one at a time, concurrently. Only those are retried
     def get_module_versions(self, details):
         modules = details['python_modules']
 
         if len(modules) <= 0:
             return {}
-        
-        # Define the parser
-        parser = JsonOutputParser(pydantic_object=ModuleVersion)
 
-        updated_modules = {}
+        start = time.perf_counter()
+        stores = {module: self.pypi.read_version_store(module, details['python_version']) for module in modules}
+        updated_modules = self.batch_module_versions(stores)
+        calls = 1
 
         attempts = 5
-        completed = False
+        missing = [module for module in stores if module not in updated_modules]
         # Loop to ensure we get a version.
-        # If the LLM returns a bad version or bad information then we need to loop and try again
-        while not completed:
-            try:
-                for idx, module in enumerate(modules):
-                    versions = self.read_python_file(f"{self.base_modules}/{module}_{details['python_version']}.txt")
-
-                    prompt = PromptTemplate(
-                        template="Given a comma separated list of '{version_details}', for the '{module}' module, from oldest to newest.\nSelect a recent version for us to use that isn't previously used: 'Previously used: {previous}, and return the information with the format {format_instructions}",
-                        input_variables=[],
-                        partial_variables={"version_details": versions, "module": module, "previous": [], "format_instructions": parser.get_format_instructions()}
-                    )
-
-                    chain = prompt | self.model | parser
+        # If the LLM returns a bad version or bad information then we need to try those modules again
+        while missing and attempts > 0:
+            # A retry wants a new answer, not the one that just failed
+            refresh = attempts < 5
+            with ThreadPoolExecutor(max_workers=min(VERSION_WORKERS, len(missing))) as executor:
+                answers = list(executor.map(lambda module: self.single_module_version(module, stores[module], refresh), missing))
+            calls += len(missing)
+            for module, version in zip(missing, answers):
+                if version: updated_modules[module] = version
+            missing = [module for module in stores if module not in updated_modules]
+            attempts -= 1
+
+        # The prompt asks for a recent version, so that's what a module the LLM never answered gets
+        for module in missing:
+            if len(stores[module]): updated_modules[module] = stores[module].newest()
+        # Nothing listed and nothing answered, the module is left out rather than losing the others' answers
+        # If the snippet needs it the build fails with a ModuleNotFound and the error handlers add it back
+        dropped = [module for module in stores if module not in updated_modules]
+        if dropped: print(f"Failed to find versions, leaving out {', '.join(dropped)}")
+
+        if self.logging: print(f"Versions for {len(stores)} modules in {time.perf_counter() - start:.1f}s with {calls} LLM calls")
+        print(updated_modules)
 
-                    out = chain.invoke({})
+        return updated_modules
 
-                    updated_modules[out['module']] = out['version'].split(' ')[0]
-                completed = True
-            except Exception as e:
-                completed = False
-                attempts -= 1
-            
-            if attempts <= 0:
-                print("Failed to find versions")
-                exit(0)
+    # The listed spelling of a version the LLM gave, None if it isn't one of the versions we offered
+    # An empty store means we couldn't list the versions, so any answer is taken
+    def listed_version(self, version, versions):
+        if not version: return None
+        version = str(version).split(' ')[0]
+        if not len(versions): return version
+        return versions.match(version)
+
+    # One prompt for every module, returns {module: version} for the answers that are usable
+    def batch_module_versions(self, stores):
+        parser = JsonOutputParser(pydantic_object=PythonModules)
+        module_versions = '\n'.join(f"'{module}': {versions}" for module, versions in stores.items())
+        prompt = PromptTemplate(
+            template="Given comma separated lists of versions for each Python module, from oldest to newest:\n{module_versions}\nSelect a recent version for every module, keyed by the module name, and return the information with the format {format_instructions}",
+            input_variables=[],
+            partial_variables={"module_versions": module_versions, "format_instructions": parser.get_format_instructions()}
+        )
 
-        print(updated_modules)
+        try:
+            out = self.invoke_chain(prompt, parser)
+            answers = out.get('python_modules', out)
+        except Exception as e:
+            print(f"Batched version selection failed, asking per module: {e}")
+            return {}
+        if not isinstance(answers, dict): return {}
+
+        by_name = {canonicalize_name(module): module for module in stores}
+        found = {}
+        for key, value in answers.items():
+            name = value.get('module', key) if isinstance(value, dict) else key
+            version = value.get('version') if isinstance(value, dict) else value
+            module = by_name.get(canonicalize_name(str(name))) or by_name.get(canonicalize_name(str(key)))
+            if module is None: continue
+            version = self.listed_version(version, stores[module])
+            if version: found[module] = version
+        return found
+
+    # One prompt for one module, returns the version or None if the answer wasn't usable
+    def single_module_version(self, module, versions, refresh=False):
+        parser = JsonOutputParser(pydantic_object=ModuleVersion)
+        prompt = PromptTemplate(
+            template="Given a comma separated list of '{version_details}', for the '{module}' module, from oldest to newest.\nSelect a recent version for us to use that isn't previously used: 'Previously used: {previous}, and return the information with the format {format_instructions}",
+            input_variables=[],
+            partial_variables={"version_details": versions, "module": module, "previous": [], "format_instructions": parser.get_format_instructions()}
+        )
 
-        return updated_modules
+        try:
+            out = self.invoke_chain(prompt, parser, refresh=refresh)
+            return self.listed_version(out['version'], versions)
+        except Exception as e:
+            if self.logging: print(f"Unable to get a version for {module}: {e}")
+            return None
 
 
     # NOTE: Deprecated, update instances that use this!
-    def execute_chain(self, chain, pydantic_model):
+    def execute_chain(self, prompt, parser, pydantic_model):
         loop = 5
         passed = False
         
         while not passed or loop > 0:
-            out = chain.invoke({})
+            out = self.invoke_chain(prompt, parser, refresh=loop < 5)
             if self.logging: print(out)
             passed = self.pydantic_validate(pydantic_model, out)
             if passed: return passed, out
@@ -154,17 +229,22 @@ class OllamaHelper(OllamaHelperBase):
 
     # Generic method to get the details from the error
     # Takes the prompt from the the error handler and the parser to ensure the information is returned correctly
-    def generic_get_module_from_error(self, prompt, parser):
+    # rule: what the error rules read from the error, used without the LLM when it's trusted, else a hint in the prompt
+    # pinned: the modules the snippet has pinned, a rule's module has to be one of them or a known import name
+    def generic_get_module_from_error(self, prompt, parser, rule=None, pinned=None):
 
         bad_module = None
 
+        if rule:
+            checked = self.pypi.check_module_name(rule['module'])
+            if checked and self.trusted_rule(rule, checked[0], pinned): return checked[0]
+            prompt = self.hinted_prompt(prompt, rule)
+
         # Loop to ensure the model returns a decent response from the error message
         # We want it to extract a module name which we can work with later
         for loop in range(0, 5):
             try:
-                chain = prompt | self.model | parser
-
-                out = chain.invoke({})
+                out = self.invoke_chain(prompt, parser, refresh=loop > 0)
                 # Get the name of the offending module from the error message        
                 bad_module = self.pypi.check_module_name(out['module'])[0]
 
@@ -174,6 +254,22 @@ class OllamaHelper(OllamaHelperBase):
 
         return bad_module
 
+    # A rule's module is only trusted when the rule is confident, the name isn't a submodule
+    # of another import, and it's one of the pins or an import name we know the distribution of
+    def trusted_rule(self, rule, module, pinned):
+        if not self.rules.trusted(rule): return False
+        if canonicalize_name(module) in {canonicalize_name(name) for name in pinned or []}: return True
+        return self.pypi.resolver.is_known(rule['module'])
+
+    # The module prompt with what the rule read from the error, for the LLM to check
+    def hinted_prompt(self, prompt, rule):
+        hint = rule['package'] or rule['module']
+        return PromptTemplate(
+                template=prompt.template + "\nA pattern match on the error suggests the module '{rule_hint}', only use it if the error agrees.",
+                input_variables=[],
+                partial_variables={**prompt.partial_variables, "rule_hint": hint}
+            )
+
     # Generic method to prompt for a version
     # Uses the targeted prompt and parser plus the previous failing versions
     def generic_get_version_with_bad_modules(self, prompt, parser, previous_versions):
@@ -181,9 +277,7 @@ class OllamaHelper(OllamaHelperBase):
 
         for loop in range(0, 5):
             try:
-                chain = prompt | self.model | parser
-
-                out = chain.invoke({})
+                out = self.invoke_chain(prompt, parser, refresh=loop > 0)
 
                 print(out)
 
@@ -206,9 +300,11 @@ class OllamaHelper(OllamaHelperBase):
 
 
     # Generic method for multiple occasions
-    # Gets the module versions from file as well as the error_modules.
-    def get_versions_previous_versions(self, bad_module, previous_versions, details):
-        versions = self.pypi.read_module_file(bad_module, details['python_version'])
+    # Gets the module versions as a VersionStore as well as the error_modules.
+    # A store that's already been loaded can be passed in with versions
+    def get_versions_previous_versions(self, bad_module, previous_versions, details, versions=None):
+        if versions is None:
+            versions = self.pypi.read_version_store(bad_module, details['python_version'])
 
         error_modules = ''
         if bad_module in previous_versions['error_modules']:
@@ -222,7 +318,8 @@ class OllamaHelper(OllamaHelperBase):
         return versions, error_modules
 
 
-    def could_not_find_version(self, error, previous_versions, details):
+    # raw: the whole log the error rules read, error is the compacted one for the prompts
+    def could_not_find_version(self, error, previous_versions, details, raw=None):
         parser = JsonOutputParser(pydantic_object=Module)
         get_module_prompt = PromptTemplate(
                     template="Given a docker build error where a version could not be found:\n{error}\nIdentify the module causing the error, which is likely in the form 'from module_name==version'.\nReturn the just the name of the module using the format instructions.\n{format_instructions}",
@@ -230,13 +327,21 @@ class OllamaHelper(OllamaHelperBase):
                     partial_variables={"error": error, "format_instructions": parser.get_format_instructions()}
                 )
         
+        # pip names the module and lists the versions it could install
+        rule = self.rules.match(raw or error, ['VersionNotFound'])
+
         # Generic method for handling a try loop for getting a module name
-        bad_module = self.generic_get_module_from_error(get_module_prompt, parser)
+        bad_module = self.generic_get_module_from_error(get_module_prompt, parser, rule, details['python_modules'])
         # If we failed to get a module then we return None
         if bad_module == None: return bad_module
 
         versions, error_modules = self.get_versions_previous_versions(bad_module, previous_versions, details)
 
+        # Only the listed versions install on this Python, so pick from them without the LLM
+        if rule and rule['versions'] and self.pypi.check_module_name(rule['module'])[:1] == [bad_module]:
+            out = self.sampled_version(bad_module, VersionStore(rule['versions']), error_modules, 'VersionNotFound')
+            if out: return out
+
         parser = JsonOutputParser(pydantic_object=ModuleVersion)
         get_version_prompt = PromptTemplate(
                 # template="Given a set of versions from oldest to newest ({versions}) for the '{module}' module. Perform a distributed search to retrieve a new version, excluding previously used versions ({previous_versions}).\nReturn the information with the format {format_instructions}",
@@ -274,15 +379,49 @@ class OllamaHelper(OllamaHelperBase):
             partial_variables={"error": error, "format_instructions": parser.get_format_instructions()}
         )
 
-        chain = prompt | self.model | parser
-
-        passed, json_out = self.execute_chain(chain, ModuleVersion)
+        passed, json_out = self.execute_chain(prompt, parser, ModuleVersion)
         
         print(json_out)
         return json_out
     
 
-    def import_error(self, error, previous_versions, details):
+    # Next version from the in-process sampler as {'module', 'version'}
+    # None when the strategy for the error type is 'llm' or every version has been tried
+    def sampled_version(self, module, versions, error_modules, error_type):
+        previous = error_modules.split(', ') if error_modules else []
+        version = self.sampler.sample(module, versions, previous, error_type)
+        return {'module': module, 'version': version} if version else None
+
+    # The LLM's pick from the versions, excluding the previous ones
+    def llm_sample_version(self, module, versions, error_modules):
+        parser = JsonOutputParser(pydantic_object=ModuleVersion)
+        get_version_prompt = PromptTemplate(
+                template="Given a comma separated list of 'Module versions' for the '{module}' module, from oldest to newest:\n{module_versions}\nPerform equally distanced sampling to return a version from the given versions, excluding previously used versions ({previous_versions}).\nReturn the information with the format {format_instructions}",
+                input_variables=[],
+                partial_variables={"module": module, "module_versions": versions, "previous_versions": error_modules, "format_instructions": parser.get_format_instructions()}
+            )
+
+        return self.generic_get_version_with_bad_modules(get_version_prompt, parser, error_modules)
+
+    # A version that still has the name an AttributeError or 'cannot import name' error is missing
+    # Answered from the symbol index, None when the index can't say and the LLM has to sample
+    def symbol_version(self, error, previous_versions, details):
+        def versions_for(package):
+            versions, error_modules = self.get_versions_previous_versions(package, previous_versions, details)
+            return versions, error_modules.split(', ') if error_modules else []
+
+        try:
+            out = self.symbols.suggest(error, list(details['python_modules']), versions_for)
+        except Exception as e:
+            print(f"Symbol index lookup failed: {e}")
+            return None
+        if out and self.logging: print(f"Symbol index suggests {out['module']}=={out['version']}")
+        return out
+
+    def import_error(self, error, previous_versions, details, raw=None):
+        out = self.symbol_version(error, previous_versions, details)
+        if out: return out
+
         parser = JsonOutputParser(pydantic_object=Module)
         get_module_prompt = PromptTemplate(
                     template="Given an ImportError:\n{error}\n Identify the import which is causing the error.\nFor this type of error, the module is normally in the text 'from x import y', where x and y are the module to import and the offending method.\nReturn the name of the module using the format instructions.\n{format_instructions}",
@@ -291,20 +430,16 @@ class OllamaHelper(OllamaHelperBase):
                 )
         
         # Generic method for handling a try loop for getting a module name
-        bad_module = self.generic_get_module_from_error(get_module_prompt, parser)
+        bad_module = self.generic_get_module_from_error(get_module_prompt, parser, self.rules.match(raw or error, ['ImportError', 'ModuleNotFound']), details['python_modules'])
         # If we failed to get a module then we return None
         if bad_module == None: return bad_module
 
         versions, error_modules = self.get_versions_previous_versions(bad_module, previous_versions, details)
 
-        parser = JsonOutputParser(pydantic_object=ModuleVersion)
-        get_version_prompt = PromptTemplate(
-                template="Given a comma separated list of 'Module versions' for the '{module}' module, from oldest to newest:\n{module_versions}\nPerform equally distanced sampling to return a version from the given versions, excluding previously used versions ({previous_versions}).\nReturn the information with the format {format_instructions}",
-                input_variables=[],
-                partial_variables={"error": error, "module": bad_module, "module_versions": versions, "previous_versions": error_modules, "format_instructions": parser.get_format_instructions()}
-            )
-        
-        out = self.generic_get_version_with_bad_modules(get_version_prompt, parser, error_modules)
+        out = self.sampled_version(bad_module, versions, error_modules, 'ImportError')
+        if out: return out
+
+        out = self.llm_sample_version(bad_module, versions, error_modules)
 
         if 'module' in out and 'version' in out:
             return out
@@ -312,7 +447,22 @@ class OllamaHelper(OllamaHelperBase):
             return None
 
 
-    def module_not_found(self, error, previous_versions, details):
+    # Distribution for the import named in a ModuleNotFound error, from the local name index
+    # Returns None when there's no confident candidate
+    def suggest_missing_module(self, error):
+        missing = self.suggester.missing_module(error)
+        if not missing: return None
+
+        candidate = self.suggester.confident(missing)
+        if candidate == None: return None
+        checked = self.pypi.check_module_name(candidate)
+        if not checked: return None
+
+        if self.logging: print(f"Name index suggests {checked[0]} for '{missing}'")
+        self.suggester.record(missing, checked[0])
+        return checked[0]
+
+    def module_not_found(self, error, previous_versions, details, raw=None):
         # python_modules = []
         # for module in details['python_modules']:
         #     python_modules.append(module)
@@ -325,13 +475,20 @@ class OllamaHelper(OllamaHelperBase):
                     partial_variables={"error": error, "format_instructions": parser.get_format_instructions()}
                 )
         
-        # Generic method for handling a try loop for getting a module name
-        bad_module = self.generic_get_module_from_error(get_module_prompt, parser)
+        # Try the local name index first, only ask the LLM when it isn't confident
+        bad_module = self.suggest_missing_module(error)
+        if bad_module == None:
+            self.suggester.stats['llm_fallback'] += 1
+            # Generic method for handling a try loop for getting a module name
+            bad_module = self.generic_get_module_from_error(get_module_prompt, parser, self.rules.match(raw or error, ['ModuleNotFound']), details['python_modules'])
         # If we failed to get a module then we return None
         if bad_module == None: return bad_module
 
         versions, error_modules = self.get_versions_previous_versions(bad_module, previous_versions, details)
 
+        out = self.sampled_version(bad_module, versions, error_modules, 'ModuleNotFound')
+        if out: return out
+
         parser = JsonOutputParser(pydantic_object=ModuleVersion)
         get_version_prompt = PromptTemplate(
                 # template="Given a comma separated list of 'Module versions' for the '{module}' module, from oldest to newest:\n{module_versions}\nExcluding previously used versions:\n{previous_versions}\nSelect a version from the other side of the version list, depending on the last previous version. Return the information with the format {format_instructions}",
@@ -348,7 +505,10 @@ class OllamaHelper(OllamaHelperBase):
             return None
         
 
-    def attribute_error(self, error, previous_versions, details):
+    def attribute_error(self, error, previous_versions, details, raw=None):
+        out = self.symbol_version(error, previous_versions, details)
+        if out: return out
+
         python_modules = []
         for module in details['python_modules']:
             python_modules.append(module)
@@ -361,12 +521,15 @@ class OllamaHelper(OllamaHelperBase):
                 )
         
         # Generic method for handling a try loop for getting a module name
-        bad_module = self.generic_get_module_from_error(get_module_prompt, parser)
+        bad_module = self.generic_get_module_from_error(get_module_prompt, parser, self.rules.match(raw or error, ['AttributeError']), details['python_modules'])
         # If we failed to get a module then we return None
         if bad_module == None: return bad_module
 
         versions, error_modules = self.get_versions_previous_versions(bad_module, previous_versions, details)
 
+        out = self.sampled_version(bad_module, versions, error_modules, 'AttributeError')
+        if out: return out
+
         parser = JsonOutputParser(pydantic_object=ModuleVersion)
         get_version_prompt = PromptTemplate(
                 # template="Given a comma separated list of 'Module versions' for the '{module}' module, from oldest to newest:\n{module_versions}\nExcluding previously used versions:\n{previous_versions}\nSelect a version from the other side of the version list, depending on the last previous version. Return the information with the format {format_instructions}",
@@ -393,15 +556,14 @@ class OllamaHelper(OllamaHelperBase):
             partial_variables={"error": error, "format_instructions": parser.get_format_instructions()}
         )
 
-        chain = prompt | self.model | parser
-
-        passed, json_out = self.execute_chain(chain, ModuleVersion)
+        passed, json_out = self.execute_chain(prompt, parser, ModuleVersion)
         
         print(json_out)
         return json_out
     
 
-    def non_zero_error(self, error):
+    # pinned: the snippet's pinned modules, None when the caller doesn't have them
+    def non_zero_error(self, error, pinned=None, raw=None):
         parser = JsonOutputParser(pydantic_object=Module)
 
         get_module_prompt = PromptTemplate(
@@ -411,7 +573,7 @@ class OllamaHelper(OllamaHelperBase):
         )
         
         # Generic method for handling a try loop for getting a module name
-        bad_module = self.generic_get_module_from_error(get_module_prompt, parser)
+        bad_module = self.generic_get_module_from_error(get_module_prompt, parser, self.rules.match(raw or error, ['NonZeroCode']), pinned)
 
         return bad_module
     
@@ -419,6 +581,9 @@ class OllamaHelper(OllamaHelperBase):
     def non_zero_error_version(self, error, module, previous_versions, details):
         versions, error_modules = self.get_versions_previous_versions(module, previous_versions, details)
 
+        out = self.sampled_version(module, versions, error_modules, 'NonZeroCode')
+        if out: return out
+
         parser = JsonOutputParser(pydantic_object=ModuleVersion)
         get_version_prompt = PromptTemplate(
             # template="Given a comma separated list of 'Module versions' for the '{module}' module, from oldest to newest:\n{module_versions}\nPerform equally distanced sampling to return a version from the given versions, excluding previously used versions ({previous_versions}). Return the information with the format {format_instructions}",
@@ -437,7 +602,7 @@ class OllamaHelper(OllamaHelperBase):
             return None
 
 
-    def syntax_error_helper(self, error, previous_versions, details):
+    def syntax_error_helper(self, error, previous_versions, details, raw=None):
         parser = JsonOutputParser(pydantic_object=Module)
         get_module_prompt = PromptTemplate(
                     template="Given a Docker build error message: {error}\nIdentify the offending Python module and output the module name using the following format instruction {format_instructions}.",
@@ -446,12 +611,15 @@ class OllamaHelper(OllamaHelperBase):
                 )
         
         # Generic method for handling a try loop for getting a module name
-        bad_module = self.generic_get_module_from_error(get_module_prompt, parser)
+        bad_module = self.generic_get_module_from_error(get_module_prompt, parser, self.rules.match(raw or error, ['SyntaxError']), details['python_modules'])
         # If we failed to get a module then we return None
         if bad_module == None: return bad_module
 
         versions, error_modules = self.get_versions_previous_versions(bad_module, previous_versions, details)
 
+        out = self.sampled_version(bad_module, versions, error_modules, 'SyntaxError')
+        if out: return out
+
         parser = JsonOutputParser(pydantic_object=ModuleVersion)
         get_version_prompt = PromptTemplate(
                 template="Given a comma separated list of 'Module versions' for the '{module}' module, from oldest to newest:\n{module_versions}\nExcluding previously used versions:\n{previous_versions}\nSelect a version from the other side of the version list, depending on the last previous version. Return the information with the format {format_instructions}",
@@ -471,47 +639,67 @@ class OllamaHelper(OllamaHelperBase):
     def process_error(self, message, error_details, llm_eval):
         error_type = None
         output = None
-        
-        if 'Could not find a version' in message:
+
+        # See whether the last suggested module names fixed their import
+        self.suggester.update(message)
+        if self.logging and self.suggester.stats['suggested']: print(self.suggester.report())
+
+        # Routing, the system package check and the error rules read the whole log, the prompts only get the compacted one
+        # so the rules still see every version pip listed
+        raw = message
+        message = self.compactor.compact(raw)
+        start = time.perf_counter()
+
+        # Missing headers or shared libraries won't go away with another version of the module
+        system_packages = self.system.missing(raw, llm_eval.get('system_packages', []))
+        if system_packages:
+            if self.logging: print('System dependency')
+            error_type = 'SystemDependency'
+            output = {'module': None, 'version': None, 'system_packages': system_packages}
+            if self.logging: print(self.system.report())
+        elif 'Could not find a version' in raw:
             if self.logging: print("Could not find a version")
             error_type = 'VersionNotFound'
-            output = self.could_not_find_version(message, error_details, llm_eval)
-        elif 'dependency conflicts' in message:
+            output = self.could_not_find_version(message, error_details, llm_eval, raw)
+        elif 'dependency conflicts' in raw:
             if self.logging: print("Dependency conflict")
             error_type = 'DependencyConflict'
             output = self.dependency_conflict(message)
-        elif 'ImportError' in message:
+        elif 'ImportError' in raw:
             if self.logging: print('Import Error')
             error_type = 'ImportError'
-            if 'DJANGO_SETTINGS_MODULE is undefined' in message:
+            if 'DJANGO_SETTINGS_MODULE is undefined' in raw:
                 output = None
             else:
-                output = self.import_error(message, error_details, llm_eval)
-        elif 'ModuleNotFoundError' in message:
+                output = self.import_error(message, error_details, llm_eval, raw)
+        elif 'ModuleNotFoundError' in raw:
             if self.logging: print("Module not found")
             error_type = 'ModuleNotFound'
-            output = self.module_not_found(message, error_details, llm_eval)
-        elif 'AttributeError' in message:
+            output = self.module_not_found(message, error_details, llm_eval, raw)
+        elif 'AttributeError' in raw:
             if self.logging: print("Attribute error")
             error_type = 'AttributeError'
-            output = self.attribute_error(message, error_details, llm_eval)
-        elif 'InvalidVersion' in message:
+            output = self.attribute_error(message, error_details, llm_eval, raw)
+        elif 'InvalidVersion' in raw:
             if self.logging: print('Invalid Version')
             error_type = 'InvalidVersion'
             output = self.invalid_version(message)
-        elif 'non-zero code' in message: # Docker specific error message
+        elif 'non-zero code' in raw: # Docker specific error message
             if self.logging: print('Non-zero error code from docker build')
             error_type = 'NonZeroCode'
-            output = self.non_zero_error(message)
+            output = self.non_zero_error(message, llm_eval['python_modules'], raw)
             output = self.non_zero_error_version(message, output, error_details, llm_eval)
-        elif 'SyntaxError' in message:
+        elif 'SyntaxError' in raw:
             if self.logging: print('Syntax Error: Python specific error that needs more information')
             error_type = 'SyntaxError'
-            output = self.syntax_error_helper(message, error_details, llm_eval)
+            output = self.syntax_error_helper(message, error_details, llm_eval, raw)
         else:
             if self.logging: print('No error type found')
             error_type = 'None'
 
+        self.compactor.record(error_type, raw, message, time.perf_counter() - start)
+        if self.logging: print(self.compactor.report())
+
         return output, error_type
 
 # Handle argument parsing
@@ -0,0 +1,149 @@
+# Offline index of every project name on PyPI
+# Names are normalised, sorted and written to a single file that is memory
+# mapped and binary searched, so existence checks need no network.
+#
+# File layout (native byte order, the file is a local cache):
+#   b'PLNI' | uint32 count | uint32 offsets[count + 1] | names (utf-8, concatenated)
+import argparse
+import mmap
+import os
+import re
+import tempfile
+import time
+from array import array
+
+import requests
+from packaging.utils import canonicalize_name
+
+from helpers.pypi_cache import CACHE_DIR, PYPI_URL
+
+MAGIC = b'PLNI'
+INDEX_FILE = f"{CACHE_DIR}/pypi_names.idx"
+
+class PackageNameIndex:
+
+    def __init__(self, index_file=INDEX_FILE, logging=False) -> None:
+        self.logging = logging
+        self.index_file = index_file
+        self.mm = None
+        self.offsets = None
+        self.count = 0
+        self.base = 0
+        self.open()
+
+    # Maps the index file if it exists, the index is simply unavailable otherwise
+    def open(self):
+        self.close()
+        if not os.path.isfile(self.index_file): return
+        with open(self.index_file, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC:
+            print(f"{self.index_file} is not a package name index, ignoring it")
+            self.close()
+            return
+        self.count = memoryview(self.mm)[4:8].cast('I')[0]
+        self.offsets = memoryview(self.mm)[8:8 + 4 * (self.count + 1)].cast('I')
+        self.base = 8 + 4 * (self.count + 1)
+
+    def close(self):
+        if self.offsets is not None: self.offsets.release()
+        if self.mm is not None: self.mm.close()
+        self.mm = None
+        self.offsets = None
+        self.count = 0
+
+    def available(self):
+        return self.mm is not None
+
+    def __len__(self):
+        return self.count
+
+    def name_at(self, idx):
+        return self.mm[self.base + self.offsets[idx]:self.base + self.offsets[idx + 1]]
+
+    # Binary search for a (normalised) name
+    def __contains__(self, name):
+        if not self.available(): return False
+        key = canonicalize_name(name).encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.name_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low < self.count and self.name_at(low) == key
+
+    # True or False when the index is available, None when we have to ask the network
+    def exists(self, name):
+        return (name in self) if self.available() else None
+
+    def names(self):
+        for idx in range(self.count):
+            yield self.name_at(idx).decode('utf-8')
+
+    # Pulls project names out of a simple index dump, either the PEP 691 JSON or the HTML page
+    def parse_simple_index(self, text):
+        if text.lstrip().startswith('{'):
+            import json
+            return [project['name'] for project in json.loads(text)['projects']]
+        return re.findall(r'<a[^>]*>([^<]+)</a>', text)
+
+    # Rebuilds the index from a simple index dump (file path or URL), defaults to the live index
+    def refresh(self, source=None):
+        source = source if source else f"{PYPI_URL}/simple/"
+        if os.path.isfile(source):
+            with open(source, 'r', encoding='utf-8') as f:
+                text = f.read()
+        else:
+            response = requests.get(source, headers={'Accept': 'application/vnd.pypi.simple.v1+json, text/html;q=0.1'}, timeout=600)
+            response.raise_for_status()
+            text = response.text
+
+        names = sorted({canonicalize_name(name.strip()).encode('utf-8') for name in self.parse_simple_index(text) if name.strip()})
+        self.write(names)
+        if self.logging: print(f"Indexed {len(names)} project names from {source}")
+        return len(names)
+
+    def write(self, names):
+        offsets = array('I', [0])
+        for name in names:
+            offsets.append(offsets[-1] + len(name))
+
+        os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.index_file) or '.', prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(array('I', [len(names)]).tobytes())
+            f.write(offsets.tobytes())
+            f.write(b''.join(names))
+        # Readers keep their old mapping until they reopen, so swapping the file is safe
+        os.replace(tmp, self.index_file)
+        self.open()
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Offline PyPI project name index')
+    parser.add_argument('-r', '--refresh', type=str, nargs="?", default=None, const='', help="Rebuild the index from a simple index dump (file or URL), defaults to the live index")
+    parser.add_argument('-c', '--check', type=str, nargs="*", default=[], help="Names to look up")
+    parser.add_argument('-i', '--index', type=str, nargs="?", default=INDEX_FILE, const=INDEX_FILE, help="Index file, defaults to ./cache/pypi_names.idx")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    index = PackageNameIndex(index_file=args.index, logging=True)
+    if args.refresh is not None:
+        index.refresh(args.refresh or None)
+
+    if not index.available():
+        print(f"No index at {args.index}, build one with --refresh")
+        return
+
+    print(f"{len(index)} project names")
+    for name in args.check:
+        start = time.perf_counter()
+        found = name in index
+        print(f"{name}: {found} ({(time.perf_counter() - start) * 1e6:.1f} us)")
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,45 @@
 # Methods for querying PyPi directly
 # Used for finding rough versions
-import json
 import os
-import re
-from pypi_json import PyPIJSON
+from concurrent.futures import ThreadPoolExecutor
+from pypi_json import ProjectMetadata
 from datetime import datetime
 
 from helpers.github_cruiser_core import GithubCruiserCore
 from helpers.deps_scraper import DepsScraper
+from helpers.pypi_cache import PyPICache
+from helpers.release_index import ReleaseIndex
+from helpers.compatibility import CompatibilityChecker
+from helpers.version_store import VersionStore
+from helpers.module_resolver import get_resolver
+from helpers.candidate_store import CandidateStore, LEGACY_REVISION
 
 class PyPIQuery:
     ###
     # For now we use GithubCruiserCore for certain helper functions
     ###
-    def __init__(self, logging=False, base_modules="./modules") -> None:
+    def __init__(self, logging=False, base_modules="./modules", fetch_workers=8) -> None:
         self.date_format = '%Y-%m-%d'
         self.output_date_format = '%b %d %Y'
         self.logging = False
         self.ghc = GithubCruiserCore(logging=False)
         self.deps = DepsScraper(logging=logging)
         self.python_versions = self.ghc.load_json_from_file("helpers/ref_files/python_versions.json")
-        os.makedirs(base_modules, exist_ok=True)
+        # Import name to distribution lookups, built once per process
+        self.resolver = get_resolver()
+        # Old per-snippet version lists, only read so they can be migrated into the shared store
         self.base_modules = base_modules
+        self.candidates = CandidateStore(logging=logging)
+        # How many dependencies we fetch from PyPI at the same time
+        self.fetch_workers = max(1, fetch_workers)
+        # Shared on-disk cache of the PyPI JSON API, with a connection pool per worker
+        self.cache = PyPICache(logging=logging, pool_size=self.fetch_workers)
+        # Release indexes we've already built and their metadata revision, keyed by module name
+        self.release_indexes = {}
+        self.revisions = {}
+        # Installability checkers per Python version and how many candidates they removed per module
+        self.checkers = {}
+        self.removed_candidates = {}
 
     def check_format(self, python_version):
         python_version = python_version.replace('+', '')
@@ -33,22 +51,28 @@ class PyPIQuery:
             return checked_version
     
     
+    # Gets the candidate versions for a module as a comma separated list
     def read_module_file(self, module, python_version):
+        return str(self.read_version_store(module, python_version))
+
+    # Gets the candidate versions for a module as a VersionStore
+    # Reads the shared store, falling back to an old per-snippet file or working them out from PyPI
+    def read_version_store(self, module, python_version):
+        versions = self.candidates.get(module, python_version)
+        if versions is not None:
+            return versions
+
         file = f"{self.base_modules}/{module}_{python_version}.txt"
         if os.path.isfile(file):
             with open(file, 'r') as file:
-                data = file.read()
-            return data
-        else:
-            module_details = {'python_version': python_version, 'python_modules': [module]}
-            out = self.get_module_specifics(module_details)
-            if os.path.isfile(file):
-                with open(file, 'r') as file:
-                    data = file.read()
-                return data
-            else:
-                return ''
-    
+                versions = VersionStore.from_string(file.read())
+            self.candidates.put(module, python_version, LEGACY_REVISION, versions)
+            return versions
+
+        module_details = {'python_version': python_version, 'python_modules': [module]}
+        self.get_module_specifics(module_details)
+        versions = self.candidates.get(module, python_version)
+        return versions if versions is not None else VersionStore()
 
     # Get a start and end date based on the Python versions we're using
     # This takes the Python version and creates a date range from release, through to the next version.
@@ -69,21 +93,32 @@ class PyPIQuery:
 
     # Get a range of Python versions based on the given version
     # For example if we give Python 3.7 it will return [3.5, 3.6, 3.7, 3.8, 3.9]
-    def get_python_range(self, python_version, pyrange=2):
+    # feasible: the versions the snippet's syntax allows (VersionClassifier), nothing outside it is picked
+    # ranked: versions most likely first (VersionPredictor), the top ones are used instead of a range
+    # around python_version, which still gets the last slot if it missed out
+    def get_python_range(self, python_version, pyrange=2, feasible=None, ranked=None):
         checked_version = self.check_format(python_version)
+        if ranked:
+            selected_python = [version for version in ranked if not feasible or version in feasible][:1 + (pyrange*2)]
+            if selected_python and checked_version not in selected_python and (not feasible or checked_version in feasible):
+                selected_python[-1] = checked_version
+            if selected_python:
+                if self.logging: print(selected_python)
+                return selected_python
+        python_versions = self.python_versions if not feasible else [x for x in self.python_versions if x['cycle'] in feasible]
 
         selected_python = []
 
         try:
             # Loop through the different python versions
-            for idx, x in enumerate(self.python_versions):
+            for idx, x in enumerate(python_versions):
                 if checked_version in x['cycle']:
                     # Total elements is the current version plus the range either side
                     total_elements_to_select = 1 + (pyrange*2)
                     num_values_each_side = pyrange
 
                     start_index = max(0, idx - num_values_each_side)
-                    end_index = min(len(self.python_versions), idx + num_values_each_side + 1)
+                    end_index = min(len(python_versions), idx + num_values_each_side + 1)
 
                     # Adjust start and end index if necessary to ensure a total of 5 elements are selected
                     if end_index - start_index < 5:
@@ -91,8 +126,9 @@ class PyPIQuery:
                             end_index += total_elements_to_select - (end_index - start_index)
                         else:
                             start_index -= total_elements_to_select - (end_index - start_index)
+                    start_index = max(0, start_index)
 
-                    result = self.python_versions[start_index:end_index]
+                    result = python_versions[start_index:end_index]
                     for version in result:
                         selected_python.append(version['cycle'])
         except Exception as e:
@@ -108,7 +144,9 @@ class PyPIQuery:
                 else:
                     selected_python.append(f'3.{8+i}')
                     selected_python.append(f'3.{8-i}')
-        elif not '2.7' in selected_python:
+            if feasible:
+                selected_python = [version for version in selected_python if version in feasible] or [x['cycle'] for x in python_versions[:1]]
+        elif not '2.7' in selected_python and (not feasible or '2.7' in feasible):
             selected_python[-1] = '2.7' if len(selected_python) > 0 else selected_python.append('2.7')
 
         if self.logging: print(selected_python)
@@ -118,158 +156,117 @@ class PyPIQuery:
     # Checks the modules to ensure they look correct
     # This ensures there's no weird formatting or the model went awry
     def check_modules(self, modules):
-        f = open('./helpers/ref_files/module_link.json')
-        known_modules = json.load(f)
         module_list = {}
 
         for module in modules:
-            if '.' in module:
-                module = module.split('.')[0]
-            
-            module_version = modules[module]
-            if module in known_modules:
-                module_list[known_modules[module.lower()]['ref']] = module_version
-            else:
-                module_list[module.lower()] = module_version
+            module_list[self.resolver.resolve(module)] = modules[module]
 
         return module_list            
 
     # Uses a json list to check if a module has a different name
     # Loops through the modules we're looking for, along with the known list of name variants
     # Creates a new array of module names
-    def check_module_name(self, module_name):
+    # python_version: the Python we're building for, standard library modules for it are dropped
+    def check_module_name(self, module_name, python_version=None):
         # module_name = ['jinja2', 'os', 'json', 'logging', 're', 'hashlib', 'hmac', 'random', 'string', 'time', 'google.appengine.ext', 'google.appengine.api', 'blog_main', 'webapp2', 'google.appengine.ext', 'datetime', 'logging', 'json']
-        f = open('./helpers/ref_files/module_link.json')
-        known_modules = json.load(f)
-        module_list = []
         if type(module_name) == str:
             module_name = [module_name]
 
-        for module in module_name:
-            if '.' in module:
-                module = module.split('.')[0]
-            
-            module = module.replace(';', '').replace(',', '')
-            
-            if module.lower() in known_modules:
-                module_list.append(known_modules[module.lower()]['ref'])
-            else:
-                module_list.append(module.lower())
+        # Check the standard library before resolving, resolving lowercases names like ConfigParser
+        module_name = [module for module in module_name if not self.deps.is_module_in_standard_library(self.resolver.clean(module), python_version)]
+
+        module_list = self.resolver.resolve_many(module_name)
 
-        module_list = self.deps.clean_deps(module_list)
+        module_list = self.deps.clean_deps(module_list, python_version)
 
         return module_list
 
 
-    # Calls the PyPIJSON module to get a list of all a modules versions
-    # Returns the request meta data
+    # Gets the PyPI metadata for a module, served from the shared cache where possible
+    # Returns the request meta data in the same shape as PyPIJSON
     def query_module(self, module_name):
         try:
-            with PyPIJSON() as client:
-                requests_metadata = client.get_metadata(module_name)
-            return requests_metadata
+            data = self.cache.get_json(f"pypi/{module_name}/json")
+            if not data: return None
+            return ProjectMetadata(**{key: data[key] for key in data if key in ProjectMetadata._fields})
         except Exception as e:
+            if self.logging: print(f"Unable to query {module_name}: {e}")
             return None
 
 
-    def find_modules(self, module_name, start_date, end_date, python_version):
+    # Parses a module's releases into a columnar index, once per process
+    def get_release_index(self, module_name):
+        if module_name in self.release_indexes:
+            return self.release_indexes[module_name]
+
         dpq = self.query_module(module_name)
-        stored = []
-
-        if not dpq: return stored
-
-        modules_releases = dpq.releases
-        latest_release = {'version': '', 'date': datetime.strptime('1981-10-02', self.date_format).date()}
-
-        # If the module has 5 or less releases, then we take all regardless of date
-        small_repo =  len(modules_releases) <= 5
-
-        for ele in modules_releases:
-            if self.logging: print(ele)
-            if len(modules_releases) > 0:
-                release = modules_releases[ele]
-                if len(release) > 0:
-                    store = None
-                    for release_details in release:
-                        if not store:
-                            if not release_details['yanked']:
-                                upload_time = datetime.strptime(release_details['upload_time'].split('T')[0], '%Y-%m-%d').date()
-                                store = {}
-                                
-                                # Start block!
-                                # If the releases in the module are less than equal to 5 then we store them all
-                                if small_repo:
-                                    store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-
-                                # Typical block
-                                # Store anything that's within our timeframe
-                                if upload_time >= start_date and upload_time <= end_date:
-                                    store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-                                elif self.get_version_from_code(release_details['python_version']) == python_version:
-                                    store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-                                    if self.logging: print(f"{module_name} with {release_details['python_version']}: found outside date {start_date} -> {end_date}: {store}")
-                                elif 'py2' in release_details['python_version'] and '2.' in python_version:
-                                    store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-                                elif 'py3' in release_details['python_version'] and '3.' in python_version:
-                                    store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-                                # elif upload_time > end_date and len(stored) <= 0:
-                                #     store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-                                elif 'source' in release_details['python_version'] and len(stored) <= 20:
-                                    store = {'version': ele, 'date': upload_time.strftime(self.output_date_format)}
-
-                                # Make sure we always store the latest version
-                                if upload_time >= latest_release['date']:
-                                    latest_release = {'version': ele, 'date': upload_time}
-
-                    if store: stored.append(store)
-    
-        if self.logging: print(f"start date: {start_date} | end date: {end_date}")
-        
-        if len(stored) == 0:
-            latest_release['date'] = latest_release['date'].strftime(self.output_date_format)
-            stored.append(latest_release)
-        
+        index = ReleaseIndex(dpq.releases, self.get_version_from_code) if dpq and dpq.releases else None
+        self.revisions[module_name] = dpq.last_serial if dpq else None
+        self.release_indexes[module_name] = index
+        return index
+
+    # Candidate versions of a module for a Python version, from the shared store when
+    # it already holds a list for the module's current metadata revision
+    def get_candidates(self, module_name, start_date, end_date, python_version):
+        index = self.get_release_index(module_name)
+        revision = self.revisions[module_name]
+        if revision is not None:
+            versions = self.candidates.get(module_name, python_version, revision)
+            if versions is not None:
+                return versions
+
+        # Sorted oldest to newest by PEP 440
+        versions = VersionStore(module['version'] for module in self.find_modules(module_name, start_date, end_date, python_version))
+        if revision is not None:
+            self.candidates.put(module_name, python_version, revision, versions)
+        return versions
+
+    # Gets the checker for what a python:X.Y image can install
+    def get_checker(self, python_version):
+        if python_version not in self.checkers:
+            full_version = next((x['latest'] for x in self.python_versions if x['cycle'] == python_version), None)
+            self.checkers[python_version] = CompatibilityChecker(python_version, full_version)
+        return self.checkers[python_version]
+
+    def find_modules(self, module_name, start_date, end_date, python_version):
+        index = self.get_release_index(module_name)
+
+        if not index: return []
+
+        # Only keep versions with a file the target image can install
+        installable = index.installable(self.get_checker(python_version))
+        stored, removed = index.query(start_date, end_date, python_version, self.output_date_format, installable)
+        self.removed_candidates[(module_name, python_version)] = removed
+        if self.logging: print(f"start date: {start_date} | end date: {end_date} | {module_name}: removed {removed} uninstallable versions")
+
         return stored
 
+    # The release of a module a snippet written on a date would have used: the newest one
+    # uploaded by then that the python:X.Y image can install. Only reads the cached release index
+    def as_of(self, module_name, on_date, python_version):
+        index = self.get_release_index(module_name)
+        if not index: return None
+        return index.as_of(on_date, index.installable(self.get_checker(python_version)))
+
     def get_module_specifics(self, module_details={}):
         if self.logging: print(module_details)
         start_date, end_date, python_version = self.get_python_dates(module_details['python_version'])
         
         # Update the Python modules with exact install names
-        python_modules = self.check_module_name(module_details['python_modules'])
+        python_modules = self.check_module_name(module_details['python_modules'], python_version)
         # Filter further through PyPi to create a curated list
         modified_modules = []
 
+        # Fetch and filter every dependency concurrently
+        # map hands the results back in the same order as python_modules
+        with ThreadPoolExecutor(max_workers=min(self.fetch_workers, max(1, len(python_modules)))) as executor:
+            found_modules = list(executor.map(lambda dep: self.get_candidates(dep, start_date, end_date, python_version), python_modules))
 
-        # Function to split version strings and convert each part to an integer
-        def version_key(version):
-            # Split by '.' and convert numeric parts to integers. Handle non-numeric parts (e.g., '4.0.30b1') by keeping them as strings.
-            return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
-
-
-        for dep in python_modules:
-            modules = self.find_modules(dep, start_date, end_date, python_version)
-            module_versions = []
-            if len(modules) > 0:
-                # module_details = f"Module name: {dep}, Python version: {python_version}, Module versions: ["
-                # module_details = f"Module versions: ["
-                for idx, module in enumerate(modules):
-                    # if idx > 0: module_details += ", "
-                    # module_details += f"{module['version']} ({module['date']})"
-                    # module_details += f"{module['version']}"
-                    module_versions.append(module['version'])
-                # module_details += "]"
-                # if self.logging: print(module_details)
-            
+        for dep, module_versions in zip(python_modules, found_modules):
+            if self.logging: print(f"{dep}: {module_versions}")
             modified_modules.append(dep)
-            module_versions.sort(key=version_key)
-            with open(f"{self.base_modules}/{dep}_{python_version}.txt", "w") as outfile:
-                # outfile.write(f"Module versions: [")
-                outfile.write(', '.join(module_versions))
-                # outfile.write("]")
-                # module_details = f"Module versions: ["
-                
-                # outfile.write(module_details)
+
+        if self.logging: print(f"PyPI cache hit rate: {self.cache.hit_rate():.1%} {self.cache.counters}")
 
         return modified_modules, python_version
 
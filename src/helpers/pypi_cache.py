@@ -0,0 +1,207 @@
+# Persistent cache for the PyPI JSON API
+# A single SQLite file is shared by every process and snippet, so a package
+# is only downloaded once per TTL no matter how many gists import it.
+import argparse
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Where all of the shared caches live, relative to src/ unless overridden
+CACHE_DIR = os.environ.get('PLLM_CACHE_DIR', './cache')
+# Root of the index we query, pypi.org unless overridden
+# Point this at a snapshot server (helpers/pypi_snapshot.py) for network-free runs
+PYPI_URL = os.environ.get('PLLM_PYPI_URL', 'https://pypi.org').rstrip('/')
+
+# Counts kept in memory before they're written to the shared stats table
+FLUSH_EVERY = 500
+
+# Every cache opened by this process, so their counts can be flushed when a run ends
+open_caches = []
+
+# Writes every cache's counts. atexit covers runs that exit normally, processes that end with os._exit
+# like multiprocessing workers never run it and have to call this themselves, as end_test does
+def flush_all():
+    for cache in open_caches:
+        cache.flush()
+
+atexit.register(flush_all)
+
+class PyPICache:
+
+    def __init__(self, cache_file=None, ttl=86400, negative_ttl=3600, timeout=30, pool_size=8, index_url=None, logging=False) -> None:
+        self.logging = logging
+        self.index_url = index_url.rstrip('/') if index_url else PYPI_URL
+        # Successful responses are trusted for a day, 404s for an hour
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.cache_file = cache_file if cache_file else self.default_cache_file()
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        # Counters for this process, the persistent totals live in the stats table
+        self.counters = {'hit': 0, 'negative_hit': 0, 'revalidated': 0, 'miss': 0, 'stale': 0}
+        # Counts not yet in the stats table, written in one go so a cache hit never takes the write lock
+        self.unflushed = {}
+        # The fetch threads count at the same time
+        self.lock = threading.Lock()
+        open_caches.append(self)
+        # Keep-alive connections, sized so each fetch worker can hold one open
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.create_tables()
+
+    # Each index gets its own file so snapshot responses never mix with pypi.org ones
+    def default_cache_file(self):
+        host = urlparse(self.index_url).netloc
+        if host == 'pypi.org':
+            return f"{CACHE_DIR}/pypi_metadata.sqlite"
+        return f"{CACHE_DIR}/pypi_metadata_{re.sub(r'[^A-Za-z0-9.-]', '_', host)}.sqlite"
+
+    # Opens a new connection for every operation
+    # SQLite connections can't be shared across forked processes or threads
+    def connect(self):
+        return sqlite3.connect(self.cache_file, timeout=60)
+
+    def create_tables(self):
+        with self.connect() as conn:
+            # WAL lets readers carry on while another process is writing
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, status INTEGER, etag TEXT, body BLOB, fetched_at REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+
+    # Bumps a counter locally, the shared stats table catches up on flush()
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+            self.unflushed[name] = self.unflushed.get(name, 0) + 1
+            pending = sum(self.unflushed.values())
+        if pending >= FLUSH_EVERY: self.flush()
+
+    # Adds the counts since the last flush to the shared stats table, at the end of a run
+    def flush(self):
+        with self.lock:
+            counts, self.unflushed = self.unflushed, {}
+        if not counts: return
+        try:
+            with self.connect() as conn:
+                conn.executemany('INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?', [(name, value, value) for name, value in counts.items()])
+        except sqlite3.Error as e:
+            if self.logging: print(f"Unable to update cache stats: {e}")
+
+    def read(self, key):
+        with self.connect() as conn:
+            return conn.execute('SELECT status, etag, body, fetched_at FROM metadata WHERE key = ?', (key,)).fetchone()
+
+    def write(self, key, status, etag, body):
+        blob = zlib.compress(body) if body is not None else None
+        with self.connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO metadata (key, status, etag, body, fetched_at) VALUES (?, ?, ?, ?, ?)', (key, status, etag, blob, time.time()))
+
+    def touch(self, key):
+        with self.connect() as conn:
+            conn.execute('UPDATE metadata SET fetched_at = ? WHERE key = ?', (time.time(), key))
+
+    # Get the JSON for a path on the index, e.g. 'pypi/requests/json'
+    # Returns the decoded JSON or None if the project doesn't exist
+    def get_json(self, path):
+        key = path.strip('/')
+        row = self.read(key)
+
+        if row:
+            status, etag, body, fetched_at = row
+            age = time.time() - fetched_at
+            if status == 404 and age < self.negative_ttl:
+                self.count('negative_hit')
+                return None
+            if status == 200 and age < self.ttl:
+                self.count('hit')
+                return json.loads(zlib.decompress(body))
+
+        # Revalidate with the ETag we have, PyPI answers 304 if nothing changed
+        headers = {}
+        if row and row[0] == 200 and row[1]:
+            headers['If-None-Match'] = row[1]
+
+        try:
+            response = self.session.get(f"{self.index_url}/{key}", headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if self.logging: print(f"Unable to reach the index for {key}: {e}")
+            # Serve stale data rather than nothing when the network is down
+            if row and row[0] == 200:
+                self.count('stale')
+                return json.loads(zlib.decompress(row[2]))
+            return None
+
+        if response.status_code == 304 and row:
+            self.touch(key)
+            self.count('revalidated')
+            return json.loads(zlib.decompress(row[2]))
+        elif response.status_code == 404:
+            self.write(key, 404, None, None)
+            self.count('miss')
+            return None
+        elif response.status_code == 200:
+            self.write(key, 200, response.headers.get('ETag'), response.content)
+            self.count('miss')
+            return response.json()
+
+        if self.logging: print(f"Unexpected status {response.status_code} for {key}")
+        if row and row[0] == 200:
+            self.count('stale')
+            return json.loads(zlib.decompress(row[2]))
+        return None
+
+    # Hit rate, either for this process or across every process using the cache
+    def hit_rate(self, persistent=False):
+        counters = self.stats() if persistent else self.counters
+        served = counters.get('hit', 0) + counters.get('negative_hit', 0) + counters.get('revalidated', 0)
+        total = served + counters.get('miss', 0) + counters.get('stale', 0)
+        return served / total if total > 0 else 0.0
+
+    def stats(self):
+        self.flush()
+        with self.connect() as conn:
+            return {name: value for name, value in conn.execute('SELECT name, value FROM stats')}
+
+    def clear(self):
+        with self.lock:
+            self.unflushed = {}
+        with self.connect() as conn:
+            conn.execute('DELETE FROM metadata')
+            conn.execute('DELETE FROM stats')
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Inspect the shared PyPI metadata cache')
+    parser.add_argument('-c', '--cache', type=str, nargs="?", default=None, help="Path to the cache file, defaults to ./cache/pypi_metadata.sqlite")
+    parser.add_argument('--clear', action="store_true", help="Remove all cached responses and counters")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    cache = PyPICache(cache_file=args.cache)
+    if args.clear:
+        cache.clear()
+        print('Cache cleared')
+        return
+
+    stats = cache.stats()
+    with cache.connect() as conn:
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM metadata').fetchone()
+    print(f"Entries: {entries} ({size / 1024 / 1024:.1f} MB compressed)")
+    for name in cache.counters:
+        print(f"{name}: {stats.get(name, 0)}")
+    print(f"Hit rate: {cache.hit_rate(persistent=True):.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# Snapshot of the parts of PyPI a corpus needs, plus a local server for it
+# 'record' stores the JSON API responses and the distribution files a set of
+# packages and everything they pull in need. 'serve' answers the JSON API
+# (/pypi/<name>/json) and the simple API (/simple/<name>/) from that snapshot,
+# so PyPIQuery and the generated Dockerfiles can run without reaching pypi.org.
+#
+#   python -m helpers.pypi_snapshot record -r corpus.txt -p 2.7 3.8
+#   python -m helpers.pypi_snapshot serve --port 8080
+#   PLLM_PYPI_URL=http://localhost:8080 python test_executor.py ... --docker-index http://host.docker.internal:8080
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from packaging.utils import canonicalize_name
+
+from helpers.compatibility import CompatibilityChecker
+from helpers.dependency_graph import DependencyGraph
+from helpers.py_pi_query import PyPIQuery
+from helpers.pypi_cache import CACHE_DIR, PyPICache
+from helpers.version_store import VersionStore
+
+SNAPSHOT_DIR = f"{CACHE_DIR}/snapshot"
+
+# Python the dependencies are followed on when no versions are given
+DEFAULT_PYTHON = '3.8'
+
+# Project names as PEP 508 allows them, and what a version or file name in a path can hold
+# Anything else, '..' and '/' included, is never looked up on disk
+NAME = re.compile(r'^([A-Z0-9]|[A-Z0-9][A-Z0-9._-]*[A-Z0-9])$', re.IGNORECASE)
+SEGMENT = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._+!-]*$')
+
+class PyPISnapshot:
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, index_url='https://pypi.org', logging=False) -> None:
+        self.logging = logging
+        self.snapshot_dir = snapshot_dir
+        os.makedirs(f"{snapshot_dir}/json", exist_ok=True)
+        os.makedirs(f"{snapshot_dir}/files", exist_ok=True)
+        # Recording always reads from the real index
+        self.cache = PyPICache(index_url=index_url, logging=logging)
+
+    def project_file(self, name):
+        return f"{self.snapshot_dir}/json/{canonicalize_name(name)}.json"
+
+    def release_file(self, name, version):
+        return f"{self.snapshot_dir}/json/{canonicalize_name(name)}/{version}.json"
+
+    def dist_file(self, filename):
+        return f"{self.snapshot_dir}/files/{os.path.basename(filename)}"
+
+    def atomic_write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    # Downloads a distribution file and checks it against the digest PyPI gave us
+    def download(self, details):
+        path = self.dist_file(details['filename'])
+        if os.path.isfile(path): return False
+
+        response = self.cache.session.get(details['url'], timeout=300)
+        response.raise_for_status()
+        expected = details.get('digests', {}).get('sha256')
+        if expected and hashlib.sha256(response.content).hexdigest() != expected:
+            raise ValueError(f"Digest mismatch for {details['filename']}")
+        self.atomic_write(path, response.content)
+        return True
+
+    # Records a project's metadata and the files the given Python versions could install
+    # versions: the versions to keep files for, all releases if None
+    # max_versions: keep files for at most this many versions, evenly spaced, only when no versions are given
+    # Returns the versions recorded and how many files were downloaded
+    def record_project(self, name, versions=None, python_versions=(), max_versions=None):
+        data = self.cache.get_json(f"pypi/{name}/json")
+        if not data:
+            print(f"{name} is not on the index, skipping")
+            return [], 0
+        self.atomic_write(self.project_file(name), json.dumps(data).encode('utf-8'))
+
+        releases = data.get('releases') or {}
+        store = VersionStore(versions if versions else releases)
+        selected = list(store)
+        # Pinned versions are always kept, the limit only thins out whole release histories
+        if max_versions and not versions and len(store) > max_versions:
+            selected = store.evenly_spaced(max_versions)
+
+        checkers = [CompatibilityChecker(python_version, full_version) for python_version, full_version in python_versions]
+        selected = [version for version in selected if version in releases]
+        downloaded = 0
+        for version in selected:
+            release = self.cache.get_json(f"pypi/{name}/{version}/json")
+            if release:
+                self.atomic_write(self.release_file(name, version), json.dumps(release).encode('utf-8'))
+
+            for details in releases[version]:
+                if details['yanked']: continue
+                if checkers and not any(checker.installable(details['filename'], details.get('requires_python')) for checker in checkers):
+                    continue
+                try:
+                    if self.download(details): downloaded += 1
+                except Exception as e:
+                    print(f"Unable to download {details['filename']}: {e}")
+
+        if self.logging: print(f"{name}: {len(selected)} versions, {downloaded} new files")
+        return selected, downloaded
+
+    # Records every requirement in a corpus and the releases they pull in, lines are 'name' or 'name==version'
+    # Requirements are followed through the release pip would pick on each Python version, until nothing new turns up
+    def record(self, requirements, python_versions=(), max_versions=None):
+        pins = {}
+        for requirement in requirements:
+            requirement = requirement.split('#')[0].strip()
+            if not requirement: continue
+            name, _, version = requirement.partition('==')
+            pins.setdefault(name.strip(), [])
+            if version: pins[name.strip()].append(version.strip())
+
+        # The graph reads the same index we record from
+        query = PyPIQuery(logging=self.logging)
+        query.cache = self.cache
+        graph = DependencyGraph(query, logging=self.logging)
+        walk_versions = [python_version for python_version, _ in python_versions] or [DEFAULT_PYTHON]
+
+        total = 0
+        projects = set()
+        seen = set()
+        level = {name: versions or None for name, versions in pins.items()}
+        while level:
+            next_level = {}
+            for name, versions in level.items():
+                recorded, downloaded = self.record_project(name, versions, python_versions, max_versions)
+                total += downloaded
+                projects.add(canonicalize_name(name))
+                releases = [(canonicalize_name(name), version) for version in recorded if (canonicalize_name(name), version) not in seen]
+                seen.update(releases)
+                graph.ensure(releases)
+                for release in releases:
+                    for python_version in walk_versions:
+                        for dep, specifier in graph.requirements(*release, python_version).items():
+                            picked = graph.pick(dep, specifier, python_version)
+                            if picked is not None and (dep, picked) not in seen:
+                                next_level.setdefault(dep, []).append(picked)
+            level = {name: list(dict.fromkeys(versions)) for name, versions in next_level.items()}
+        print(f"Recorded {len(projects)} projects, {len(pins)} from the corpus, {total} new files")
+        return total
+
+    # The list of projects in the snapshot
+    def projects(self):
+        return sorted(file_name[:-5] for file_name in os.listdir(f"{self.snapshot_dir}/json") if file_name.endswith('.json'))
+
+    def load(self, path):
+        if not os.path.isfile(path): return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+# Answers the JSON and simple APIs from a snapshot
+class SnapshotHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        snapshot = self.server.snapshot
+        parts = [unquote(part) for part in urlparse(self.path).path.split('/') if part]
+        if not self.valid(parts): return self.send_error(404)
+        base_url = f"http://{self.headers.get('Host', 'localhost')}"
+
+        if len(parts) in (3, 4) and parts[0] == 'pypi' and parts[-1] == 'json':
+            path = snapshot.project_file(parts[1]) if len(parts) == 3 else snapshot.release_file(parts[1], parts[2])
+            data = snapshot.load(path)
+            if data is None: return self.send_error(404)
+            self.rewrite_urls(data, base_url)
+            return self.respond(json.dumps(data).encode('utf-8'), 'application/json')
+        elif len(parts) == 1 and parts[0] == 'simple':
+            links = ''.join(f'<a href="/simple/{name}/">{name}</a><br/>\n' for name in snapshot.projects())
+            return self.respond(self.page('Simple index', links), 'text/html')
+        elif len(parts) == 2 and parts[0] == 'simple':
+            name = canonicalize_name(parts[1])
+            data = snapshot.load(snapshot.project_file(name))
+            if data is None: return self.send_error(404)
+            return self.respond(self.page(f"Links for {name}", self.simple_links(snapshot, data)), 'text/html')
+        elif len(parts) == 2 and parts[0] == 'files':
+            path = snapshot.dist_file(parts[1])
+            if not os.path.isfile(path): return self.send_error(404)
+            with open(path, 'rb') as f:
+                return self.respond(f.read(), 'application/octet-stream')
+
+        self.send_error(404)
+
+    # Only a project name and then versions or file names may reach the snapshot folder
+    def valid(self, parts):
+        if len(parts) >= 2 and parts[0] in ('pypi', 'simple'):
+            return NAME.match(parts[1]) is not None and all(SEGMENT.match(part) for part in parts[2:])
+        return all(SEGMENT.match(part) for part in parts)
+
+    # Points the file urls at this server
+    def rewrite_urls(self, data, base_url):
+        files = list(data.get('urls') or [])
+        for release in (data.get('releases') or {}).values():
+            files.extend(release)
+        for details in files:
+            details['url'] = f"{base_url}/files/{details['filename']}"
+
+    # PEP 503 links, only for files we actually have
+    def simple_links(self, snapshot, data):
+        links = ''
+        for version, release in (data.get('releases') or {}).items():
+            for details in release:
+                if not os.path.isfile(snapshot.dist_file(details['filename'])): continue
+                sha = details.get('digests', {}).get('sha256')
+                href = f"/files/{details['filename']}" + (f"#sha256={sha}" if sha else '')
+                requires_python = details.get('requires_python')
+                attribute = f' data-requires-python="{html.escape(requires_python)}"' if requires_python else ''
+                links += f'<a href="{html.escape(href)}"{attribute}>{html.escape(details["filename"])}</a><br/>\n'
+        return links
+
+    def page(self, title, body):
+        return f"<!DOCTYPE html>\n<html><head><title>{title}</title></head><body>\n{body}</body></html>\n".encode('utf-8')
+
+    def respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.logging: super().log_message(format, *args)
+
+class SnapshotServer(ThreadingHTTPServer):
+
+    def __init__(self, snapshot, host='0.0.0.0', port=8080, logging=False) -> None:
+        self.snapshot = snapshot
+        self.logging = logging
+        super().__init__((host, port), SnapshotHandler)
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Record or serve a PyPI snapshot')
+    parser.add_argument('mode', choices=['record', 'serve'], help="Record a corpus or serve a recorded snapshot")
+    parser.add_argument('-s', '--snapshot', type=str, nargs="?", default=SNAPSHOT_DIR, const=SNAPSHOT_DIR, help="Snapshot folder, defaults to ./cache/snapshot")
+    parser.add_argument('-r', '--requirements', type=str, help="File with one 'name' or 'name==version' per line to record")
+    parser.add_argument('-p', '--python', type=str, nargs="*", default=[], help="Only keep files installable on these Python versions, e.g. 2.7 3.8")
+    parser.add_argument('-n', '--max-versions', type=int, default=None, help="Keep files for at most this many versions per unpinned project")
+    parser.add_argument('--host', type=str, default='0.0.0.0', help="Address to serve on")
+    parser.add_argument('--port', type=int, default=8080, help="Port to serve on")
+    parser.add_argument('-v', '--verbose', action="store_true", help="Verbose logging of information")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    snapshot = PyPISnapshot(snapshot_dir=args.snapshot, logging=args.verbose)
+
+    if args.mode == 'record':
+        with open('helpers/ref_files/python_versions.json') as f:
+            latest = {x['cycle']: x['latest'] for x in json.load(f)}
+        with open(args.requirements) as f:
+            requirements = f.readlines()
+        snapshot.record(requirements, [(version, latest.get(version)) for version in args.python], args.max_versions)
+    else:
+        server = SnapshotServer(snapshot, args.host, args.port, logging=args.verbose)
+        print(f"Serving {args.snapshot} on http://{args.host}:{args.port} (simple index at /simple/)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Columnar index over a package's PyPI releases
+# Every release file is parsed once into NumPy arrays so that picking the
+# candidate versions for any Python version is a handful of vectorised
+# comparisons rather than a strptime per file.
+from datetime import date, datetime
+
+import numpy as np
+from packaging.version import InvalidVersion, Version
+
+EPOCH = date(1970, 1, 1).toordinal()
+
+# Converts a date (or 'YYYY-MM-DD' string) to days since the epoch
+def to_epoch_day(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.toordinal() - EPOCH
+
+def from_epoch_day(day):
+    return date.fromordinal(int(day) + EPOCH)
+
+class ReleaseIndex:
+
+    # releases: the 'releases' mapping from the PyPI JSON API
+    # tag_version: converts a file's python_version tag (e.g. cp27) to a Python version (e.g. 2.7)
+    def __init__(self, releases, tag_version) -> None:
+        self.versions = list(releases)
+        release_ids = []
+        upload_times = []
+        tags = []
+        yanked = []
+        filenames = []
+        requires_python = []
+
+        for release_id, version in enumerate(self.versions):
+            for details in releases[version]:
+                release_ids.append(release_id)
+                upload_times.append(details['upload_time'][:10])
+                tags.append(details['python_version'])
+                yanked.append(details['yanked'])
+                filenames.append(details['filename'])
+                requires_python.append(details.get('requires_python') or '')
+
+        # One row per file, in the order PyPI lists them
+        self.release_id = np.array(release_ids, dtype=np.int32)
+        self.upload_day = np.array(upload_times, dtype='datetime64[D]').astype(np.int32)
+        self.yanked = np.array(yanked, dtype=bool)
+
+        # Tags are stored once and referenced by code
+        self.tag_names = sorted(set(tags))
+        codes = {tag: idx for idx, tag in enumerate(self.tag_names)}
+        self.tag_codes = np.array([codes[tag] for tag in tags], dtype=np.int16)
+        self.py2 = np.array(['py2' in tag for tag in self.tag_names] + [False], dtype=bool)[self.tag_codes]
+        self.py3 = np.array(['py3' in tag for tag in self.tag_names] + [False], dtype=bool)[self.tag_codes]
+        self.source = np.array(['source' in tag for tag in self.tag_names] + [False], dtype=bool)[self.tag_codes]
+        self.tag_versions = [tag_version(tag) for tag in self.tag_names]
+
+        # Kept for the compatibility checks, specifiers are mostly shared between releases
+        self.filenames = filenames
+        self.requires_python_names = sorted(set(requires_python))
+        codes = {spec: idx for idx, spec in enumerate(self.requires_python_names)}
+        self.requires_python_codes = np.array([codes[spec] for spec in requires_python], dtype=np.int32)
+        # Installable release masks, keyed by the Python version they were checked against
+        self.installable_masks = {}
+
+    def __len__(self):
+        return len(self.versions)
+
+    # Mask of files whose tag maps exactly to the given Python version
+    def tag_mask(self, python_version):
+        codes = [idx for idx, version in enumerate(self.tag_versions) if version == python_version]
+        return np.isin(self.tag_codes, codes)
+
+    # Per release: does any file in the mask belong to it
+    def any_per_release(self, file_mask):
+        return np.bincount(self.release_id[file_mask], minlength=len(self)) > 0
+
+    # Per release: can any non-yanked file be installed by the given CompatibilityChecker
+    def installable(self, checker):
+        if checker.python_version not in self.installable_masks:
+            specs_ok = np.array([checker.requires_python_ok(spec) for spec in self.requires_python_names] + [False], dtype=bool)
+            files_ok = np.array([checker.file_ok(filename) for filename in self.filenames], dtype=bool)
+            files_ok &= specs_ok[self.requires_python_codes] & ~self.yanked
+            self.installable_masks[checker.python_version] = self.any_per_release(files_ok)
+        return self.installable_masks[checker.python_version]
+
+    # File index of the newest non-yanked upload, ties go to the later file as in the original loop
+    def latest(self, installable=None):
+        mask = ~self.yanked
+        if installable is not None and (mask & installable[self.release_id]).any():
+            mask &= installable[self.release_id]
+        valid = np.flatnonzero(mask)
+        if len(valid) == 0: return None
+        days = self.upload_day[valid]
+        return valid[len(days) - 1 - int(np.argmax(days[::-1]))]
+
+    # Day each release was first uploaded, later files (e.g. new wheels for an old release) don't move it
+    def first_upload_day(self):
+        days = np.full(len(self), np.iinfo(np.int32).max, dtype=np.int32)
+        np.minimum.at(days, self.release_id, self.upload_day)
+        return days
+
+    # The newest release (by version) first uploaded on or before a date, None if there isn't one
+    # installable: optional per release mask, releases outside it are skipped
+    # Pre-releases are only used when there is nothing else
+    def as_of(self, on_date, installable=None):
+        mask = (self.first_upload_day() <= to_epoch_day(on_date)) & self.any_per_release(~self.yanked)
+        if installable is not None: mask &= installable
+        best = None
+        for release in np.flatnonzero(mask):
+            try:
+                version = Version(self.versions[release])
+            except InvalidVersion:
+                continue
+            key = (not version.is_prerelease, version)
+            if best is None or key > best[0]: best = (key, self.versions[release])
+        return best[1] if best else None
+
+    # Mask of files that would select their release for the given Python version and date window
+    def candidate_files(self, start_date, end_date, python_version):
+        valid = ~self.yanked
+        # Packages with 5 or less releases are taken regardless of date
+        if len(self) <= 5:
+            return valid
+
+        in_window = (self.upload_day >= to_epoch_day(start_date)) & (self.upload_day <= to_epoch_day(end_date))
+        matched = in_window | self.tag_mask(python_version)
+        if '2.' in python_version: matched |= self.py2
+        if '3.' in python_version: matched |= self.py3
+        matched &= valid
+
+        # Source files only count while 20 or fewer releases have been stored before theirs.
+        # The running count never drops, so a cumulative count over every release that
+        # could be stored gives the same answer as the sequential loop.
+        matched_release = self.any_per_release(matched)
+        taken = matched_release | self.any_per_release(valid & self.source)
+        stored_before = np.cumsum(taken) - taken
+        allowed = stored_before <= 20
+
+        return matched | (valid & self.source & allowed[self.release_id])
+
+    # The list of {'version', 'date'} candidates, in release order
+    # The date is taken from the first file that selected the release
+    # installable: optional per release mask, candidates outside it are dropped
+    # Returns the candidates and how many were dropped as not installable
+    def query(self, start_date, end_date, python_version, date_format='%b %d %Y', installable=None):
+        file_mask = self.candidate_files(start_date, end_date, python_version)
+        removed = 0
+        # If no release at all looks installable we trust the original heuristics over the checker
+        if installable is not None and installable.any():
+            removed = int(np.count_nonzero(self.any_per_release(file_mask) & ~installable))
+            file_mask = file_mask & installable[self.release_id]
+
+        files = np.flatnonzero(file_mask)
+        releases, first = np.unique(self.release_id[files], return_index=True)
+        stored = [{'version': self.versions[release], 'date': from_epoch_day(self.upload_day[files[idx]]).strftime(date_format)} for release, idx in zip(releases, first)]
+
+        # Always hand back at least the latest (installable) release
+        # When every file is yanked there isn't one, the old loop gave a placeholder with an empty version here
+        if len(stored) == 0:
+            latest = self.latest(installable)
+            if latest is not None:
+                stored.append({'version': self.versions[self.release_id[latest]], 'date': from_epoch_day(self.upload_day[latest]).strftime(date_format)})
+
+        return stored, removed
@@ -0,0 +1,165 @@
+# Standard library module names for each Python we build
+# The host interpreter can't tell us what was in 2.7 or 3.6, so the names are
+# kept in ref_files/stdlib_modules.json, one table per cycle in
+# python_versions.json. The tables were generated once with --generate from the
+# host's sys.stdlib_module_names, the version changes below and the Python 2 list.
+import argparse
+import json
+import re
+import sys
+
+from packaging.version import Version
+
+STDLIB_FILE = './helpers/ref_files/stdlib_modules.json'
+PYTHON_VERSIONS_FILE = './helpers/ref_files/python_versions.json'
+
+# Top-level modules added after 3.0, and the version that added them
+ADDED = {
+    'faulthandler': '3.3', 'ipaddress': '3.3', 'lzma': '3.3', 'venv': '3.3',
+    'asyncio': '3.4', 'enum': '3.4', 'ensurepip': '3.4', 'pathlib': '3.4', 'selectors': '3.4', 'statistics': '3.4', 'tracemalloc': '3.4',
+    'typing': '3.5', 'zipapp': '3.5',
+    'secrets': '3.6',
+    'contextvars': '3.7', 'dataclasses': '3.7',
+    'graphlib': '3.9', 'zoneinfo': '3.9',
+    'tomllib': '3.11',
+}
+
+# Modules removed from Python 3, and the version that removed them
+REMOVED = {
+    'fpectl': '3.7',
+    'macpath': '3.8',
+    '_dummy_thread': '3.9', 'dummy_threading': '3.9',
+    'formatter': '3.10', 'parser': '3.10', 'symbol': '3.10',
+    'binhex': '3.11',
+    'asynchat': '3.12', 'asyncore': '3.12', 'distutils': '3.12', 'imp': '3.12', 'smtpd': '3.12',
+}
+
+# Python 2.7, from the module index
+PY27_MODULES = [
+    '__builtin__', '__future__', '__main__', '_abcoll', '_ast', '_bisect', '_codecs', '_collections', '_csv', '_functools',
+    '_heapq', '_io', '_json', '_locale', '_lsprof', '_md5', '_osx_support', '_pyio', '_random', '_socket', '_sre', '_ssl',
+    '_strptime', '_struct', '_symtable', '_threading_local', '_warnings', '_weakref', '_weakrefset', '_winreg',
+    'abc', 'aifc', 'anydbm', 'argparse', 'array', 'ast', 'asynchat', 'asyncore', 'atexit', 'audiodev', 'audioop',
+    'base64', 'BaseHTTPServer', 'Bastion', 'bdb', 'binascii', 'binhex', 'bisect', 'bsddb', 'bz2',
+    'calendar', 'Canvas', 'cgi', 'CGIHTTPServer', 'cgitb', 'chunk', 'cmath', 'cmd', 'code', 'codecs', 'codeop',
+    'collections', 'colorsys', 'commands', 'compileall', 'compiler', 'ConfigParser', 'contextlib', 'Cookie', 'cookielib',
+    'copy', 'copy_reg', 'cPickle', 'cProfile', 'crypt', 'cStringIO', 'csv', 'ctypes', 'curses',
+    'datetime', 'dbhash', 'dbm', 'decimal', 'Dialog', 'difflib', 'dircache', 'dis', 'distutils', 'dl', 'doctest',
+    'DocXMLRPCServer', 'dumbdbm', 'dummy_thread', 'dummy_threading',
+    'email', 'encodings', 'ensurepip', 'errno', 'exceptions',
+    'fcntl', 'filecmp', 'FileDialog', 'fileinput', 'FixTk', 'fnmatch', 'formatter', 'fpectl', 'fpformat', 'fractions',
+    'ftplib', 'functools', 'future_builtins',
+    'gc', 'gdbm', 'genericpath', 'getopt', 'getpass', 'gettext', 'glob', 'grp', 'gzip',
+    'hashlib', 'heapq', 'hmac', 'hotshot', 'htmlentitydefs', 'htmllib', 'HTMLParser', 'httplib',
+    'ihooks', 'imageop', 'imaplib', 'imghdr', 'imp', 'importlib', 'imputil', 'inspect', 'io', 'itertools',
+    'json', 'keyword', 'lib2to3', 'linecache', 'locale', 'logging',
+    'macpath', 'mailbox', 'mailcap', 'markupbase', 'marshal', 'math', 'md5', 'mhlib', 'mimetools', 'mimetypes',
+    'MimeWriter', 'mimify', 'mmap', 'modulefinder', 'msilib', 'msvcrt', 'multifile', 'multiprocessing', 'mutex',
+    'netrc', 'new', 'nis', 'nntplib', 'ntpath', 'nturl2path', 'numbers',
+    'opcode', 'operator', 'optparse', 'os', 'os2emxpath', 'ossaudiodev',
+    'parser', 'pdb', 'pickle', 'pickletools', 'pipes', 'pkgutil', 'platform', 'plistlib', 'popen2', 'poplib', 'posix',
+    'posixfile', 'posixpath', 'pprint', 'profile', 'pstats', 'pty', 'pwd', 'py_compile', 'pyclbr', 'pydoc', 'pydoc_data',
+    'Queue', 'quopri',
+    'random', 're', 'readline', 'repr', 'resource', 'rexec', 'rfc822', 'rlcompleter', 'robotparser', 'runpy',
+    'sched', 'ScrolledText', 'select', 'sets', 'sgmllib', 'sha', 'shelve', 'shlex', 'shutil', 'signal', 'SimpleDialog',
+    'SimpleHTTPServer', 'SimpleXMLRPCServer', 'site', 'smtpd', 'smtplib', 'sndhdr', 'socket', 'SocketServer', 'spwd',
+    'sqlite3', 'sre', 'sre_compile', 'sre_constants', 'sre_parse', 'ssl', 'stat', 'statvfs', 'string', 'StringIO',
+    'stringprep', 'struct', 'subprocess', 'sunau', 'sunaudio', 'symbol', 'symtable', 'sys', 'sysconfig', 'syslog',
+    'tabnanny', 'tarfile', 'telnetlib', 'tempfile', 'termios', 'test', 'textwrap', 'thread', 'threading', 'time',
+    'timeit', 'Tix', 'Tkconstants', 'Tkdnd', 'Tkinter', 'tkColorChooser', 'tkCommonDialog', 'tkFileDialog', 'tkFont',
+    'tkMessageBox', 'tkSimpleDialog', 'toaiff', 'token', 'tokenize', 'trace', 'traceback', 'ttk', 'tty', 'turtle', 'types',
+    'unicodedata', 'unittest', 'urllib', 'urllib2', 'urlparse', 'user', 'UserDict', 'UserList', 'UserString', 'uu', 'uuid',
+    'warnings', 'wave', 'weakref', 'webbrowser', 'whichdb', 'winsound', 'wsgiref',
+    'xdrlib', 'xml', 'xmlrpclib', 'zipfile', 'zipimport', 'zlib',
+]
+
+# Added in 2.7, so missing from 2.6
+PY27_ADDED = ['_osx_support', '_pyio', '_weakrefset', 'argparse', 'ensurepip', 'importlib', 'sysconfig', 'ttk']
+
+# 'import x', 'from x', "No module named 'x'" and 'x==1.0'
+MODULE_MENTION = re.compile(r"(?:\bimport|\bfrom|No module named)\s+'?([A-Za-z_]\w*)|\b([A-Za-z_]\w*)==")
+
+# One set of tables per process
+_tables = {}
+
+def get_stdlib_tables(stdlib_file=STDLIB_FILE):
+    if stdlib_file not in _tables:
+        _tables[stdlib_file] = StdlibTables(stdlib_file)
+    return _tables[stdlib_file]
+
+class StdlibTables:
+
+    def __init__(self, stdlib_file=STDLIB_FILE) -> None:
+        with open(stdlib_file) as f:
+            tables = json.load(f)
+        self.tables = {version: frozenset(names) for version, names in tables.items()}
+        self.versions = sorted(self.tables, key=Version)
+        self.host_version = f"{sys.version_info.major}.{sys.version_info.minor}"
+
+    # The table for a Python version, the closest older one for versions we don't list
+    # None means the interpreter we're running on
+    def table(self, python_version=None):
+        python_version = str(python_version) if python_version else self.host_version
+        if python_version in self.tables:
+            return self.tables[python_version]
+        try:
+            older = [version for version in self.versions if Version(version) <= Version(python_version)]
+        except Exception:
+            older = []
+        return self.tables[older[-1] if older else self.versions[0]]
+
+    # True if the (dotted) module is part of the standard library of that Python
+    def is_stdlib(self, module, python_version=None):
+        return module.strip().split('.')[0] in self.table(python_version)
+
+    # Public stdlib modules a build log talks about, imported, missing or pinned
+    def names_in(self, text, python_version=None):
+        table = self.table(python_version)
+        words = {match.group(1) or match.group(2) for match in MODULE_MENTION.finditer(text)}
+        return sorted(word for word in words & table if not word.startswith('_'))
+
+# Builds the tables for every cycle in python_versions.json
+# Python 3 tables start from the host's names, so this needs Python 3.10+
+def generate(python_versions_file=PYTHON_VERSIONS_FILE):
+    with open(python_versions_file) as f:
+        cycles = [details['cycle'] for details in json.load(f)]
+
+    universe = set(sys.stdlib_module_names) | set(REMOVED)
+    tables = {}
+    for cycle in cycles:
+        version = Version(cycle)
+        if version.major == 2:
+            names = set(PY27_MODULES)
+            if version < Version('2.7'): names -= set(PY27_ADDED)
+        else:
+            names = {
+                name for name in universe
+                if Version(ADDED.get(name, '3.0')) <= version < Version(REMOVED.get(name, '99'))
+            }
+        tables[cycle] = sorted(names)
+    return tables
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Standard library tables per Python version')
+    parser.add_argument('-g', '--generate', action="store_true", help="Regenerate ref_files/stdlib_modules.json, run on Python 3.10+")
+    parser.add_argument('-p', '--python', type=str, nargs="?", default=None, help="Python version to look the modules up for")
+    parser.add_argument('modules', type=str, nargs="*", default=[], help="Modules to look up")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    if args.generate:
+        tables = generate()
+        with open(STDLIB_FILE, 'w') as f:
+            json.dump(tables, f, indent=1)
+            f.write('\n')
+        for version in tables:
+            print(f"{version}: {len(tables[version])} modules")
+
+    tables = get_stdlib_tables()
+    for module in args.modules:
+        print(f"{module}: {tables.is_stdlib(module, args.python)}")
+
+if __name__ == "__main__":
+    main()
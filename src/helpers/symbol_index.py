@@ -0,0 +1,379 @@
+# Which versions of a package export a module or attribute
+# Each release's wheel (or sdist when there is no wheel) is downloaded once and
+# the module level names of every .py file in it are recorded, so an
+# AttributeError or 'cannot import name' error can be answered with the
+# versions that still had the name instead of sampling Docker builds.
+#
+# Stored in a single SQLite file:
+#   releases  one row per (package, version) we've looked at, with its bit, counted per package
+#   symbols   one row per (package, dotted name), with a bitmap over the package's release bits
+# Packages are indexed incrementally, versions already in releases are skipped.
+import argparse
+import ast
+import io
+import os
+import re
+import sqlite3
+import tarfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import numpy as np
+from packaging.utils import canonicalize_name
+
+from helpers.module_resolver import get_resolver
+from helpers.pypi_cache import CACHE_DIR, PyPICache
+from helpers.version_store import VersionStore
+
+SYMBOL_FILE = f"{CACHE_DIR}/symbols.sqlite"
+
+# Releases bigger than this are recorded as skipped rather than downloaded
+MAX_DOWNLOAD = 10 * 1024 * 1024
+
+# How many releases of a package get downloaded when an error handler indexes it on demand
+# Later errors for the same package add more, spread over the versions it can still try
+MAX_RELEASES = 8
+
+# 'module 'selenium.webdriver' has no attribute 'PhantomJS'' and the Python 2 "'module' object has no attribute 'PhantomJS'"
+MISSING_ATTRIBUTE = re.compile(r"(?:module '([\w.]+)'|'module' object) has no attribute '(\w+)'")
+# "cannot import name 'X' from 'a.b'" and the Python 2 'cannot import name X'
+MISSING_NAME = re.compile(r"cannot import name '?(\w+)'?(?: from '([\w.]+)')?")
+
+# Module level names in Python 2 sources the host can't parse
+PY2_DEFINITION = re.compile(r'^(?:def|class)\s+(\w+)|^(\w+)\s*=[^=]', re.MULTILINE)
+PY2_IMPORT = re.compile(r'^(?:from\s+[\w.]+\s+)?import\s+([\w., ]+)$', re.MULTILINE)
+
+# Dotted module for a file inside a wheel or an unpacked sdist, None for files that aren't importable code
+def module_name(path):
+    parts = path.split('/')
+    if any(part.endswith(('.dist-info', '.egg-info', '.data')) for part in parts): return None
+    if parts[0] in ('src', 'lib'): parts = parts[1:]
+    if not parts or parts[0] in ('tests', 'test', 'docs', 'examples', 'setup.py'): return None
+    file_name = parts[-1]
+    if file_name.endswith('.py'):
+        stem = file_name[:-3]
+    elif file_name.endswith(('.so', '.pyd')):
+        stem = file_name.split('.')[0]
+    else:
+        return None
+    parts = parts[:-1] if stem == '__init__' else parts[:-1] + [stem]
+    if not parts or not all(part.isidentifier() for part in parts): return None
+    return '.'.join(parts)
+
+# Names a module defines at its top level: functions, classes, assignments and imports
+# Star imports can't be followed, so names only reachable through them are missed
+def module_symbols(source):
+    names = set()
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        for match in PY2_DEFINITION.finditer(source):
+            names.add(match.group(1) or match.group(2))
+        for match in PY2_IMPORT.finditer(source):
+            for alias in match.group(1).split(','):
+                words = alias.split()
+                if words: names.add(words[-1].split('.')[0])
+        return names
+
+    def add_target(target):
+        if isinstance(target, ast.Name):
+            names.add(target.id)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                add_target(element)
+
+    # Definitions inside a top level if/try (version checks, optional imports) count too
+    def visit(body):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                names.add(node.name)
+            elif isinstance(node, ast.Assign):
+                for target in node.targets:
+                    add_target(target)
+            elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+                add_target(node.target)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    names.add(alias.asname or alias.name.split('.')[0])
+            elif isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    if alias.name != '*': names.add(alias.asname or alias.name)
+            elif isinstance(node, ast.If):
+                visit(node.body)
+                visit(node.orelse)
+            elif isinstance(node, (ast.Try, getattr(ast, 'TryStar', ast.Try))):
+                visit(node.body)
+                for handler in node.handlers:
+                    visit(handler.body)
+                visit(node.orelse)
+                visit(node.finalbody)
+
+    visit(tree.body)
+    return names
+
+# Every module and module.attribute in an archive's bytes
+def archive_symbols(filename, data):
+    members = []
+    if filename.endswith(('.whl', '.zip', '.egg')):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for name in archive.namelist():
+                if name.endswith(('.py', '.so', '.pyd')):
+                    members.append((name, archive.read(name) if name.endswith('.py') else b''))
+        # sdist zips have a 'package-1.0/' root folder, wheels don't
+        strip = not filename.endswith('.whl')
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            for member in archive.getmembers():
+                if member.isfile() and member.name.endswith(('.py', '.so', '.pyd')):
+                    members.append((member.name, archive.extractfile(member).read() if member.name.endswith('.py') else b''))
+        strip = True
+
+    symbols = set()
+    for name, content in members:
+        path = name.split('/', 1)[1] if strip and '/' in name else name
+        module = module_name(path)
+        if module is None: continue
+        symbols.add(module)
+        if content:
+            source = content.decode('utf-8', errors='replace')
+            symbols.update(f"{module}.{symbol}" for symbol in module_symbols(source))
+    return symbols
+
+# The file to index for a release: a pure Python wheel, any wheel, then the sdist
+def pick_file(files):
+    def rank(details):
+        filename = details['filename']
+        if filename.endswith('-none-any.whl'): return 0
+        if filename.endswith('.whl'): return 1
+        if details.get('packagetype') == 'sdist': return 2
+        return 3
+    files = [details for details in files if rank(details) < 3 and not details.get('yanked')]
+    return min(files, key=rank) if files else None
+
+# Groups sorted versions into runs, a version missing from present ends the run
+def intervals(versions, present):
+    runs = []
+    start = None
+    previous = None
+    for version in versions:
+        if version in present:
+            if start is None: start = version
+            previous = version
+        elif start is not None:
+            runs.append((start, previous))
+            start = None
+    if start is not None: runs.append((start, previous))
+    return runs
+
+class SymbolIndex:
+
+    def __init__(self, symbol_file=SYMBOL_FILE, cache=None, workers=4, logging=False) -> None:
+        self.logging = logging
+        self.symbol_file = symbol_file
+        self.cache = cache if cache is not None else PyPICache(logging=logging)
+        self.workers = max(1, workers)
+        self.resolver = get_resolver()
+        os.makedirs(os.path.dirname(self.symbol_file) or '.', exist_ok=True)
+        self.create_tables()
+
+    # Opens a new connection for every operation, like PyPICache
+    def connect(self):
+        return sqlite3.connect(self.symbol_file, timeout=60)
+
+    def create_tables(self):
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Files from before the per package bits have bitmaps over the global rowid, they're rebuilt
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(releases)')]
+            if columns and 'bit' not in columns:
+                conn.execute('DROP TABLE releases')
+                conn.execute('DROP TABLE IF EXISTS symbols')
+            conn.execute('CREATE TABLE IF NOT EXISTS releases (id INTEGER PRIMARY KEY, package TEXT, version TEXT, bit INTEGER, status TEXT, filename TEXT, indexed_at REAL, UNIQUE (package, version))')
+            conn.execute('CREATE TABLE IF NOT EXISTS symbols (package TEXT, name TEXT, bits BLOB, PRIMARY KEY (package, name)) WITHOUT ROWID')
+
+    # {version: (bit, status)}, bits count up from 0 per package so a bitmap is as long as the package's history
+    def release_ids(self, package):
+        with self.connect() as conn:
+            return {version: (bit, status) for bit, version, status in conn.execute('SELECT bit, version, status FROM releases WHERE package = ?', (package,))}
+
+    # Snapshot servers hand out file urls relative to the JSON
+    def download(self, package, details):
+        if details.get('size', 0) > MAX_DOWNLOAD: return None
+        response = self.cache.session.get(urljoin(f"{self.cache.index_url}/pypi/{package}/json", details['url']), timeout=120)
+        response.raise_for_status()
+        return response.content
+
+    # Downloads and reads one release, returns (version, status, filename, symbols)
+    def read_release(self, package, version, files):
+        details = pick_file(files)
+        if details is None: return version, 'no-file', None, set()
+        try:
+            data = self.download(package, details)
+            if data is None: return version, 'too-big', details['filename'], set()
+            return version, 'ok', details['filename'], archive_symbols(details['filename'], data)
+        except Exception as e:
+            if self.logging: print(f"Unable to index {details['filename']}: {e}")
+            return version, 'error', details['filename'], set()
+
+    # Indexes the releases of a package we haven't seen yet
+    # versions: the versions to index, every release if None
+    # Returns how many releases were added
+    def index_package(self, package, versions=None):
+        package = canonicalize_name(package)
+        data = self.cache.get_json(f"pypi/{package}/json")
+        if not data: return 0
+        releases = data.get('releases', {})
+        known = self.release_ids(package)
+        todo = [version for version in (versions if versions is not None else releases) if version in releases and version not in known]
+        if not todo: return 0
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(todo))) as executor:
+            results = list(executor.map(lambda version: self.read_release(package, version, releases[version]), todo))
+
+        with self.connect() as conn:
+            # Sibling processes index the same packages, so the bits are allocated and set under one write lock
+            conn.execute('BEGIN IMMEDIATE')
+            stored = {name: bits for name, bits in conn.execute('SELECT name, bits FROM symbols WHERE package = ?', (package,))}
+            next_bit = conn.execute('SELECT COALESCE(MAX(bit) + 1, 0) FROM releases WHERE package = ?', (package,)).fetchone()[0]
+            changed = set()
+            for version, status, filename, symbols in results:
+                # Failed downloads are tried again next time
+                if status == 'error': continue
+                inserted = conn.execute('INSERT OR IGNORE INTO releases (package, version, bit, status, filename, indexed_at) VALUES (?, ?, ?, ?, ?, ?)', (package, version, next_bit, status, filename, time.time())).rowcount
+                # Another process got there first and set its bits already
+                if not inserted: continue
+                bit = conn.execute('SELECT bit FROM releases WHERE package = ? AND version = ?', (package, version)).fetchone()[0]
+                next_bit += 1
+                for name in symbols:
+                    stored[name] = self.set_bit(stored.get(name), bit)
+                changed.update(symbols)
+            conn.executemany('INSERT OR REPLACE INTO symbols (package, name, bits) VALUES (?, ?, ?)', [(package, name, stored[name]) for name in changed])
+
+        if self.logging: print(f"Indexed {len(todo)} releases of {package} in {time.perf_counter() - start:.1f}s")
+        return len(todo)
+
+    # Bitmaps are packed bits, zlib compressed, long runs of the same bit compress well
+    def get_bits(self, blob):
+        if not blob: return np.zeros(0, dtype=bool)
+        return np.unpackbits(np.frombuffer(zlib.decompress(blob), dtype=np.uint8)).astype(bool)
+
+    def set_bit(self, blob, bit):
+        bits = self.get_bits(blob)
+        if len(bits) <= bit:
+            bits = np.concatenate((bits, np.zeros(bit + 1 - len(bits), dtype=bool)))
+        bits[bit] = True
+        return zlib.compress(np.packbits(bits).tobytes())
+
+    # Versions of a package (good releases only) that export a dotted name
+    def versions_with(self, package, name):
+        package = canonicalize_name(package)
+        releases = self.release_ids(package)
+        with self.connect() as conn:
+            row = conn.execute('SELECT bits FROM symbols WHERE package = ? AND name = ?', (package, name)).fetchone()
+        bits = self.get_bits(row[0] if row else None)
+        return {version for version, (bit, status) in releases.items() if bit < len(bits) and bits[bit]}
+
+    # Dotted names in a package ending with an attribute, e.g. every '*.PhantomJS'
+    def names_ending(self, package, attribute):
+        with self.connect() as conn:
+            return [name for (name,) in conn.execute('SELECT name FROM symbols WHERE package = ? AND name GLOB ?', (canonicalize_name(package), f"*.{attribute}"))]
+
+    # Answers 'which versions of package export attribute', optionally from a given module
+    # Returns a dict with:
+    #   name       the dotted name that was looked up, None if it isn't in any indexed release
+    #   versions   the indexed versions exporting it, oldest first
+    #   intervals  the same versions as (first, last) runs over every indexed version
+    #   indexed    how many good releases we know about
+    def query(self, package, attribute, module=None):
+        package = canonicalize_name(package)
+        releases = self.release_ids(package)
+        indexed = VersionStore([version for version, (bit, status) in releases.items() if status == 'ok'])
+
+        names = [f"{module}.{attribute}"] if module else []
+        names += [name for name in sorted(self.names_ending(package, attribute), key=len) if name not in names]
+        for name in names:
+            present = self.versions_with(package, name)
+            if present:
+                return {'name': name, 'versions': [version for version in indexed if version in present], 'intervals': intervals(indexed, present), 'indexed': len(indexed)}
+        return {'name': None, 'versions': [], 'intervals': [], 'indexed': len(indexed)}
+
+    # The attribute and module (if the message names one) a Python error is missing
+    def missing_symbol(self, message):
+        match = MISSING_ATTRIBUTE.search(message)
+        if match: return match.group(2), match.group(1)
+        match = MISSING_NAME.search(message)
+        if match: return match.group(1), match.group(2)
+        return None, None
+
+    # Picks a version of one of the packages that exports the name a failed run was missing
+    # packages: distributions installed for the run
+    # versions_for: package -> (VersionStore we're allowed to use, versions that already failed)
+    # Only the package the message names, or the ones it mentions, get downloaded, the rest
+    # are only looked up in what's already indexed
+    # Returns {'module', 'version'} or None if the index can't say
+    def suggest(self, message, packages, versions_for):
+        attribute, module = self.missing_symbol(message)
+        if not attribute: return None
+        if module:
+            owner = self.resolver.resolve(module)
+            packages = [owner] + [package for package in packages if package != owner]
+            download = {owner}
+        else:
+            download = {package for package in packages if len(packages) == 1 or re.search(rf"\b{re.escape(package)}\b", message, re.IGNORECASE)}
+
+        for package in packages:
+            if package in download:
+                versions, tried = versions_for(package)
+                if not len(versions): continue
+                # Only download what we could install, spread over the range and skipping what's indexed
+                self.index_package(package, versions.evenly_spaced(MAX_RELEASES, exclude=self.release_ids(canonicalize_name(package))))
+            elif not self.names_ending(package, attribute):
+                continue
+            else:
+                versions, tried = versions_for(package)
+            found = self.query(package, attribute, module)
+            if not found['name']: continue
+            usable = [version for version in found['versions'] if version in versions and version not in tried]
+            if self.logging: print(f"{found['name']} is in {package} {found['intervals']}")
+            if usable:
+                # The newest version that still has it
+                return {'module': package, 'version': usable[-1]}
+        return None
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Index and query the names each release of a package exports')
+    parser.add_argument('package', type=str, help="Distribution to index, e.g. selenium")
+    parser.add_argument('-n', '--name', type=str, default=None, help="Attribute or dotted name to look up, e.g. webdriver.PhantomJS")
+    parser.add_argument('-l', '--limit', type=int, nargs="?", default=MAX_RELEASES, const=MAX_RELEASES, help="How many releases to index, spread over the history, 0 for all")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    index = SymbolIndex(logging=True)
+    data = index.cache.get_json(f"pypi/{canonicalize_name(args.package)}/json")
+    if not data:
+        print(f"{args.package} isn't on the index")
+        return
+    versions = VersionStore(data['releases'])
+    start = time.perf_counter()
+    index.index_package(args.package, list(versions) if args.limit == 0 else versions.evenly_spaced(args.limit))
+    print(f"Indexing took {time.perf_counter() - start:.1f}s")
+
+    with index.connect() as conn:
+        symbols, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(bits)), 0) FROM symbols WHERE package = ?', (canonicalize_name(args.package),)).fetchone()
+    print(f"{symbols} names, {size / 1024:.0f} KB of bitmaps")
+
+    if args.name:
+        attribute = args.name.split('.')[-1]
+        module = f"{args.package}.{args.name.rsplit('.', 1)[0]}" if '.' in args.name else None
+        start = time.perf_counter()
+        found = index.query(args.package, attribute, module)
+        print(f"{found['name']}: {found['intervals']} of {found['indexed']} indexed releases ({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
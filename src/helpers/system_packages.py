@@ -0,0 +1,112 @@
+# Debian packages that Python modules need to build or run
+# lxml, psycopg2, mysqlclient, pycairo, PyAudio, ... fail with CouldNotBuildWheels
+# or a non-zero code when their headers are missing, and no Python version of
+# the module will fix that. ref_files/system_packages.json maps the modules to
+# the apt packages they need, and the build failure signatures (missing headers,
+# config scripts, shared libraries) to the apt packages that provide them.
+import argparse
+import json
+import os
+import re
+
+from packaging.utils import canonicalize_name
+
+SYSTEM_PACKAGES_FILE = './helpers/ref_files/system_packages.json'
+
+# Splits a run in an output_data_<ver>.yml into its iterations
+ITERATION = re.compile(r'^  iteration_\d+:\n    - python_module: ([^\n]*)\n    - error_type: ([^\n]*)\n    - error: \|\n(.*?)(?=^  iteration_\d+:|^end_time:|\Z)', re.MULTILINE | re.DOTALL)
+
+class SystemPackages:
+
+    def __init__(self, system_packages_file=SYSTEM_PACKAGES_FILE, logging=False) -> None:
+        self.logging = logging
+        with open(system_packages_file) as f:
+            table = json.load(f)
+        self.modules = {canonicalize_name(module): packages for module, packages in table['modules'].items()}
+        self.signatures = [(re.compile(signature['pattern'], re.IGNORECASE), signature['packages']) for signature in table['signatures']]
+        self.stats = {'matched': 0, 'added': 0}
+
+    # apt packages for the pinned modules, sorted so the layer is the same for the same modules and stays cached
+    # python_modules: names, or the {module: version} dict from llm_eval
+    def for_modules(self, python_modules):
+        packages = set()
+        for module in python_modules:
+            name = module['module'] if type(module) == dict else module
+            packages.update(self.modules.get(canonicalize_name(name), []))
+        return sorted(packages)
+
+    # apt packages a build or run log says are missing, empty if it doesn't look like a system dependency
+    def for_error(self, message):
+        packages = set()
+        for pattern, needed in self.signatures:
+            if pattern.search(message): packages.update(needed)
+        return sorted(packages)
+
+    # The packages from a log that aren't in the image yet
+    # installed: the packages the last Dockerfile already had
+    # Returns an empty list when they were all there, the error is then something else
+    def missing(self, message, installed=()):
+        packages = [package for package in self.for_error(message) if package not in installed]
+        if packages:
+            self.stats['matched'] += 1
+            self.stats['added'] += len(packages)
+            if self.logging: print(f"Missing system packages: {packages}")
+        return packages
+
+    def report(self):
+        return f"System packages: {self.stats['matched']} failures matched, {self.stats['added']} apt packages added"
+
+# Every run in a results folder as a list of (python_modules, error_type, error) per iteration
+def read_iterations(folder):
+    runs = []
+    for file_name in os.listdir(folder):
+        if not re.match(r'^output_data_[\w.]+\.yml$', file_name): continue
+        with open(os.path.join(folder, file_name), 'r', errors='replace') as f:
+            text = f.read()
+        for document in text.split('---\n'):
+            iterations = ITERATION.findall(document)
+            if iterations: runs.append(iterations)
+    return runs
+
+# Counts the iterations spent on missing system packages in a results corpus
+# Without the table every one of them went on trying other versions. With it, a module
+# in the table gets its packages in the first Dockerfile, and any other failure costs
+# one iteration before its packages are added
+def corpus_report(system, root):
+    totals = {'runs': 0, 'iterations': 0, 'affected_runs': 0, 'system_iterations': 0, 'removed': 0}
+    for folder, dirs, files in os.walk(root):
+        for run in read_iterations(folder):
+            totals['runs'] += 1
+            totals['iterations'] += len(run)
+            failures = [(modules, error) for modules, error_type, error in run if system.for_error(error)]
+            if not failures: continue
+            totals['affected_runs'] += 1
+            totals['system_iterations'] += len(failures)
+            proactive = set(system.for_modules(re.findall(r"'([^']+)':", run[0][0])))
+            covered = all(set(system.for_error(error)) <= proactive for modules, error in failures)
+            totals['removed'] += len(failures) if covered else len(failures) - 1
+    return totals
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Map Python modules and build failures to the Debian packages they need')
+    parser.add_argument('-m', '--modules', type=str, nargs="*", default=[], help="Modules to list the apt packages for")
+    parser.add_argument('-e', '--error', type=str, help="File with a build or run log to match against the signatures")
+    parser.add_argument('-d', '--dir', type=str, help="Results folder to report the iterations the table removes on")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    system = SystemPackages()
+    if args.modules:
+        print(f"{' '.join(args.modules)}: {system.for_modules(args.modules)}")
+    if args.error:
+        with open(args.error, 'r', errors='replace') as f:
+            print(f"{args.error}: {system.for_error(f.read())}")
+    if args.dir:
+        totals = corpus_report(system, args.dir)
+        print(f"{totals['runs']} runs, {totals['iterations']} iterations")
+        print(f"{totals['affected_runs']} runs failed on system packages for {totals['system_iterations']} iterations, {totals['removed']} of them removed by the table")
+
+if __name__ == "__main__":
+    main()
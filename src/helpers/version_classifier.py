@@ -0,0 +1,379 @@
+# Works out which Python versions a snippet could run on from its syntax
+# Runs before the LLM or Docker get involved. Python 3 features give a minimum
+# version (f-strings 3.6, walrus 3.8, match 3.10, ...), Python 2 only syntax
+# (print statements, 'except X, e', backticks, ...) rules out Python 3, and
+# unguarded imports of version specific standard library modules narrow it further.
+import argparse
+import ast
+import io
+import json
+import os
+import re
+import tokenize
+
+from packaging.version import Version
+
+from helpers.import_extractor import BLOCK_KEYWORDS, extract_imports, read_source
+from helpers.stdlib_modules import get_stdlib_tables
+
+PYTHON_VERSIONS_FILE = './helpers/ref_files/python_versions.json'
+
+# Standard library modules with a same-named backport on PyPI
+# Importing these says nothing about the Python version
+BACKPORTED = {
+    'asyncio', 'builtins', 'concurrent', 'configparser', 'contextvars', 'copyreg', 'dataclasses', 'enum', 'faulthandler',
+    'graphlib', 'html', 'http', 'importlib', 'ipaddress', 'argparse', 'lzma', 'pathlib', 'queue', 'reprlib', 'selectors',
+    'socketserver', 'statistics', 'tkinter', 'tracemalloc', 'typing', 'winreg', 'xmlrpc', '_thread', 'asyncore',
+    'asynchat', 'smtpd', 'distutils', 'imp', 'ttk', 'sysconfig', 'json', 'io',
+}
+
+# Python 3 only syntax found in the ast, and the first version that has it
+class FeatureVisitor(ast.NodeVisitor):
+
+    def __init__(self) -> None:
+        self.features = []
+        self.print_function = False
+
+    def add(self, feature, version, node):
+        self.features.append({'feature': feature, 'version': version, 'line': getattr(node, 'lineno', 0)})
+
+    def visit_ImportFrom(self, node):
+        if node.module == '__future__':
+            names = [alias.name for alias in node.names]
+            if 'print_function' in names: self.print_function = True
+            if 'annotations' in names: self.add('from __future__ import annotations', '3.7', node)
+            if 'barry_as_FLUFL' in names: self.add('from __future__ import barry_as_FLUFL', '3.1', node)
+        self.generic_visit(node)
+
+    def visit_JoinedStr(self, node):
+        self.add('f-string', '3.6', node)
+        self.generic_visit(node)
+
+    def visit_NamedExpr(self, node):
+        self.add('assignment expression', '3.8', node)
+        self.generic_visit(node)
+
+    def visit_AsyncFunctionDef(self, node):
+        self.add('async def', '3.5', node)
+        self.visit_arguments_of(node)
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node):
+        self.visit_arguments_of(node)
+        self.generic_visit(node)
+
+    def visit_Lambda(self, node):
+        self.visit_arguments_of(node)
+        self.generic_visit(node)
+
+    def visit_arguments_of(self, node):
+        args = node.args
+        if args.posonlyargs: self.add('positional-only parameters', '3.8', node)
+        if args.kwonlyargs: self.add('keyword-only parameters', '3.0', node)
+        annotated = [arg for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg] if arg is not None and arg.annotation is not None]
+        if annotated or getattr(node, 'returns', None) is not None:
+            self.add('function annotations', '3.0', node)
+
+    def visit_Await(self, node):
+        self.add('await', '3.5', node)
+        self.generic_visit(node)
+
+    def visit_AsyncFor(self, node):
+        self.add('async for', '3.5', node)
+        self.generic_visit(node)
+
+    def visit_AsyncWith(self, node):
+        self.add('async with', '3.5', node)
+        self.generic_visit(node)
+
+    def visit_comprehension(self, node):
+        if node.is_async: self.add('async comprehension', '3.6', node)
+        self.generic_visit(node)
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, ast.MatMult): self.add('@ operator', '3.5', node)
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if isinstance(node.op, ast.MatMult): self.add('@= operator', '3.5', node)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node):
+        self.add('variable annotation', '3.6', node)
+        self.generic_visit(node)
+
+    def visit_Match(self, node):
+        self.add('match statement', '3.10', node)
+        self.generic_visit(node)
+
+    def visit_TryStar(self, node):
+        self.add('except*', '3.11', node)
+        self.generic_visit(node)
+
+    def visit_YieldFrom(self, node):
+        self.add('yield from', '3.3', node)
+        self.generic_visit(node)
+
+    def visit_Nonlocal(self, node):
+        self.add('nonlocal', '3.0', node)
+        self.generic_visit(node)
+
+    def visit_Starred(self, node):
+        if isinstance(node.ctx, ast.Store): self.add('starred assignment', '3.0', node)
+        self.generic_visit(node)
+
+    def visit_Raise(self, node):
+        if node.cause is not None: self.add('raise ... from', '3.0', node)
+        self.generic_visit(node)
+
+    def visit_Dict(self, node):
+        if None in node.keys: self.add('dict unpacking', '3.5', node)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        starred = [arg for arg in node.args if isinstance(arg, ast.Starred)]
+        kwargs = [keyword for keyword in node.keywords if keyword.arg is None]
+        if len(starred) > 1 or len(kwargs) > 1 or (starred and node.args.index(starred[-1]) < len(node.args) - 1):
+            self.add('generalised unpacking', '3.5', node)
+        if getattr(node.func, 'id', None) == 'print' and node.keywords and not self.print_function:
+            self.add('print() keywords', '3.0', node)
+        self.generic_visit(node)
+
+    # Python 2.7 additions, so these rule out 2.6
+    def visit_DictComp(self, node):
+        self.add('dict comprehension', '2.7', node)
+        self.generic_visit(node)
+
+    def visit_SetComp(self, node):
+        self.add('set comprehension', '2.7', node)
+        self.generic_visit(node)
+
+    def visit_Set(self, node):
+        self.add('set literal', '2.7', node)
+        self.generic_visit(node)
+
+    def visit_With(self, node):
+        if len(node.items) > 1: self.add('multiple context managers', '2.7', node)
+        self.generic_visit(node)
+
+# 3.12 syntax the host can't parse: 'type X = ...' and 'def f[T]()'
+PY312_SYNTAX = re.compile(r'^\s*(type\s+\w+(\[[^\]]*\])?\s*=|(def|class)\s+\w+\[)', re.MULTILINE)
+
+# Python 2 only syntax, found with the tokenizer when the host can't parse the file
+def python2_markers(source):
+    markers = []
+    line = []
+
+    def check_statement(words):
+        if not words: return
+        first = words[0]
+        second = words[1] if len(words) > 1 else None
+        if first.string == 'print' and second is not None and second.string not in ('(', '=', '.', ')', ',', '[', ':'):
+            markers.append({'feature': 'print statement', 'line': first.start[0]})
+        if first.string == 'exec' and second is not None and second.string != '(' and second.type in (tokenize.STRING, tokenize.NAME):
+            markers.append({'feature': 'exec statement', 'line': first.start[0]})
+        if first.string in ('except', 'raise') and top_level_comma(words[1:]):
+            markers.append({'feature': f"'{first.string} X, y'", 'line': first.start[0]})
+
+    def check(tokens):
+        words = [token for token in tokens if token.type not in (tokenize.COMMENT, tokenize.NL)]
+        if not words: return
+        check_statement(words)
+        # One line bodies, 'if x: print y'
+        strings = [token.string for token in words]
+        if strings[0] in BLOCK_KEYWORDS and ':' in strings[1:]:
+            check_statement(words[strings.index(':') + 1:])
+
+        for previous, token in zip(words, words[1:]):
+            adjacent = previous.end == token.start
+            if previous.string == '<' and token.string == '>' and adjacent:
+                markers.append({'feature': '<> operator', 'line': token.start[0]})
+            elif previous.type == tokenize.NUMBER and previous.string == '0' and token.type == tokenize.NUMBER and adjacent:
+                markers.append({'feature': 'old octal literal', 'line': token.start[0]})
+            elif previous.type == tokenize.NUMBER and token.string in ('L', 'l') and adjacent:
+                markers.append({'feature': 'long literal', 'line': token.start[0]})
+            elif previous.string.lower() == 'ur' and token.type == tokenize.STRING and adjacent:
+                markers.append({'feature': "ur'' string", 'line': token.start[0]})
+        for token in words:
+            if token.type == tokenize.ERRORTOKEN and token.string == '`':
+                markers.append({'feature': 'backticks', 'line': token.start[0]})
+                break
+
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                check(line)
+                line = []
+            elif token.type not in (tokenize.INDENT, tokenize.DEDENT):
+                line.append(token)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        check(line)
+    return markers
+
+# Line of the first number written with underscores (1_000), 0 if there isn't one
+# They only show up in the source, the ast has the value
+def number_underscores(source):
+    if not re.search(r'\d_\d', source): return 0
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type == tokenize.NUMBER and '_' in token.string:
+            return token.start[0]
+    return 0
+
+# True if a ',' appears outside brackets before the ':' of a block
+def top_level_comma(tokens):
+    depth = 0
+    for token in tokens:
+        if token.string in ('(', '[', '{'): depth += 1
+        elif token.string in (')', ']', '}'): depth -= 1
+        elif token.string == ':' and depth == 0: return False
+        elif token.string == ',' and depth == 0: return True
+    return False
+
+class VersionClassifier:
+
+    def __init__(self, python_versions_file=PYTHON_VERSIONS_FILE, logging=False) -> None:
+        self.logging = logging
+        with open(python_versions_file) as f:
+            # Newest first, the same order as python_versions.json
+            self.cycles = [details['cycle'] for details in json.load(f)]
+        self.stdlib = get_stdlib_tables()
+
+    def versions_between(self, versions, minimum=None, maximum=None):
+        return [version for version in versions
+                if (minimum is None or Version(version) >= Version(minimum)) and (maximum is None or Version(version) <= Version(maximum))]
+
+    # The versions an unguarded import of a standard library module restricts us to, None if it doesn't
+    def stdlib_versions(self, module):
+        top = module.split('.')[0]
+        if top in BACKPORTED or top.startswith('_'): return None
+        versions = [cycle for cycle in self.cycles if self.stdlib.is_stdlib(top, cycle)]
+        if not versions or len(versions) == len(self.cycles): return None
+        return versions
+
+    # Classifies a source string
+    # Returns a dict with:
+    #   feasible  the Python versions the snippet could run on, newest first
+    #   parser    'ast' if the host parsed it, 'tokenize' otherwise
+    #   reasons   the features that narrowed the range, with the line they're on
+    def classify(self, source):
+        reasons = []
+        feasible = list(self.cycles)
+        try:
+            tree = ast.parse(source)
+            parser = 'ast'
+        except (SyntaxError, ValueError):
+            tree = None
+            parser = 'tokenize'
+
+        if tree is not None:
+            visitor = FeatureVisitor()
+            visitor.visit(tree)
+            for feature in visitor.features:
+                feasible = self.versions_between(feasible, minimum=feature['version'])
+                reasons.append(feature)
+            line = number_underscores(source)
+            if line:
+                feasible = self.versions_between(feasible, minimum='3.6')
+                reasons.append({'feature': 'underscores in numbers', 'version': '3.6', 'line': line})
+        elif PY312_SYNTAX.search(source):
+            feasible = self.versions_between(feasible, minimum='3.12')
+            reasons.append({'feature': 'type parameters', 'version': '3.12', 'line': source[:PY312_SYNTAX.search(source).start()].count('\n') + 1})
+        else:
+            markers = python2_markers(source)
+            if markers:
+                feasible = self.versions_between(feasible, maximum='2.7')
+                reasons.extend(dict(marker, version='2') for marker in markers)
+
+        # Unguarded imports of version specific modules, as long as they agree with the syntax
+        imports, import_parser = extract_imports(source)
+        for found in imports:
+            if found['guarded'] or found['conditional'] or found['level'] > 0 or not found['module']: continue
+            versions = self.stdlib_versions(found['module'])
+            if versions is None: continue
+            narrowed = [version for version in feasible if version in versions]
+            if narrowed:
+                feasible = narrowed
+                reasons.append({'feature': f"import {found['module']}", 'version': ', '.join(versions), 'line': found['line'][0]})
+
+        # Contradicting features, we can't rule anything out
+        if not feasible: feasible = list(self.cycles)
+
+        return {'feasible': feasible, 'parser': parser, 'reasons': reasons}
+
+    def classify_file(self, file_path):
+        return self.classify(read_source(file_path))
+
+    # Closest feasible version to a guess, e.g. the LLM's
+    def clamp(self, classification, python_version):
+        feasible = classification['feasible']
+        if python_version in feasible or not feasible: return python_version
+        try:
+            guess = Version(str(python_version))
+        except Exception:
+            return feasible[0]
+        return min(feasible, key=lambda version: (abs(Version(version).major - guess.major), abs(Version(version).minor - guess.minor)))
+
+    def describe(self, classification):
+        feasible = classification['feasible']
+        text = f"Python {feasible[-1]} - {feasible[0]}" if len(feasible) > 1 else f"Python {feasible[0]}"
+        if classification['reasons']:
+            text += ' (' + ', '.join(f"{reason['feature']} line {reason['line']}" for reason in classification['reasons'][:5]) + ')'
+        return text
+
+# Iterations per Python version in a snippet's output_data files, and whether it worked
+def read_runs(folder):
+    runs = []
+    for file_name in os.listdir(folder):
+        if not re.match(r'^output_data_[\d.]+\.yml$', file_name): continue
+        with open(os.path.join(folder, file_name), 'r', errors='replace') as f:
+            text = f.read()
+        for document in text.split('---\n'):
+            version = re.search(r'^python_version: (\S+)', document, re.MULTILINE)
+            if not version: continue
+            runs.append({
+                'python_version': version.group(1),
+                'iterations': len(re.findall(r'^  iteration_\d+:', document, re.MULTILINE)),
+                'success': bool(re.search(r'error_type: None\b', document)),
+            })
+    return runs
+
+# Counts the iterations the classifier would have saved on a results corpus
+# Runs on versions outside the feasible range are the saving, successful ones would be a mistake
+def corpus_report(classifier, root):
+    totals = {'snippets': 0, 'narrowed': 0, 'iterations': 0, 'saved': 0, 'wrongly_excluded': 0}
+    for folder, dirs, files in os.walk(root):
+        if 'snippet.py' not in files: continue
+        classification = classifier.classify_file(os.path.join(folder, 'snippet.py'))
+        totals['snippets'] += 1
+        if len(classification['feasible']) < len(classifier.cycles): totals['narrowed'] += 1
+        for run in read_runs(folder):
+            totals['iterations'] += run['iterations']
+            if run['python_version'] not in classification['feasible']:
+                totals['saved'] += run['iterations']
+                if run['success']:
+                    totals['wrongly_excluded'] += 1
+                    print(f"{folder}: worked on {run['python_version']}, classified as {classifier.describe(classification)}")
+    return totals
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Classify the Python versions a snippet can run on')
+    parser.add_argument('-f', '--file', type=str, help="Snippet to classify")
+    parser.add_argument('-d', '--dir', type=str, help="Results folder to report the iterations saved on")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    classifier = VersionClassifier()
+    if args.file:
+        classification = classifier.classify_file(args.file)
+        print(classifier.describe(classification))
+        print(f"Feasible: {classification['feasible']} (parsed with {classification['parser']})")
+    if args.dir:
+        totals = corpus_report(classifier, args.dir)
+        print(f"{totals['snippets']} snippets, {totals['narrowed']} narrowed below the full range")
+        print(f"Iterations saved: {totals['saved']} of {totals['iterations']}")
+        print(f"Successful runs excluded: {totals['wrongly_excluded']}")
+
+if __name__ == "__main__":
+    main()
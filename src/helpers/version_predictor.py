@@ -0,0 +1,202 @@
+# Predicts which Python version a snippet will work on, learnt from past runs
+# Every output_data_<ver>.yml records the versions a snippet built and ran on.
+# A softmax (multinomial logistic) regression over hashed features of the
+# snippet, its imports, the syntax the VersionClassifier found and the
+# versions that syntax allows, is trained on those runs with NumPy, so new
+# snippets start on the most likely versions instead of a range around a guess.
+import argparse
+import os
+import time
+import zlib
+
+import numpy as np
+
+from helpers.import_extractor import extract_imports, read_source
+from helpers.pypi_cache import CACHE_DIR
+from helpers.version_classifier import VersionClassifier, read_runs
+
+MODEL_FILE = f"{CACHE_DIR}/version_model.npz"
+
+# Hashed feature space, imports are open ended so they share buckets
+FEATURES = 2 ** 14
+
+# Training settings
+EPOCHS = 300
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+# Names for everything we know about a snippet before running it
+def snippet_features(source, classifier):
+    classification = classifier.classify(source)
+    features = [f"parser:{classification['parser']}"]
+    features += [f"feasible:{version}" for version in classification['feasible']]
+    features += [f"syntax:{reason['feature']}" for reason in classification['reasons'] if not reason['feature'].startswith('import ')]
+
+    imports, parser = extract_imports(source)
+    for found in imports:
+        if found['level'] > 0 or not found['top']: continue
+        features.append(f"import:{found['top']}")
+        # Standard library for some Pythons only, e.g. urllib2 or tomllib
+        if classifier.stdlib_versions(found['top']) is not None:
+            features.append(f"stdlib:{found['top']}")
+    return sorted(set(features)), classification
+
+# Buckets for a list of feature names, crc32 so they don't change between processes like hash() does
+def hash_features(features):
+    row = np.zeros(FEATURES, dtype=np.float32)
+    for feature in features:
+        row[zlib.crc32(feature.encode('utf-8')) % FEATURES] = 1.0
+    return row
+
+def softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+# Snippets and the versions they worked on, one example per successful version
+def read_corpus(root):
+    examples = []
+    for folder, dirs, files in os.walk(root):
+        if 'snippet.py' not in files: continue
+        worked = sorted({run['python_version'] for run in read_runs(folder) if run['success']})
+        if worked:
+            examples.append({'folder': folder, 'source': read_source(os.path.join(folder, 'snippet.py')), 'versions': worked})
+    return examples
+
+class VersionPredictor:
+
+    def __init__(self, model_file=MODEL_FILE, classifier=None, logging=False) -> None:
+        self.logging = logging
+        self.model_file = model_file
+        self.classifier = classifier if classifier is not None else VersionClassifier(logging=logging)
+        # Newest first, like python_versions.json
+        self.classes = list(self.classifier.cycles)
+        self.weights = None
+        self.bias = None
+        self.load()
+
+    def available(self):
+        return self.weights is not None
+
+    def load(self):
+        if not os.path.isfile(self.model_file): return
+        model = np.load(self.model_file)
+        classes = [str(version) for version in model['classes']]
+        # A model trained on another version list can't be used
+        if classes != self.classes or model['weights'].shape[0] != FEATURES:
+            if self.logging: print(f"{self.model_file} doesn't match python_versions.json, retrain it")
+            return
+        self.weights = model['weights']
+        self.bias = model['bias']
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.model_file) or '.', exist_ok=True)
+        np.savez(self.model_file, weights=self.weights, bias=self.bias, classes=np.array(self.classes))
+
+    def matrix(self, examples):
+        rows = []
+        labels = []
+        for example in examples:
+            features, classification = snippet_features(example['source'], self.classifier)
+            row = hash_features(features)
+            for version in example['versions']:
+                if version in self.classes:
+                    rows.append(row)
+                    labels.append(self.classes.index(version))
+        return np.array(rows, dtype=np.float32).reshape(-1, FEATURES), np.array(labels, dtype=np.int64)
+
+    # Full batch gradient descent on the cross entropy
+    def train(self, examples, epochs=EPOCHS, learning_rate=LEARNING_RATE, l2=L2):
+        x, y = self.matrix(examples)
+        if not len(y):
+            print("No successful runs to train on")
+            return 0
+        start = time.perf_counter()
+        targets = np.zeros((len(y), len(self.classes)), dtype=np.float32)
+        targets[np.arange(len(y)), y] = 1.0
+        weights = np.zeros((FEATURES, len(self.classes)), dtype=np.float32)
+        # Start from how often each version worked
+        bias = np.log(targets.mean(axis=0) + 1e-3).astype(np.float32)
+        for epoch in range(epochs):
+            error = (softmax(x @ weights + bias) - targets) / len(y)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        self.weights, self.bias = weights, bias
+        if self.logging: print(f"Trained on {len(y)} runs in {time.perf_counter() - start:.1f}s")
+        return len(y)
+
+    # Probability of each version, infeasible versions get none
+    def probabilities(self, source):
+        features, classification = snippet_features(source, self.classifier)
+        scores = hash_features(features) @ self.weights + self.bias
+        probabilities = softmax(scores[None, :])[0]
+        mask = np.array([version in classification['feasible'] for version in self.classes])
+        probabilities = np.where(mask, probabilities, 0.0)
+        total = probabilities.sum()
+        return dict(zip(self.classes, (probabilities / total if total else probabilities).tolist())), classification
+
+    # Feasible versions, most likely first
+    # Without a model this is the classifier's order, newest first
+    def rank(self, source):
+        if not self.available():
+            return self.classifier.classify(source)['feasible']
+        probabilities, classification = self.probabilities(source)
+        return sorted(classification['feasible'], key=lambda version: -probabilities[version])
+
+    def rank_file(self, file_path):
+        return self.rank(read_source(file_path))
+
+# Top-k accuracy with k folds over the snippets, against always trying the most common versions
+def cross_validate(examples, folds=5, top=3):
+    hits = {'model': 0, 'frequency': 0}
+    for fold in range(folds):
+        train = [example for idx, example in enumerate(examples) if idx % folds != fold]
+        test = [example for idx, example in enumerate(examples) if idx % folds == fold]
+        if not train or not test: continue
+        predictor = VersionPredictor(model_file='')
+        predictor.train(train)
+        counts = {}
+        for example in train:
+            for version in example['versions']:
+                counts[version] = counts.get(version, 0) + 1
+        common = sorted(counts, key=lambda version: -counts[version])[:top]
+        for example in test:
+            if set(predictor.rank(example['source'])[:top]) & set(example['versions']): hits['model'] += 1
+            if set(common) & set(example['versions']): hits['frequency'] += 1
+    return {name: count / len(examples) for name, count in hits.items()}
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Predict the Python version a snippet works on from past runs')
+    parser.add_argument('-t', '--train', type=str, help="Results folder to train on, the model is saved to the cache")
+    parser.add_argument('-e', '--evaluate', type=str, help="Results folder to cross validate on")
+    parser.add_argument('-f', '--file', type=str, help="Snippet to rank the Python versions for")
+    parser.add_argument('-k', '--top', type=int, nargs="?", default=3, const=3, help="How many versions count as a hit when evaluating")
+    return parser.parse_args()
+
+def main():
+    args = process_args()
+    if args.train:
+        examples = read_corpus(args.train)
+        predictor = VersionPredictor(model_file=MODEL_FILE, logging=True)
+        if predictor.train(examples):
+            predictor.save()
+            print(f"Saved {MODEL_FILE} from {len(examples)} snippets")
+
+    if args.evaluate:
+        examples = read_corpus(args.evaluate)
+        accuracy = cross_validate(examples, top=args.top)
+        print(f"{len(examples)} snippets, top {args.top} accuracy: model {accuracy['model']:.0%}, most common versions {accuracy['frequency']:.0%}")
+
+    if args.file:
+        predictor = VersionPredictor()
+        if predictor.available():
+            probabilities, classification = predictor.probabilities(read_source(args.file))
+            for version in predictor.rank_file(args.file):
+                print(f"{version}: {probabilities[version]:.2f}")
+        else:
+            print(f"No model at {MODEL_FILE}, train one with --train")
+            print(predictor.rank_file(args.file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# Picks the next version of a module to try after it failed
+# The error handlers used to hand the LLM a comma separated version list and ask
+# it for "equally distanced sampling" that skips the versions already tried,
+# which is a multi-second generation for a list operation. This does it in
+# process over the module's VersionStore, with a strategy per error type:
+#   bisect  halve the gap between the failed version and the closest one tried,
+#           towards older versions first (removed APIs, syntax too new for the image)
+#   even    evenly spaced over what hasn't been tried yet
+#   newest  the newest version that hasn't been tried
+#   llm     leave it to the LLM prompt, as before
+# Yanked releases are skipped unless skip_yanked is turned off.
+import argparse
+import random
+import time
+
+from helpers.version_store import VersionStore
+
+STRATEGIES = ('bisect', 'even', 'newest', 'llm')
+
+# Strategy per error type, anything not listed is left to the LLM
+ERROR_STRATEGIES = {
+    'ImportError': 'bisect',
+    'AttributeError': 'bisect',
+    'SyntaxError': 'bisect',
+    'NonZeroCode': 'even',
+    'ModuleNotFound': 'newest',
+    # pip lists only what installs on the image, the newest of those is closest to the failed pick
+    'VersionNotFound': 'newest',
+}
+
+# Parses 'ImportError=bisect,NonZeroCode=llm' into overrides for ERROR_STRATEGIES
+# A bare strategy, e.g. 'llm', applies to every error type
+def parse_strategies(text):
+    strategies = dict(ERROR_STRATEGIES)
+    if not text: return strategies
+    for part in text.split(','):
+        part = part.strip()
+        if not part: continue
+        error_type, strategy = part.split('=', 1) if '=' in part else (None, part)
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown sampling strategy {strategy}, expected one of {', '.join(STRATEGIES)}")
+        if error_type is None:
+            strategies = {name: strategy for name in strategies}
+        else:
+            strategies[error_type.strip()] = strategy
+    return strategies
+
+class VersionSampler:
+
+    # pypi: the PyPIQuery whose release indexes tell us which releases are yanked, None to keep them all
+    # strategies: {error type: strategy}, ERROR_STRATEGIES if None
+    def __init__(self, pypi=None, strategies=None, skip_yanked=True, logging=False) -> None:
+        self.logging = logging
+        self.pypi = pypi
+        self.strategies = strategies if strategies is not None else dict(ERROR_STRATEGIES)
+        self.skip_yanked = skip_yanked
+        self.stats = {'sampled': 0, 'exhausted': 0, 'llm': 0, 'time': 0.0}
+
+    def strategy_for(self, error_type):
+        return self.strategies.get(error_type, 'llm')
+
+    # Versions with no file left that isn't yanked
+    def yanked(self, module):
+        if not self.skip_yanked or self.pypi is None: return set()
+        try:
+            index = self.pypi.get_release_index(module)
+        except Exception as e:
+            if self.logging: print(f"Unable to read the releases of {module}: {e}")
+            return set()
+        if not index: return set()
+        available = index.any_per_release(~index.yanked)
+        return {version for version, ok in zip(index.versions, available) if not ok}
+
+    # The next version to try, None when every version has been tried or the strategy is 'llm'
+    # versions: the module's VersionStore, oldest to newest
+    # previous: the versions already tried, in order, the last one being the one that just failed
+    def sample(self, module, versions, previous, error_type=None, strategy=None):
+        strategy = strategy or self.strategy_for(error_type)
+        if strategy == 'llm':
+            self.stats['llm'] += 1
+            return None
+
+        start = time.perf_counter()
+        yanked = self.yanked(module)
+        candidates = versions if not yanked else VersionStore([version for version in versions if version not in yanked], presorted=True)
+        # Spelt as the store spells them, so 1.2.0 counts as 1.2
+        tried = [candidates.match(version) or version for version in previous if version]
+        untried = [version for version in candidates if version not in set(tried)]
+        version = None
+        if untried:
+            if strategy == 'newest':
+                version = untried[-1]
+            elif strategy == 'even':
+                version = self.even(candidates, tried)
+            elif strategy == 'bisect':
+                version = self.bisect(candidates, tried)
+
+        self.stats['time'] += time.perf_counter() - start
+        if version is None:
+            self.stats['exhausted'] += 1
+        else:
+            self.stats['sampled'] += 1
+        if self.logging: print(f"{strategy} sampling for {module} after {tried}: {version}")
+        return version
+
+    # Older side of the last failure first, then the newer side, then whatever is left
+    def bisect(self, candidates, tried):
+        if not tried:
+            return candidates.newest()
+        failed = tried[-1]
+        version = candidates.bisect(failed, tried, newer=False)
+        if version is None: version = candidates.bisect(failed, tried, newer=True)
+        if version is None: version = self.even(candidates, tried)
+        return version
+
+    # The untried version furthest from everything tried so far
+    def even(self, candidates, tried):
+        tried_idx = sorted({candidates.position(version) for version in tried})
+        best, best_gap = None, -1
+        tried = set(tried)
+        for idx, version in enumerate(candidates):
+            if version in tried: continue
+            gap = min((abs(idx - other) for other in tried_idx), default=len(candidates))
+            if gap > best_gap: best, best_gap = version, gap
+        return best
+
+    def report(self):
+        return f"Version sampler: {self.stats['sampled']} sampled, {self.stats['exhausted']} exhausted, {self.stats['llm']} left to the LLM, {self.stats['time'] * 1000:.1f} ms"
+
+# A random contiguous window of versions that work, as a snippet's real constraint might be
+#   cutoff    everything up to some release works, like syntax too new for the image
+#   older     a few releases in the older half, like an API that was added and later removed
+#   anywhere  a few releases anywhere, like a build that only works for some releases
+def working_window(count, rng, scenario):
+    if scenario == 'cutoff':
+        return 0, rng.randrange(count - 1)
+    high = rng.randrange(count // 2 if scenario == 'older' and count > 2 else count)
+    # Most working ranges are a handful of releases wide, not a long tail
+    low = max(0, high - rng.randrange(1, max(2, count // 4) + 1) + 1)
+    return low, high
+
+# Replays a failed version the way the run loop does, until a working one is picked
+# pick(versions, previous) returns the next version or None
+def simulate(versions, window, pick, max_iterations):
+    previous = [versions.newest()]
+    for iteration in range(1, max_iterations + 1):
+        if window[0] <= versions.index(previous[-1]) <= window[1]:
+            return iteration
+        version = pick(versions, previous)
+        if version is None: return None
+        previous.append(version)
+    return None
+
+# Handle argument parsing
+def process_args():
+    parser = argparse.ArgumentParser(description='Benchmark the version sampling strategies against each other and the LLM')
+    parser.add_argument('modules', type=str, nargs="+", help="Modules whose version lists are sampled")
+    parser.add_argument('-p', '--python', type=str, nargs="?", default='3.8', const='3.8', help="Python version the versions are listed for, defaults to 3.8")
+    parser.add_argument('-n', '--trials', type=int, nargs="?", default=200, const=200, help="Random working windows per module")
+    parser.add_argument('-l', '--loop', type=int, nargs="?", default=10, const=10, help="Iterations before a trial counts as failed")
+    parser.add_argument('-m', '--model', type=str, default=None, help="Also time the LLM prompt with this Ollama model, e.g. phi3:medium")
+    parser.add_argument('-b', '--base', type=str, nargs="?", default='http://localhost:11434', const='http://localhost:11434', help="The ollama URL when --model is given")
+    return parser.parse_args()
+
+def main():
+    from helpers.py_pi_query import PyPIQuery
+    args = process_args()
+    pypi = PyPIQuery()
+    sampler = VersionSampler(pypi)
+    rng = random.Random(0)
+
+    picks = {strategy: (lambda strategy: lambda versions, previous: sampler.sample(module, versions, previous, strategy=strategy))(strategy) for strategy in STRATEGIES if strategy != 'llm'}
+    # What the LLM prompt amounts to when it follows the instructions, a random untried version
+    picks['random'] = lambda versions, previous: rng.choice([version for version in versions if version not in previous] or [None])
+    if args.model:
+        from helpers.ollama_helper_tester import OllamaHelper
+        llm = OllamaHelper(base_url=args.base, model=args.model, temp=0.7, llm_cache='off')
+        picks['llm'] = lambda versions, previous: (llm.llm_sample_version(module, versions, ', '.join(previous)) or {}).get('version')
+
+    for module in args.modules:
+        versions = pypi.read_version_store(module, args.python)
+        if len(versions) < 3:
+            print(f"{module}: only {len(versions)} versions for Python {args.python}, skipping")
+            continue
+        for label in ('cutoff', 'older', 'anywhere'):
+            windows = [working_window(len(versions), rng, label) for trial in range(args.trials if 'llm' not in picks else min(args.trials, 10))]
+            for name, pick in picks.items():
+                start = time.perf_counter()
+                results = [simulate(versions, window, pick, args.loop) for window in windows]
+                elapsed = time.perf_counter() - start
+                solved = [iterations for iterations in results if iterations is not None]
+                mean = sum(solved) / len(solved) if solved else float('nan')
+                print(f"{module} ({len(versions)} versions, working range {label}) {name:>7}: {len(solved) / len(results):.0%} solved within {args.loop}, {mean:.2f} iterations on average, {elapsed / len(results) * 1000:.2f} ms per trial")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Sorted store of a module's candidate versions
+# Versions are ordered by PEP 440 (so 1.0rc1 < 1.0 < 1.0.post1) and looked up
+# with bisection. str() gives the same comma separated list the prompts use.
+import zlib
+from bisect import bisect_left
+
+from packaging.version import InvalidVersion, Version
+
+MAGIC = b'PLVS1'
+
+# Sort key for a version, anything that isn't PEP 440 sorts first, alphabetically
+def version_key(version):
+    try:
+        return (1, Version(version))
+    except InvalidVersion:
+        return (0, version)
+
+class VersionStore:
+
+    def __init__(self, versions=(), presorted=False) -> None:
+        if presorted:
+            self.versions = list(versions)
+            self.keys = [version_key(version) for version in self.versions]
+        else:
+            keyed = sorted({version_key(version): version for version in versions if version}.items())
+            self.keys = [key for key, version in keyed]
+            self.versions = [version for key, version in keyed]
+
+    # Builds a store from the comma separated format of the modules files
+    @classmethod
+    def from_string(cls, text):
+        return cls([version.strip() for version in text.split(',')])
+
+    def __str__(self):
+        return ', '.join(self.versions)
+
+    def __len__(self):
+        return len(self.versions)
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    def __getitem__(self, idx):
+        return self.versions[idx]
+
+    def __contains__(self, version):
+        return self.index(version) >= 0
+
+    # Position of the version, or -1 if it isn't in the store
+    # Equal PEP 440 versions match, so 1.2.0 finds 1.2
+    def index(self, version):
+        key = version_key(str(version))
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return idx
+        return -1
+
+    # The stored spelling of a version, or None if it isn't in the store
+    def match(self, version):
+        idx = self.index(version)
+        return self.versions[idx] if idx >= 0 else None
+
+    # Where a version sits in the store, even if it isn't one of ours
+    def position(self, version):
+        return bisect_left(self.keys, version_key(str(version)))
+
+    def oldest(self):
+        return self.versions[0] if self.versions else None
+
+    def newest(self):
+        return self.versions[-1] if self.versions else None
+
+    # Bisects between a failed version and the closest tried version on one side
+    # newer: search towards newer versions instead of older ones
+    # Returns None when there is nothing left to try on that side
+    def bisect(self, failed, tried=(), newer=False):
+        failed_idx = self.position(failed)
+        tried_idx = [self.position(version) for version in tried if version != failed]
+        if newer:
+            start = failed_idx + 1 if self.index(failed) >= 0 else failed_idx
+            end = min([idx for idx in tried_idx if idx >= start] + [len(self)])
+            if start >= end: return None
+            return self.versions[(start + end) // 2]
+
+        end = failed_idx
+        start = max([idx + 1 for idx in tried_idx if idx < end] + [0])
+        if start >= end: return None
+        return self.versions[(start + end - 1) // 2]
+
+    # k versions spread evenly across the store, skipping excluded versions
+    def evenly_spaced(self, k, exclude=()):
+        excluded = {self.index(version) for version in exclude}
+        available = len(self) - len(excluded - {-1})
+        if k <= 0 or available <= 0: return []
+        k = min(k, available)
+
+        picked = []
+        taken = set(excluded)
+        for step in range(k):
+            target = round(step * (len(self) - 1) / (k - 1)) if k > 1 else (len(self) - 1) // 2
+            # Walk outwards from the target to the closest free position
+            for offset in range(len(self)):
+                found = None
+                for idx in (target + offset, target - offset):
+                    if 0 <= idx < len(self) and idx not in taken:
+                        found = idx
+                        break
+                if found is not None:
+                    taken.add(found)
+                    picked.append(found)
+                    break
+
+        return [self.versions[idx] for idx in sorted(picked)]
+
+    # Compact binary form, the versions are already sorted so loading doesn't re-sort
+    def to_bytes(self):
+        return MAGIC + zlib.compress('\0'.join(self.versions).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(MAGIC):
+            raise ValueError('Not a serialised VersionStore')
+        text = zlib.decompress(data[len(MAGIC):]).decode('utf-8')
+        return cls(text.split('\0') if text else [], presorted=True)
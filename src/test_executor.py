@@ -6,6 +6,7 @@ import json
 import os
 import sys
 import time
+from datetime import date, datetime
 import multiprocessing as mp
 from multiprocessing import Process
 import pathlib
@@ -14,6 +15,13 @@ from helpers.ollama_helper_tester import OllamaHelper
 from helpers.py_pi_query import PyPIQuery
 from helpers.build_dockerfile import DockerHelper
 from helpers.deps_scraper import DepsScraper
+from helpers.dependency_resolver import DependencyResolver
+from helpers.llm_cache import POLICIES as LLM_CACHE_POLICIES
+from helpers.pypi_cache import flush_all as flush_cache_stats
+from helpers.log_compactor import LogCompactor, MAX_TOKENS as COMPACT_TOKENS
+from helpers.stdlib_modules import get_stdlib_tables
+from helpers.version_classifier import VersionClassifier
+from helpers.version_predictor import VersionPredictor
 
 SCRIPT_DIR = pathlib.Path(__file__).resolve().parent
 os.chdir(SCRIPT_DIR)
@@ -53,19 +61,45 @@ def _apply_user_patch(user_input: str, llm_eval: dict) -> dict:
             # ignore unknown spellings
         return llm_eval
 
+# Hint for the LLM when the log doesn't mention any standard library module
 _BUILTIN = {
-    # python ≥3.10 →  sys.stdlib_module_names  (but keep a static fallback)
     "sys", "getopt", "os", "re", "json", "typing", "argparse", "pathlib",
 }
 
-def _is_builtin(mod: str) -> bool:
-    """True if `mod` is in the std‑lib – never pip‑install these."""
-    import sys
-    if hasattr(sys, "stdlib_module_names"):           # 3.10+
-        return mod in sys.stdlib_module_names
-    return mod in _BUILTIN
+def _is_builtin(mod: str, python_version: str = None) -> bool:
+    """True if `mod` is in the std‑lib of the target Python – never pip‑install these."""
+    return get_stdlib_tables().is_stdlib(mod, python_version)
 
-def _summarise_error_with_llm(raw_log: str, model: str) -> str:
+# Gist metadata read by --as-of meta, next to the snippet
+_META_FILE = "gist.json"
+
+def _snippet_date(file: str, source: str):
+    """
+    Date the snippet was written, for --as-of:
+    YYYY-MM-DD → that date
+    mtime      → when the file was last modified
+    meta       → created_at/updated_at from the gist.json next to the file, mtime if there isn't one
+    meta:PATH  → the same from the metadata file at PATH
+    """
+    if source == "meta" or source.startswith("meta:"):
+        meta_file = source[len("meta:"):] if source.startswith("meta:") else os.path.join(os.path.dirname(file) or ".", _META_FILE)
+        try:
+            with open(meta_file) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            meta = None
+        stamp = meta.get("updated_at") or meta.get("created_at") if isinstance(meta, dict) else None
+        if stamp:
+            return datetime.fromisoformat(str(stamp).replace("Z", "+00:00")).date()
+        source = "mtime"
+    if source == "mtime":
+        return date.fromtimestamp(os.path.getmtime(file))
+    return date.fromisoformat(source)
+
+# The summary asks for more than the error handlers do, so it gets a larger share of the log
+SUMMARY_TOKENS = 2000
+
+def _summarise_error_with_llm(raw_log: str, model: str, python_version: str = None) -> str:
     """
     Ask the local Ollama model for a concise diagnosis **and** an actionable
     recommendation that matches the interactive grammar:
@@ -73,18 +107,19 @@ def _summarise_error_with_llm(raw_log: str, model: str) -> str:
     """
     import subprocess, textwrap, json, shlex
 
-    # include the *whole* log – the model will pick what it needs
-    log_tail = raw_log.strip()
+    # only the part of the log about the error, the rest is pip progress and layer noise
+    log_tail = LogCompactor(max_tokens=SUMMARY_TOKENS).compact(raw_log.strip())
 
     # Give the LLM a tiny bit of world‑knowledge it usually lacks:
     # built‑in modules must not be installed with pip.
-    builtin_hint = ", ".join(sorted(_BUILTIN))
+    # Name the ones from the target Python's std‑lib that show up in this log.
+    builtin_hint = ", ".join(get_stdlib_tables().names_in(log_tail, python_version) or sorted(_BUILTIN))
 
     prompt = textwrap.dedent(f"""
         You are an expert Python dependency troubleshooter.
 
         ## Context
-        • The following is the full docker build / run log:
+        • The following is the error part of the docker build / run log:
 
         ```log
         {log_tail}
@@ -148,15 +183,26 @@ def _clean_ollama_tag(raw: object) -> str:
 
 class TestExecutor():
 
-    def __init__(self, base_url="http://localhost:11434", model='gemma2', logging=True, temp=0.7, end_loop=5, search_range=1, base_modules='./modules') -> None:
+    def __init__(self, base_url="http://localhost:11434", model='gemma2', logging=True, temp=0.7, end_loop=5, search_range=1, base_modules='./modules', docker_index=None, as_of=None, llm_cache='temp0', sampler=None, compact_tokens=COMPACT_TOKENS) -> None:
         # Initiate instance of Ollama helper and PyPi Query
         print(f'Running model- {model} with temp {temp}. Looping {end_loop} times with a search range of {search_range}')
-        self.ollama_helper = OllamaHelper(base_url=base_url, model=model, logging=logging, temp=temp, base_modules=base_modules)
+        self.logging = logging
+        self.ollama_helper = OllamaHelper(base_url=base_url, model=model, logging=logging, temp=temp, base_modules=base_modules, llm_cache=llm_cache, sampler=sampler, compact_tokens=compact_tokens)
         self.pypi = PyPIQuery(logging=logging, base_modules=base_modules)
         self.deps = DepsScraper(logging=logging)
+        # Checks the LLM's pins against the PyPI metadata before the first build
+        self.resolver = DependencyResolver(self.pypi, logging=logging)
+        self.classifier = VersionClassifier(logging=logging)
+        self.predictor = VersionPredictor(classifier=self.classifier, logging=logging)
         self.end_loop = end_loop
         self.search_range = search_range
+        # Local package index for the Dockerfiles, None uses pypi.org
+        self.docker_index = docker_index
+        # Date the pins are taken from, None lets the LLM choose them
+        self.as_of = as_of
         self.start_time = time.time()
+        # Seconds from the start until this process wrote its first Dockerfile
+        self.first_dockerfile = None
         pass
 
     # Defines JSONObject dictionary for dot notation
@@ -193,7 +239,33 @@ class TestExecutor():
         # Also returns an updated python version, based on what the model had provided
         llm_eval['python_modules'], llm_eval['python_version'] = llm.pypi.get_module_specifics(llm_eval)
         
-        module_versions = llm.get_module_versions(llm_eval)
+        if self.as_of:
+            # Period-correct pins: the newest release of each module uploaded by the snippet's date
+            module_versions = {}
+            for module in llm_eval['python_modules']:
+                version = self.pypi.as_of(module, self.as_of, llm_eval['python_version'])
+                if version: module_versions[module] = version
+            # Only modules with nothing released by then go to the LLM
+            missing = [module for module in llm_eval['python_modules'] if module not in module_versions]
+            if missing:
+                module_versions.update(llm.get_module_versions(dict(llm_eval, python_modules=missing)))
+            if self.logging: print(f"Pins as of {self.as_of}: {module_versions}")
+        else:
+            module_versions = llm.get_module_versions(llm_eval)
+
+        # Preflight: repair pins that don't exist for this Python or clash with each other, before any build
+        pins = {module: version for module, version in module_versions.items() if version}
+        resolution = self.resolver.resolve(pins, llm_eval['python_version'])
+        if resolution['ok']:
+            module_versions.update(resolution['assignment'])
+        elif resolution['gave_up']:
+            print(f"Pins not checked, building them anyway: {'; '.join(resolution['conflict'])}")
+        else:
+            print(f"Pins don't resolve, building them anyway: {'; '.join(resolution['conflict'])}")
+            # Which of them clash through the modules they pull in
+            for line in self.resolver.graph.describe(self.resolver.graph.clashes(pins, llm_eval['python_version'])):
+                print(line)
+        if self.logging: print(self.resolver.report())
         llm_eval['python_modules'] = module_versions
 
         return llm_eval
@@ -201,6 +273,9 @@ class TestExecutor():
     def build_container(self, dockerHelper, llm, llm_eval, file, error_details = {}, interactive=False):
         # Build the docker image with the given JSON and file/ paths
         dockerHelper.create_dockerfile(llm_eval, file)
+        if self.first_dockerfile is None:
+            self.first_dockerfile = time.time() - self.start_time
+            print(f"First Dockerfile after {self.first_dockerfile:.1f}s")
         passed, docker_build_output = dockerHelper.build_dockerfile(file)
         if not passed:
             _say(docker_build_output, interactive=interactive)
@@ -231,16 +306,22 @@ class TestExecutor():
     # Update the llm details
     # Set previous modules, so our output is correct
     # Removes and adds modules based on the new module returned by the LLM
+    # The LLM's spelling of a version is matched against the module's candidates (1.2.0 -> 1.2)
     def update_llm_eval(self, new, llm_eval):
         details = llm_eval.copy()
         details['previous_python_modules'] = details['python_modules'].copy()
-        if new != None:
-            module_name = self.pypi.check_module_name(new['module'])
+        # Missing system packages go in the apt layer, the modules stay as they are
+        if new != None and 'system_packages' in new:
+            details['system_packages'] = sorted(set(details.get('system_packages', [])) | set(new['system_packages']))
+        elif new != None:
+            module_name = self.pypi.check_module_name(new['module'], details['python_version'])
             module_name = module_name[0] if len(module_name) > 0 else module_name
             # Check to see if we need to pop a module or add the new version
             if new['version'] == None or new['version'] == 'None' or new['version'] == 'none' or new['version'] == '' and module_name in details['python_modules']:
                 details['python_modules'].pop(module_name)
             else:
+                version_store = self.pypi.read_version_store(module_name, details['python_version'])
+                new['version'] = version_store.match(new['version']) or new['version']
                 details['python_modules'][module_name] = new['version']
         return details
         
@@ -268,7 +349,7 @@ class TestExecutor():
     # Handles the main loop of building | running | validating
     def docker_create_process(self, ollama_helper, llm_eval, file, process_num, interactive=False):
         # Create the YAML file in the same folder as the snippet
-        dockerHelper = DockerHelper(logging=not interactive)
+        dockerHelper = DockerHelper(logging=not interactive, index_url=self.docker_index)
 
         # Get a set of modules, based on the evaluation
         # Also pull down working versions from PyPi at the same time.
@@ -288,6 +369,7 @@ class TestExecutor():
             'AttributeError': 0,
             'NonZeroCode': 0,
             'SyntaxError': 0,
+            'SystemDependency': 0,
         }
 
         # Get the project folder so we can write out our data file
@@ -339,19 +421,19 @@ class TestExecutor():
                         llm_eval = self.update_llm_eval(output, llm_eval)
                         # If we had an import error, and a non zero code, then we may have an ordering issue and need to reshuffle the modules
                         if error_type == 'ImportError' and 'returned a non-zero code: 1' in docker_output:
-                            zero_code_module = ollama_helper.non_zero_error(docker_output)
+                            zero_code_module = ollama_helper.non_zero_error(docker_output, llm_eval['python_modules'])
                             llm_eval = self.shuffle_modules(output['module'], zero_code_module, llm_eval)
                         # Given a Non Zero and PATH environment in the output, remove this module as it may be completely erroneous
                         if error_type == 'NonZeroCode' and 'PATH environment' in docker_output:
                             llm_eval['python_modules'].pop(output['module'])
 
                         # Persist state and, in interactive mode, pause here
-                        loop = self.end_test(file_to_open, llm_eval, dockerHelper, error_type, docker_output, loop, False)
+                        loop = self.end_test(file_to_open, llm_eval, dockerHelper, error_type, docker_output, loop, False, ollama_helper)
 
                         if interactive and not run_complete:
                             short_log = docker_output if isinstance(docker_output, str) else str(docker_output)
                             tag       = _clean_ollama_tag(ollama_helper.model)
-                            summary   = _summarise_error_with_llm(short_log, tag)
+                            summary   = _summarise_error_with_llm(short_log, tag, llm_eval['python_version'])
                             print("\n🧠  " + summary.replace("\n", "\n🧠  ") + "\n")
                             ui = input(
                                 f"↩ <Enter>=retry │ py==x.y  │ mod==ver  │ "
@@ -396,6 +478,10 @@ class TestExecutor():
                     build_complete = False
                     error_handler = self.naughty_bois(output, error_handler, error_type, llm_eval)
                     llm_eval = self.update_llm_eval(output, llm_eval)
+                elif 'SystemDependency' in error_type:
+                    build_complete = False
+                    error_handler = self.naughty_bois(output, error_handler, error_type, llm_eval)
+                    llm_eval = self.update_llm_eval(output, llm_eval)
                 elif 'NonZeroCode' in error_type:
                     build_complete = False
                     error_handler = self.naughty_bois(output, error_handler, error_type, llm_eval)
@@ -407,7 +493,7 @@ class TestExecutor():
                     if interactive and not run_complete:
                         short_log = str(docker_output)
                         tag       = _clean_ollama_tag(ollama_helper.model)
-                        summary   = _summarise_error_with_llm(short_log, tag)
+                        summary   = _summarise_error_with_llm(short_log, tag, llm_eval['python_version'])
                         print("\n🧠  " + summary.replace("\n", "\n🧠  ") + "\n")
                         ui = input(
                             "↩ <Enter>=retry │ py==x.y │ mod==ver │ del mod │ q=quit » ")
@@ -427,12 +513,12 @@ class TestExecutor():
             except Exception as e:
                 print(f"Failed to build container: {e}")
             # Update the loop number and log the details to the log file
-            loop = self.end_test(file_to_open, llm_eval, dockerHelper, error_type, docker_output, loop, run_complete)
+            loop = self.end_test(file_to_open, llm_eval, dockerHelper, error_type, docker_output, loop, run_complete, ollama_helper)
         
         # If we've left the while loop then we need to make sure everything is killed correctly
         loop = self.end_loop
         # Update the loop number and log the details to the log file
-        self.end_test(file_to_open, llm_eval, dockerHelper, error_type, docker_output, loop, True)
+        self.end_test(file_to_open, llm_eval, dockerHelper, error_type, docker_output, loop, True, ollama_helper)
 
     # Logging specific, ensures correct spaces in log file to avoid later errors
     def ensure_8_spaces(self, line):
@@ -459,7 +545,8 @@ class TestExecutor():
         return line
 
     # Handles the logging of the error messages and iterations to the log file
-    def end_test(self, file_to_open, llm_eval, dockerHelper, error_type, docker_message, loop, run_complete):
+    # ollama_helper: the helper that handled this process's errors, its reports are printed at the end
+    def end_test(self, file_to_open, llm_eval, dockerHelper, error_type, docker_message, loop, run_complete, ollama_helper=None):
         out_file = open(file_to_open, "a")
         python_modules = llm_eval["previous_python_modules"] if 'previous_python_modules' in llm_eval else llm_eval['python_modules']
         out_file.write(f"  iteration_{loop}:\n")
@@ -485,6 +572,12 @@ class TestExecutor():
             out_file.write(f'end_time: {end_time}\n')
             out_file.write(f'total_time: {end_time - self.start_time}')
             out_file.close()
+            ollama_helper = ollama_helper if ollama_helper is not None else self.ollama_helper
+            if self.logging: print(ollama_helper.llm_cache.report())
+            if self.logging: print(ollama_helper.sampler.report())
+            if self.logging: print(ollama_helper.rules.report())
+            if self.logging: print(ollama_helper.compactor.report())
+            flush_cache_stats()
             dockerHelper.delete_container()
             dockerHelper.delete_image()
             exit(0)
@@ -502,8 +595,18 @@ def process_args():
     parser.add_argument('-r', '--range', type=int, nargs="?", default=0, const=0, help="The search range, expands out above and below the found Python version, defaults to 0")
     parser.add_argument('-i', '--interactive', action="store_true", help="Pause after each iteration and wait for user input")
     parser.add_argument('-v', '--verbose', action="store_true", help="Verbose logging of information")
+    parser.add_argument('-p', '--project', type=str, default=None, help="Project folder or repo checkout to take the imports from, every .py file in it is scanned and -f is the file that gets run")
+    parser.add_argument('--docker-index', type=str, default=None, help="Package index the Dockerfiles install from, e.g. a pypi_snapshot server at http://host.docker.internal:8080. Set PLLM_PYPI_URL for the metadata queries")
+    parser.add_argument('--llm-cache', type=str, choices=LLM_CACHE_POLICIES, default='temp0', help="Reuse LLM responses from earlier runs and sibling processes: off, temp0 (only at temperature 0, the default) or always")
+    parser.add_argument('--sampler', type=str, default=None, help="How the next version is picked after an error, per error type: bisect, even, newest or llm, e.g. 'ImportError=bisect,NonZeroCode=llm' or just 'llm' for every error type")
+    parser.add_argument('--compact-tokens', type=int, default=COMPACT_TOKENS, help=f"Token budget for the error log passed into prompts, defaults to {COMPACT_TOKENS}, 0 sends the whole log")
+    parser.add_argument('--as-of', type=str, default=None, help="Pin every module to its newest release uploaded by this date: YYYY-MM-DD, 'mtime' for the file's modification time, 'meta' for the created_at/updated_at of the gist.json next to it or 'meta:PATH' for another metadata file")
     return parser.parse_args()
 
+# The Ollama helper a build process works with, with the options given on the command line
+def _worker_helper(args, file_path, logging):
+    return OllamaHelper(base_url=args.base, model=args.model, logging=logging, temp=args.temp, base_modules=file_path+"/modules", llm_cache=args.llm_cache, sampler=args.sampler, compact_tokens=args.compact_tokens or None)
+
 # Main loop
 def main():
     llm_eval = None
@@ -515,18 +618,33 @@ def main():
     file_path = '/'.join(args.file.split('/')[:-1])
 
     # Create the main 
-    testExecutor = TestExecutor(base_url=args.base, model=args.model, logging=not args.interactive, temp=args.temp, end_loop=args.loop, search_range=args.range, base_modules=file_path+"/modules")
+    testExecutor = TestExecutor(base_url=args.base, model=args.model, logging=not args.interactive, temp=args.temp, end_loop=args.loop, search_range=args.range, base_modules=file_path+"/modules", docker_index=args.docker_index, as_of=_snippet_date(args.file, args.as_of) if args.as_of else None, llm_cache=args.llm_cache, sampler=args.sampler, compact_tokens=args.compact_tokens or None)
+    if testExecutor.as_of: print(f"Pinning modules as of {testExecutor.as_of}")
     # Use a simple search to grab imports from file without the LLM
-    python_deps = testExecutor.deps.find_word_in_file(args.file, 'import', [])
+    if args.project:
+        # One environment for the whole project, local packages are left out
+        project = testExecutor.deps.scan_project(args.project)
+        python_deps = project['deps']
+        print(f"Project imports {len(python_deps)} modules from {project['files']} files")
+    else:
+        python_deps = testExecutor.deps.find_word_in_file(args.file, 'import', [])
+    # Work out which Python versions the snippet's syntax allows, before any LLM or Docker work
+    classification = testExecutor.classifier.classify_file(args.file)
+    print(f"Syntax allows {testExecutor.classifier.describe(classification)}")
+    # Versions most likely to work according to past runs, None until a model has been trained
+    ranked = testExecutor.predictor.rank_file(args.file) if testExecutor.predictor.available() else None
+    if ranked: print(f"Past runs rank {ranked}")
 
     # Loop to ensure we handle invalid responses from the model
     while not llm_details:
         try:
             # Evaluate the file to get an initial set of assumptions
             llm_eval = testExecutor.evaluate_file(testExecutor.ollama_helper, args.file)
+            # Keep the LLM's guess inside what the syntax allows
+            llm_eval['python_version'] = testExecutor.classifier.clamp(classification, llm_eval['python_version'])
             
             # Run through all the dependencies and clean them for use. Removes useless imports
-            python_deps = testExecutor.pypi.check_module_name(python_deps + llm_eval['python_modules'])
+            python_deps = testExecutor.pypi.check_module_name(python_deps + llm_eval['python_modules'], llm_eval['python_version'])
 
             # Combine the simple search modules with the LLMs suggestions.
             llm_eval['python_modules'] = python_deps
@@ -541,20 +659,21 @@ def main():
         if loop >= 5: break
     # If the LLM didn't return anything, set the Python version to 3.8
     if not llm_details:
-        llm_eval = {'python_version': '3.8'}
-        llm_eval['python_modules'] = testExecutor.pypi.check_module_name(python_deps)
+        llm_eval = {'python_version': testExecutor.classifier.clamp(classification, '3.8')}
+        llm_eval['python_modules'] = testExecutor.pypi.check_module_name(python_deps, llm_eval['python_version'])
 
     # testExecutor.docker_create_process(ollama_helper, llm_eval, args.file, 1)
     # Search range is how far either side of the found Python verion we want to look.
     # For example, a value of 1 where the found version is 3.7 will return [3.6,3.7,3.8]
-    python_versions = testExecutor.pypi.get_python_range(python_version=llm_eval['python_version'], pyrange=testExecutor.search_range)
+    python_versions = testExecutor.pypi.get_python_range(python_version=llm_eval['python_version'], pyrange=testExecutor.search_range, feasible=classification['feasible'], ranked=ranked)
     print(python_versions)
     
     # If python_versions is empty then there was an issue with versions.
     # Give the lowest Python and work with this range
     if not python_versions:
-        python_versions = testExecutor.pypi.get_python_range(python_version=llm_eval['python_version'], range=testExecutor.search_range)
-    num_processes = (testExecutor.search_range * 2) + 1
+        python_versions = testExecutor.pypi.get_python_range(python_version=llm_eval['python_version'], pyrange=testExecutor.search_range, feasible=classification['feasible'])
+    # The syntax can leave fewer versions than the search range asks for
+    num_processes = min((testExecutor.search_range * 2) + 1, len(python_versions))
 
     processes = []
     
@@ -566,8 +685,7 @@ def main():
         run_details             = llm_eval.copy()
         run_details['python_version'] = python_versions[0]   # just the first candidate
         testExecutor.docker_create_process(
-            OllamaHelper(base_url=args.base, model=args.model, logging=False, temp=args.temp,
-                         base_modules=file_path+"/modules"),
+            _worker_helper(args, file_path, logging=False),
             run_details, args.file, 0,  # <‑‑ extra arg “interactive”
             interactive=True)
         return
@@ -579,7 +697,7 @@ def main():
         run_details['python_version'] = python_versions[i]
         # run_details['python_version'] = '3.6'
         # Give the docker create process, ollama helper, the snippet analysis, python file and the iteration
-        p = mp.Process(target=testExecutor.docker_create_process, args=(OllamaHelper(base_url=args.base, model=args.model, logging=True, temp=args.temp, base_modules=file_path+"/modules"), run_details, args.file, i, False))
+        p = mp.Process(target=testExecutor.docker_create_process, args=(_worker_helper(args, file_path, logging=True), run_details, args.file, i, False))
         processes.append(p)
         p.start()
 
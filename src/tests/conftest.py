@@ -0,0 +1,7 @@
+# The helpers are imported as 'helpers.x' and read their ref files relative to src/, like the scripts
+import os
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+os.chdir(SRC_DIR)
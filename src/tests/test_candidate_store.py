@@ -0,0 +1,73 @@
+# Tests for the shared, content-addressed candidate store
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from helpers.candidate_store import LEGACY_REVISION, CandidateStore
+
+def files_under(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), folder) for root, dirs, names in os.walk(folder) for name in names)
+
+def test_put_and_get(tmp_path):
+    store = CandidateStore(store_dir=str(tmp_path))
+    store.put('Django', '3.8', 10, ['2.0', '1.11'])
+    assert list(store.get('django', '3.8')) == ['1.11', '2.0']
+    assert list(store.get('Django', '3.8', 10)) == ['1.11', '2.0']
+    assert store.get('django', '3.8', 11) is None
+    assert store.get('django', '2.7') is None
+
+def test_identical_lists_share_one_object(tmp_path):
+    store = CandidateStore(store_dir=str(tmp_path))
+    first = store.put('a', '3.8', 1, ['1.0', '2.0'])
+    second = store.put('b', '2.7', 5, ['2.0', '1.0'])
+    assert first == second
+    assert len([path for path in files_under(tmp_path) if path.startswith('objects')]) == 1
+
+def test_newest_revision_is_head(tmp_path):
+    store = CandidateStore(store_dir=str(tmp_path))
+    store.put('a', '3.8', 1, ['1.0'])
+    store.put('a', '3.8', 2, ['1.0', '1.1'])
+    assert list(store.get('a', '3.8')) == ['1.0', '1.1']
+    assert list(store.get('a', '3.8', 1)) == ['1.0']
+
+def test_legacy_lists_never_replace_live_ones(tmp_path):
+    store = CandidateStore(store_dir=str(tmp_path))
+    store.put('a', '3.8', 7, ['1.0', '2.0'])
+    store.put('a', '3.8', LEGACY_REVISION, ['0.1'])
+    assert list(store.get('a', '3.8')) == ['1.0', '2.0']
+    assert list(store.get('a', '3.8', LEGACY_REVISION)) == ['0.1']
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    store = CandidateStore(store_dir=str(tmp_path))
+    path = str(tmp_path / 'refs' / 'a' / '3.8' / 'HEAD')
+    store.atomic_write(path, b'1-1')
+    with pytest.raises(TypeError):
+        store.atomic_write(path, 'not bytes')
+    assert store.read_file(path) == b'1-1'
+    # The temporary file is cleaned up
+    assert os.listdir(os.path.dirname(path)) == ['HEAD']
+
+def test_concurrent_writers_leave_whole_lists(tmp_path):
+    lists = [[f"1.{minor}" for minor in range(size)] for size in range(1, 40)]
+
+    def put_and_get(versions):
+        store = CandidateStore(store_dir=str(tmp_path))
+        store.put('a', '3.8', 1, versions)
+        return list(store.get('a', '3.8'))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        seen = list(executor.map(put_and_get, lists * 3))
+    expected = [sorted(versions, key=lambda version: int(version.split('.')[1])) for versions in lists]
+    assert all(versions in expected for versions in seen)
+    assert not [path for path in files_under(tmp_path) if '.tmp-' in path]
+
+def test_migrate_imports_the_old_module_files(tmp_path):
+    modules = tmp_path / 'results' / 'snippet' / 'modules'
+    modules.mkdir(parents=True)
+    (modules / 'numpy_2.7.txt').write_text('1.11.0, 1.16.6')
+    (modules / 'empty_3.8.txt').write_text('')
+    (modules / 'notes.txt').write_text('ignored')
+    store = CandidateStore(store_dir=str(tmp_path / 'store'))
+    assert store.migrate(str(tmp_path / 'results')) == 1
+    assert list(store.get('numpy', '2.7')) == ['1.11.0', '1.16.6']
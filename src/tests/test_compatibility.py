@@ -0,0 +1,49 @@
+# Tests for deciding what a python:X.Y image can install
+from helpers.compatibility import CompatibilityChecker
+
+def test_requires_python():
+    checker = CompatibilityChecker('3.6', '3.6.15')
+    assert checker.requires_python_ok('>=3.6')
+    assert not checker.requires_python_ok('>=3.7')
+    assert checker.requires_python_ok('!=3.0.*,!=3.1.*,>=2.7')
+    assert checker.requires_python_ok(None)
+    # pip ignores specifiers it can't parse
+    assert checker.requires_python_ok('>=3.6.*garbage')
+
+def test_full_version_defaults_to_the_first_patch_release():
+    assert CompatibilityChecker('3.8').full_version == '3.8.0'
+    assert not CompatibilityChecker('3.8').requires_python_ok('>=3.8.1')
+
+def test_wheel_tags():
+    checker = CompatibilityChecker('3.8', '3.8.18')
+    assert checker.file_ok('numpy-1.24.4-cp38-cp38-manylinux_2_17_x86_64.manylinux2014_x86_64.whl')
+    assert checker.file_ok('requests-2.31.0-py3-none-any.whl')
+    assert checker.file_ok('six-1.16.0-py2.py3-none-any.whl')
+    assert checker.file_ok('cffi-1.15.0-cp38-abi3-manylinux1_x86_64.whl')
+    assert not checker.file_ok('numpy-1.24.4-cp39-cp39-manylinux_2_17_x86_64.whl')
+    assert not checker.file_ok('numpy-1.24.4-cp38-cp38-win_amd64.whl')
+    assert not checker.file_ok('numpy-1.24.4-cp38-cp38-macosx_10_9_x86_64.whl')
+    assert not checker.file_ok('futures-3.3.0-py2-none-any.whl')
+    assert not checker.file_ok('broken.whl')
+
+def test_python2_images_need_wide_unicode_wheels():
+    checker = CompatibilityChecker('2.7', '2.7.18')
+    assert checker.file_ok('numpy-1.16.6-cp27-cp27mu-manylinux1_x86_64.whl')
+    assert not checker.file_ok('numpy-1.16.6-cp27-cp27m-manylinux1_x86_64.whl')
+
+def test_old_images_stop_at_their_glibc():
+    assert not CompatibilityChecker('3.6', '3.6.15').file_ok('pkg-1.0-cp36-cp36m-manylinux_2_34_x86_64.whl')
+    assert CompatibilityChecker('3.11', '3.11.9').file_ok('pkg-1.0-cp311-cp311-manylinux_2_34_x86_64.whl')
+
+def test_sdists_and_other_files():
+    checker = CompatibilityChecker('3.8')
+    assert checker.file_ok('pkg-1.0.tar.gz')
+    assert checker.file_ok('pkg-1.0.ZIP')
+    assert not checker.file_ok('pkg-1.0-py2.7.egg')
+    assert not checker.file_ok('pkg-1.0.win32.exe')
+
+def test_installable_needs_both():
+    checker = CompatibilityChecker('3.5', '3.5.10')
+    assert checker.installable('pkg-1.0.tar.gz', '>=3.5')
+    assert not checker.installable('pkg-1.0.tar.gz', '>=3.6')
+    assert not checker.installable('pkg-1.0-cp36-cp36m-manylinux1_x86_64.whl', '>=3.5')
@@ -0,0 +1,88 @@
+# Tests for the pre-build pin check, against a graph held in memory
+from packaging.specifiers import SpecifierSet
+
+from helpers.dependency_resolver import DependencyResolver
+from helpers.version_store import VersionStore
+
+class StubGraph:
+
+    # versions: {name: [version]}, requires: {(name, version): {dep: specifier}}
+    def __init__(self, versions, requires=None, clashes=None) -> None:
+        self.versions = versions
+        self.requires = requires or {}
+        self.found_clashes = clashes or []
+        self.ensured = []
+
+    def installable_versions(self, name, python_version):
+        return VersionStore(self.versions.get(name, []))
+
+    def requirements(self, name, version, python_version):
+        return {dep: SpecifierSet(specifier) for dep, specifier in self.requires.get((name, version), {}).items()}
+
+    def ensure(self, releases):
+        self.ensured.append(list(releases))
+
+    def clashes(self, pins, python_version):
+        return self.found_clashes
+
+def resolver(graph, **kwargs):
+    return DependencyResolver(pypi=None, graph=graph, **kwargs)
+
+def test_consistent_pins_are_kept():
+    graph = StubGraph({'a': ['1.0', '2.0'], 'b': ['1.0', '2.0']}, {('a', '2.0'): {'b': '>=2'}})
+    result = resolver(graph).resolve({'a': '2.0', 'b': '2.0'}, '3.8')
+    assert result['ok']
+    assert result['assignment'] == {'a': '2.0', 'b': '2.0'}
+    assert result['changes'] == {}
+
+def test_clashing_pin_moves_to_what_the_other_pin_needs():
+    graph = StubGraph({'a': ['1.0', '2.0'], 'b': ['1.0', '2.0']}, {('a', '2.0'): {'b': '<2'}})
+    result = resolver(graph).resolve({'a': '2.0', 'b': '2.0'}, '3.8')
+    assert result['ok']
+    assert result['changes'] == {'b': ('2.0', '1.0')}
+
+def test_hallucinated_pin_moves_to_a_real_release():
+    graph = StubGraph({'a': ['1.0', '2.0']})
+    result = resolver(graph).resolve({'a': '9.9'}, '3.8')
+    assert result['assignment'] == {'a': '2.0'}
+
+def test_prereleases_are_left_out_unless_pinned():
+    graph = StubGraph({'a': ['1.0', '2.0', '3.0b1']})
+    assert resolver(graph).domain('a', '2.0', '3.8') == ['2.0', '1.0']
+    assert '3.0b1' in resolver(graph).domain('a', '3.0b1', '3.8')
+
+def test_first_candidates_are_prefetched_in_one_call():
+    graph = StubGraph({'a': [f"1.{minor}" for minor in range(10)]})
+    resolver(graph).resolve({'a': '1.9'}, '3.8')
+    assert len(graph.ensured[0]) == 5
+
+def test_module_with_no_release_is_a_conflict():
+    graph = StubGraph({'a': ['1.0']})
+    result = resolver(graph).resolve({'a': '1.0', 'missing': '1.0'}, '3.8')
+    assert not result['ok']
+    assert result['assignment'] == {'a': '1.0', 'missing': '1.0'}
+    assert 'missing has no release installable' in result['conflict'][0]
+
+def test_unsatisfiable_pins_are_explained():
+    graph = StubGraph({'a': ['1.0'], 'b': ['1.0']}, {('a', '1.0'): {'b': '>=2'}})
+    result = resolver(graph).resolve({'a': '1.0', 'b': '1.0'}, '3.8')
+    assert not result['ok'] and not result['gave_up']
+    assert result['conflict'] == ['b is ruled out by a==1.0']
+
+def test_transitive_clash_rejects_the_assignment():
+    graph = StubGraph({'a': ['1.0']}, clashes=[{'module': 'c', 'pinned': None, 'required_by': [('a==1.0 -> c==1', '>=2')]}])
+    result = resolver(graph).resolve({'a': '1.0'}, '3.8')
+    assert not result['ok']
+
+def test_out_of_time_keeps_the_pins():
+    graph = StubGraph({'a': ['1.0', '2.0'], 'b': ['1.0', '2.0']}, {('a', '2.0'): {'b': '<2'}})
+    result = resolver(graph, time_budget=0).resolve({'a': '2.0', 'b': '2.0'}, '3.8')
+    assert not result['ok'] and result['gave_up']
+    assert result['assignment'] == {'a': '2.0', 'b': '2.0'}
+
+def test_stats_count_moved_pins():
+    graph = StubGraph({'a': ['1.0', '2.0'], 'b': ['1.0', '2.0']}, {('a', '2.0'): {'b': '<2'}})
+    checker = resolver(graph)
+    checker.resolve({'a': '2.0', 'b': '2.0'}, '3.8')
+    assert checker.stats['pins_moved'] == 1
+    assert checker.stats['repaired'] == 1
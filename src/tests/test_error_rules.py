@@ -0,0 +1,64 @@
+# Tests for reading the failing module out of pip and Python errors
+from helpers.error_rules import ErrorRules
+
+COULD_NOT_FIND = "ERROR: Could not find a version that satisfies the requirement djangorestframework==3.15.2 (from versions: 0.1, 0.1.1, ..., 3.14.0, 3.15.0, 3.15.1)\nERROR: No matching distribution found for djangorestframework==3.15.2"
+
+def test_could_not_find_reads_module_version_and_versions():
+    found = ErrorRules().match(COULD_NOT_FIND)
+    assert found['rule'] == 'could_not_find'
+    assert found['error_type'] == 'VersionNotFound'
+    assert found['module'] == 'djangorestframework'
+    assert found['version'] == '3.15.2'
+    # The '...' a compacted log leaves in the list isn't a version
+    assert found['versions'] == ['0.1', '0.1.1', '3.14.0', '3.15.0', '3.15.1']
+
+def test_no_matching_distribution_without_a_version_list():
+    found = ErrorRules().match("ERROR: No matching distribution found for tensorflow==1.2.0")
+    assert found['rule'] == 'no_matching_distribution'
+    assert (found['module'], found['version'], found['versions']) == ('tensorflow', '1.2.0', None)
+
+def test_non_zero_pip_command():
+    found = ErrorRules().match("The command '/bin/sh -c pip install --default-timeout=100 numpy==1.11.0' returned a non-zero code 1")
+    assert found['rule'] == 'non_zero_pip'
+    assert (found['module'], found['version']) == ('numpy', '1.11.0')
+
+def test_python2_submodule_is_not_trusted():
+    message = """Traceback (most recent call last):
+  File "/app/snippet.py", line 1, in <module>
+    from django.test.simple import DjangoTestSuiteRunner
+ImportError: No module named simple"""
+    rules = ErrorRules()
+    found = rules.match(message, ['ImportError', 'ModuleNotFound'])
+    assert found['module'] == 'simple'
+    assert found['package'] == 'django'
+    assert not rules.trusted(found)
+
+def test_python3_missing_module_is_trusted():
+    rules = ErrorRules()
+    found = rules.match("ModuleNotFoundError: No module named 'requests'")
+    assert found['module'] == 'requests'
+    assert found['package'] is None
+    assert rules.trusted(found)
+
+def test_low_confidence_rule_is_only_a_hint():
+    rules = ErrorRules()
+    found = rules.match("AttributeError: module 'selenium.webdriver' has no attribute 'PhantomJS'")
+    assert found['rule'] == 'module_attribute'
+    assert found['module'] == 'selenium'
+    assert not rules.trusted(found)
+
+def test_cannot_import_name():
+    found = ErrorRules().match("ImportError: cannot import name 'soft_unicode' from 'markupsafe'")
+    assert found['rule'] == 'cannot_import_name'
+    assert found['module'] == 'markupsafe'
+
+def test_error_types_limit_the_rules_tried():
+    rules = ErrorRules()
+    assert rules.match(COULD_NOT_FIND, ['SyntaxError']) is None
+    assert rules.match(COULD_NOT_FIND, ['VersionNotFound'])['rule'] == 'could_not_find'
+
+def test_hit_rate_counts_unmatched():
+    rules = ErrorRules()
+    assert rules.match("Something else went wrong") is None
+    rules.match("ModuleNotFoundError: No module named 'yaml'")
+    assert rules.hit_rate() == 0.5
@@ -0,0 +1,60 @@
+# Tests for cutting Docker logs down to the error
+import json
+
+from helpers.log_compactor import LogCompactor, decode_stream, estimate_tokens, shorten_versions
+
+def stream(*lines):
+    return '\n'.join(json.dumps({'stream': line}) for line in lines)
+
+def test_decodes_the_docker_stream():
+    raw = stream('Step 1/3 : FROM python:3.8\n', 'hello\n') + '\n' + json.dumps({'errorDetail': {'message': 'boom'}, 'error': 'boom'})
+    text = decode_stream(raw)
+    assert 'hello' in text
+    assert 'boom' in text
+    assert '"stream"' not in text
+
+def test_plain_text_passes_through():
+    assert decode_stream('no json here') == 'no json here'
+
+def test_strips_escapes_and_progress_noise():
+    raw = stream('Step 2/3 : RUN pip install numpy==1.11.0\n', ' ---> Running in abc\n', 'Collecting numpy==1.11.0\n',
+                 '\x1b[91m     |████████████████| 1.2 MB 3.4 MB/s eta 0:00:01\n',
+                 '\x1b[91mERROR: Failed building wheel for numpy\n\x1b[0m')
+    compacted = LogCompactor().compact(raw)
+    assert compacted == 'ERROR: Failed building wheel for numpy'
+
+def test_keeps_the_failing_command_and_traceback():
+    traceback = 'Traceback (most recent call last):\n  File "/app/snippet.py", line 1, in <module>\n    import foo\nModuleNotFoundError: No module named \'foo\''
+    raw = 'Building\n' + 'noise line\n' * 200 + traceback + "\nThe command '/bin/sh -c python snippet.py' returned a non-zero code: 1"
+    compacted = LogCompactor().compact(raw)
+    assert compacted.startswith('Traceback (most recent call last):')
+    assert "No module named 'foo'" in compacted
+    assert compacted.endswith('returned a non-zero code: 1')
+    assert 'noise line' not in compacted
+
+def test_shortens_long_version_lists():
+    versions = ', '.join(f"1.{minor}" for minor in range(100))
+    line = shorten_versions(f"ERROR: Could not find a version that satisfies the requirement x==9 (from versions: {versions})")
+    kept = line.split('(from versions: ')[1].rstrip(')').split(', ')
+    assert kept[:4] == ['1.0', '1.1', '1.2', '...']
+    assert kept[-1] == '1.99'
+    assert len(kept) == 24
+    short = "(from versions: 1.0, 1.1)"
+    assert shorten_versions(short) == short
+
+def test_holds_the_token_budget():
+    raw = '\n'.join(f"ERROR: problem number {idx}" for idx in range(500)) + "\nThe command 'pip install x==1' returned a non-zero code: 1"
+    compacted = LogCompactor(max_tokens=50).compact(raw)
+    assert estimate_tokens(compacted) <= 50
+    # The newest lines are the ones kept
+    assert compacted.endswith('returned a non-zero code: 1')
+
+def test_no_budget_leaves_the_log_alone():
+    raw = stream('anything\n')
+    assert LogCompactor(max_tokens=None).compact(raw) == raw
+
+def test_record_and_report():
+    compactor = LogCompactor()
+    compactor.record('NonZeroCode', 'x' * 400, 'x' * 40, 2.0)
+    assert compactor.stats['NonZeroCode'] == {'logs': 1, 'raw': 100, 'compact': 10, 'time': 2.0}
+    assert '90% fewer' in compactor.report()
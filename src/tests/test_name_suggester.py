@@ -0,0 +1,57 @@
+# Tests for suggesting distributions for missing imports
+import pytest
+
+from helpers.name_suggester import PYPI_NAME_SCORE, NameSuggester
+from helpers.package_index import PackageNameIndex
+
+PROJECTS = ['requests', 'numpy', 'beautifulsoup4', 'utils', 'scikit-image', 'python-dateutil', 'flask', 'django']
+
+def simple_index(tmp_path, projects):
+    source = tmp_path / 'simple.html'
+    source.write_text(''.join(f'<a href="/simple/{name}/">{name}</a>' for name in projects))
+    names = PackageNameIndex(str(tmp_path / 'names.idx'))
+    names.refresh(str(source))
+    return names
+
+@pytest.fixture
+def suggester(tmp_path):
+    return NameSuggester(names=simple_index(tmp_path, PROJECTS), trigram_dir=str(tmp_path / 'trigrams'))
+
+def test_known_aliases_come_first(suggester):
+    assert suggester.suggest('cv2')[0] == ('opencv-python', 1.0)
+    assert suggester.suggest('yaml.constructor')[0] == ('pyyaml', 1.0)
+    assert suggester.confident('skimage') == 'scikit-image'
+
+def test_misspelt_names_are_matched(suggester):
+    ranked = suggester.suggest('beautifulsoup')
+    assert ranked[0][0] == 'beautifulsoup4'
+    assert suggester.confident('beautifulsoup') == 'beautifulsoup4'
+
+def test_bare_project_names_are_left_to_the_llm(suggester):
+    assert suggester.suggest('utils')[0] == ('utils', PYPI_NAME_SCORE)
+    assert suggester.confident('utils') is None
+
+def test_nothing_in_common(suggester):
+    assert suggester.suggest('zzzqqq') == []
+    assert suggester.confident('zzzqqq') is None
+
+def test_rebuilt_when_the_names_change(tmp_path, suggester):
+    assert not [name for name, score in suggester.suggest('pendulum') if name == 'pendulum']
+    names = simple_index(tmp_path, PROJECTS + ['pendulum'])
+    rebuilt = NameSuggester(names=names, trigram_dir=str(tmp_path / 'trigrams'))
+    assert rebuilt.suggest('pendulum')[0] == ('pendulum', PYPI_NAME_SCORE)
+
+def test_missing_module_from_the_error(suggester):
+    assert suggester.missing_module("ModuleNotFoundError: No module named 'cv2'") == 'cv2'
+    assert suggester.missing_module("ImportError: No module named yaml.constructor") == 'yaml.constructor'
+    assert suggester.missing_module("SyntaxError: invalid syntax") is None
+
+def test_first_candidate_hit_rate(suggester):
+    suggester.record('cv2', 'opencv-python')
+    suggester.update("ModuleNotFoundError: No module named 'cv2.aruco'")
+    suggester.record('skimage', 'scikit-image')
+    suggester.update(None)
+    assert suggester.stats['first_wrong'] == 1
+    assert suggester.stats['first_right'] == 1
+    assert suggester.hit_rate() == 0.5
+    assert suggester.pending == {}
@@ -0,0 +1,106 @@
+# Tests for the columnar release index against the per-file loop it replaced
+from datetime import date, datetime
+
+import numpy as np
+
+from helpers.py_pi_query import PyPIQuery
+from helpers.release_index import ReleaseIndex
+
+START, END = date(2015, 1, 1), date(2016, 12, 31)
+
+def tag_version(tag):
+    return PyPIQuery.get_version_from_code(None, tag)
+
+def release_file(version, day, tag='py3', yanked=False, kind='whl'):
+    return {'filename': f"pkg-{version}.{kind}", 'upload_time': f"{day}T12:00:00", 'python_version': tag, 'yanked': yanked}
+
+# PyPIQuery.find_modules before the index, without the logging
+def find_modules_loop(releases, start_date, end_date, python_version, date_format='%b %d %Y'):
+    stored = []
+    latest_release = {'version': '', 'date': date(1981, 10, 2)}
+    small_repo = len(releases) <= 5
+    for ele in releases:
+        store = None
+        for details in releases[ele]:
+            if store or details['yanked']: continue
+            upload_time = datetime.strptime(details['upload_time'].split('T')[0], '%Y-%m-%d').date()
+            store = {}
+            if small_repo:
+                store = {'version': ele, 'date': upload_time.strftime(date_format)}
+            if start_date <= upload_time <= end_date:
+                store = {'version': ele, 'date': upload_time.strftime(date_format)}
+            elif tag_version(details['python_version']) == python_version:
+                store = {'version': ele, 'date': upload_time.strftime(date_format)}
+            elif 'py2' in details['python_version'] and '2.' in python_version:
+                store = {'version': ele, 'date': upload_time.strftime(date_format)}
+            elif 'py3' in details['python_version'] and '3.' in python_version:
+                store = {'version': ele, 'date': upload_time.strftime(date_format)}
+            elif 'source' in details['python_version'] and len(stored) <= 20:
+                store = {'version': ele, 'date': upload_time.strftime(date_format)}
+            if upload_time >= latest_release['date']:
+                latest_release = {'version': ele, 'date': upload_time}
+        if store: stored.append(store)
+    if len(stored) == 0:
+        latest_release['date'] = latest_release['date'].strftime(date_format)
+        stored.append(latest_release)
+    return stored
+
+def query(releases, python_version):
+    stored, removed = ReleaseIndex(releases, tag_version).query(START, END, python_version)
+    assert removed == 0
+    return stored
+
+def test_matches_the_loop_on_a_mixed_history():
+    releases = {
+        '0.1': [release_file('0.1', '2012-03-01', 'source', kind='tar.gz')],
+        '0.2': [release_file('0.2', '2013-05-01', 'cp27'), release_file('0.2', '2013-05-02', 'source', kind='tar.gz')],
+        '0.3': [release_file('0.3', '2014-01-01', 'py2')],
+        '1.0': [release_file('1.0', '2015-06-01', 'cp35', yanked=True), release_file('1.0', '2015-06-03', 'cp27')],
+        '1.1': [release_file('1.1', '2016-02-01', 'py3')],
+        '1.2': [release_file('1.2', '2017-04-01', 'cp36')],
+        '2.0': [release_file('2.0', '2019-01-01', 'cp38')],
+    }
+    for python_version in ('2.7', '3.5', '3.6', '3.8'):
+        assert query(releases, python_version) == find_modules_loop(releases, START, END, python_version)
+
+def test_matches_the_loop_on_the_source_limit():
+    # Only the first 21 releases stored can come from an sdist alone
+    releases = {f"0.{minor}": [release_file(f"0.{minor}", '2010-01-01', 'source', kind='tar.gz')] for minor in range(30)}
+    releases['1.0'] = [release_file('1.0', '2015-03-01', 'cp27')]
+    stored = query(releases, '2.7')
+    assert stored == find_modules_loop(releases, START, END, '2.7')
+    assert len(stored) == 22
+
+def test_small_packages_are_taken_whole():
+    releases = {'1.0': [release_file('1.0', '2001-01-01', 'cp24')], '1.1': [release_file('1.1', '2002-01-01', 'cp25')]}
+    assert query(releases, '3.8') == find_modules_loop(releases, START, END, '3.8')
+    assert [found['version'] for found in query(releases, '3.8')] == ['1.0', '1.1']
+
+def test_nothing_in_range_falls_back_to_the_latest_upload():
+    releases = {f"1.{minor}": [release_file(f"1.{minor}", f"200{minor}-01-01", 'cp24')] for minor in range(7)}
+    stored = query(releases, '3.8')
+    assert stored == find_modules_loop(releases, START, END, '3.8')
+    assert stored == [{'version': '1.6', 'date': 'Jan 01 2006'}]
+
+def test_all_yanked_returns_nothing():
+    # The loop handed back a {'version': ''} placeholder dated 1981, the index returns no candidates instead
+    releases = {'1.0': [release_file('1.0', '2015-06-01', yanked=True)], '2.0': [release_file('2.0', '2016-06-01', yanked=True)]}
+    assert find_modules_loop(releases, START, END, '3.8') == [{'version': '', 'date': 'Oct 02 1981'}]
+    assert query(releases, '3.8') == []
+
+def test_uninstallable_releases_are_dropped_and_counted():
+    releases = {version: [release_file(version, '2015-06-01')] for version in ('1.0', '1.1', '1.2')}
+    index = ReleaseIndex(releases, tag_version)
+    stored, removed = index.query(START, END, '3.8', installable=np.array([True, False, True]))
+    assert [found['version'] for found in stored] == ['1.0', '1.2']
+    assert removed == 1
+    # A mask ruling everything out is ignored
+    stored, removed = index.query(START, END, '3.8', installable=np.array([False, False, False]))
+    assert len(stored) == 3 and removed == 0
+
+def test_as_of_prefers_final_releases():
+    releases = {'1.0': [release_file('1.0', '2015-01-01')], '1.1rc1': [release_file('1.1rc1', '2015-05-01')], '2.0': [release_file('2.0', '2016-01-01')]}
+    index = ReleaseIndex(releases, tag_version)
+    assert index.as_of('2015-06-01') == '1.0'
+    assert index.as_of('2016-06-01') == '2.0'
+    assert index.as_of('2014-01-01') is None
@@ -0,0 +1,127 @@
+# Tests for the index of which releases export which names, against wheels built in memory
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from helpers.symbol_index import SymbolIndex, archive_symbols, intervals, module_name, module_symbols, pick_file
+from helpers.version_store import VersionStore
+
+def wheel(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def sdist(root, files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(f"{root}/{name}")
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+class Response:
+
+    def __init__(self, content) -> None:
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+# Stands in for PyPICache, serving a project's JSON and its files from memory
+class StubCache:
+
+    index_url = 'https://pypi.example'
+
+    def __init__(self, package, archives) -> None:
+        self.archives = archives
+        self.downloads = []
+        self.releases = {version: [{'filename': filename, 'url': f"/files/{filename}", 'packagetype': 'bdist_wheel', 'yanked': False}] for version, (filename, data) in archives.items()}
+        self.package = package
+        self.session = self
+
+    def get_json(self, key):
+        return {'releases': self.releases} if key == f"pypi/{self.package}/json" else None
+
+    def get(self, url, timeout=None):
+        filename = url.rsplit('/', 1)[1]
+        self.downloads.append(filename)
+        return Response(next(data for name, data in self.archives.values() if name == filename))
+
+def selenium_wheel(version, phantomjs):
+    webdriver = 'from selenium.webdriver.firefox.webdriver import WebDriver as Firefox\n'
+    if phantomjs: webdriver += 'from selenium.webdriver.phantomjs.webdriver import WebDriver as PhantomJS\n'
+    return f"selenium-{version}-py3-none-any.whl", wheel({
+        'selenium/__init__.py': f"__version__ = '{version}'\n",
+        'selenium/webdriver/__init__.py': webdriver,
+        f"selenium-{version}.dist-info/METADATA": 'Name: selenium\n',
+    })
+
+@pytest.fixture
+def index(tmp_path):
+    cache = StubCache('selenium', {version: selenium_wheel(version, version != '4.0') for version in ('2.53', '3.141', '4.0')})
+    return SymbolIndex(symbol_file=str(tmp_path / 'symbols.sqlite'), cache=cache, workers=2)
+
+def test_module_names_for_archive_paths():
+    assert module_name('requests/adapters.py') == 'requests.adapters'
+    assert module_name('src/pkg/__init__.py') == 'pkg'
+    assert module_name('numpy/core/_multiarray_umath.cpython-38-x86_64-linux-gnu.so') == 'numpy.core._multiarray_umath'
+    assert module_name('pkg-1.0.dist-info/METADATA') is None
+    assert module_name('tests/test_pkg.py') is None
+    assert module_name('my-pkg/setup.cfg') is None
+
+def test_top_level_names_include_guarded_definitions():
+    source = 'import os.path\nfrom a import b as c\nx, y = 1, 2\ndef f(): pass\ntry:\n    import json\nexcept ImportError:\n    json = None\nif True:\n    class K: pass\n'
+    assert module_symbols(source) == {'os', 'c', 'x', 'y', 'f', 'json', 'K'}
+
+def test_python2_sources_fall_back_to_regexes():
+    assert module_symbols('print "x"\ndef old(): pass\nNAME = 1\nimport urllib2\n') == {'old', 'NAME', 'urllib2'}
+
+def test_archive_symbols_for_wheels_and_sdists():
+    files = {'pkg/__init__.py': b'def hello(): pass\n', 'pkg/sub.py': b'VALUE = 1\n'}
+    expected = {'pkg', 'pkg.hello', 'pkg.sub', 'pkg.sub.VALUE'}
+    assert archive_symbols('pkg-1.0-py3-none-any.whl', wheel(files)) == expected
+    assert archive_symbols('pkg-1.0.tar.gz', sdist('pkg-1.0', files)) == expected
+
+def test_pick_file_prefers_pure_wheels():
+    files = [{'filename': 'a-1.0.tar.gz', 'packagetype': 'sdist'}, {'filename': 'a-1.0-cp38-cp38-linux_x86_64.whl'}, {'filename': 'a-1.0-py3-none-any.whl'}]
+    assert pick_file(files)['filename'] == 'a-1.0-py3-none-any.whl'
+    assert pick_file(files[:2])['filename'] == 'a-1.0-cp38-cp38-linux_x86_64.whl'
+    assert pick_file([{'filename': 'a-1.0.exe'}, {'filename': 'a-1.0-py3-none-any.whl', 'yanked': True}]) is None
+
+def test_intervals():
+    assert intervals(['1.0', '1.1', '1.2', '2.0', '2.1'], {'1.0', '1.1', '2.1'}) == [('1.0', '1.1'), ('2.1', '2.1')]
+    assert intervals(['1.0'], set()) == []
+
+def test_query_answers_which_versions_have_a_name(index):
+    assert index.index_package('selenium') == 3
+    found = index.query('selenium', 'PhantomJS', 'selenium.webdriver')
+    assert found['name'] == 'selenium.webdriver.PhantomJS'
+    assert found['versions'] == ['2.53', '3.141']
+    assert found['intervals'] == [('2.53', '3.141')]
+    assert found['indexed'] == 3
+    # Without the module the name is found by its last part
+    assert index.query('selenium', 'PhantomJS')['name'] == 'selenium.webdriver.PhantomJS'
+    assert index.query('selenium', 'Nothing')['name'] is None
+
+def test_indexing_is_incremental(index):
+    index.index_package('selenium', ['2.53'])
+    assert index.index_package('selenium') == 2
+    assert index.index_package('selenium') == 0
+    assert sorted(index.cache.downloads) == sorted(name for name, data in index.cache.archives.values())
+    assert sorted(bit for bit, status in index.release_ids('selenium').values()) == [0, 1, 2]
+
+def test_suggest_picks_the_newest_untried_version_with_the_name(index):
+    message = "AttributeError: module 'selenium.webdriver' has no attribute 'PhantomJS'"
+    store = VersionStore(['2.53', '3.141', '4.0'])
+    assert index.suggest(message, ['selenium'], lambda package: (store, [])) == {'module': 'selenium', 'version': '3.141'}
+    assert index.suggest(message, ['selenium'], lambda package: (store, ['3.141'])) == {'module': 'selenium', 'version': '2.53'}
+    assert index.suggest('SyntaxError: invalid syntax', ['selenium'], lambda package: (store, [])) is None
+
+def test_missing_symbol(index):
+    assert index.missing_symbol("ImportError: cannot import name 'soft_unicode' from 'markupsafe'") == ('soft_unicode', 'markupsafe')
+    assert index.missing_symbol("AttributeError: 'module' object has no attribute 'PhantomJS'") == ('PhantomJS', None)
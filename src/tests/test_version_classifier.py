@@ -0,0 +1,53 @@
+# Tests for narrowing a snippet's Python versions from its syntax and imports
+import pytest
+
+from helpers.version_classifier import VersionClassifier, python2_markers
+
+@pytest.fixture(scope='module')
+def classifier():
+    return VersionClassifier()
+
+def oldest(classification):
+    return classification['feasible'][-1]
+
+def test_python3_features_set_a_minimum(classifier):
+    assert oldest(classifier.classify('x = f"{1}"\n')) == '3.6'
+    assert oldest(classifier.classify('if (n := 3): pass\n')) == '3.8'
+    assert oldest(classifier.classify('match x:\n    case 1: pass\n')) == '3.10'
+    assert oldest(classifier.classify('async def f():\n    await g()\n')) == '3.5'
+    assert oldest(classifier.classify('x = 1_000\n')) == '3.6'
+
+def test_reasons_name_the_feature_and_line(classifier):
+    classification = classifier.classify('import os\n\nx = f"{os.sep}"\n')
+    assert classification['parser'] == 'ast'
+    assert classification['reasons'] == [{'feature': 'f-string', 'version': '3.6', 'line': 3}]
+    assert classifier.describe(classification) == 'Python 3.6 - 3.12 (f-string line 3)'
+
+def test_python2_syntax_rules_out_python3(classifier):
+    for source in ('print "hi"\n', 'try:\n    pass\nexcept ValueError, e:\n    pass\n', 'x = `y`\n', 'if a <> b: pass\n', 'x = 10L\n'):
+        classification = classifier.classify(source)
+        assert classification['parser'] == 'tokenize'
+        assert classification['feasible'] == ['2.7', '2.6']
+
+def test_python2_markers_skip_print_calls():
+    assert python2_markers('print("hi")\nprint = 3\n') == []
+    assert [marker['feature'] for marker in python2_markers('if x: print x\n')] == ['print statement']
+
+def test_unguarded_stdlib_imports_narrow_the_range(classifier):
+    assert classifier.classify('import urllib2\n')['feasible'] == ['2.7', '2.6']
+    assert classifier.classify('import tomllib\n')['feasible'] == ['3.12', '3.11']
+
+def test_guarded_and_backported_imports_say_nothing(classifier):
+    assert classifier.classify('try:\n    import urllib2\nexcept ImportError:\n    pass\n')['feasible'] == classifier.cycles
+    assert classifier.classify('import asyncio\nimport enum\n')['feasible'] == classifier.cycles
+
+def test_imports_that_contradict_the_syntax_are_ignored(classifier):
+    classification = classifier.classify('import urllib2\nx = f"{urllib2}"\n')
+    assert oldest(classification) == '3.6'
+    assert [reason['feature'] for reason in classification['reasons']] == ['f-string']
+
+def test_clamp_moves_a_guess_into_the_range(classifier):
+    assert classifier.clamp({'feasible': ['3.8', '3.7', '3.6']}, '2.7') == '3.7'
+    assert classifier.clamp({'feasible': ['2.7', '2.6']}, '3.8') == '2.7'
+    assert classifier.clamp({'feasible': ['3.8', '3.7']}, '3.7') == '3.7'
+    assert classifier.clamp({'feasible': ['3.8', '3.7']}, 'unknown') == '3.8'
@@ -0,0 +1,53 @@
+# Tests for the PEP 440 ordered VersionStore
+import pytest
+
+from helpers.version_store import VersionStore
+
+def test_sorts_by_pep440():
+    store = VersionStore(['1.10', '1.2', '1.0', '1.0rc1', '1.0.post1', '0.9'])
+    assert list(store) == ['0.9', '1.0rc1', '1.0', '1.0.post1', '1.2', '1.10']
+    assert store.oldest() == '0.9'
+    assert store.newest() == '1.10'
+
+def test_invalid_versions_sort_first():
+    store = VersionStore(['1.0', 'dev', '0.5'])
+    assert list(store) == ['dev', '0.5', '1.0']
+
+def test_equal_versions_match_the_stored_spelling():
+    store = VersionStore(['1.2', '2.0'])
+    assert store.index('1.2.0') == 0
+    assert store.match('1.2.0') == '1.2'
+    assert '2.0.0' in store
+    assert store.match('3.0') is None
+    assert store.index('3.0') == -1
+
+def test_position_of_a_version_that_isnt_stored():
+    store = VersionStore(['1.0', '2.0', '3.0'])
+    assert store.position('2.5') == 2
+    assert store.position('0.1') == 0
+
+def test_str_round_trips_through_from_string():
+    store = VersionStore(['2.0', '1.0'])
+    assert str(store) == '1.0, 2.0'
+    assert list(VersionStore.from_string(str(store))) == ['1.0', '2.0']
+
+def test_bisect_towards_older_and_newer():
+    store = VersionStore([f"1.{minor}" for minor in range(9)])
+    assert store.bisect('1.8') == '1.3'
+    assert store.bisect('1.8', tried=['1.4']) == '1.6'
+    assert store.bisect('1.0', newer=True) == '1.5'
+    assert store.bisect('1.0') is None
+
+def test_evenly_spaced_skips_excluded():
+    store = VersionStore([f"1.{minor}" for minor in range(11)])
+    assert store.evenly_spaced(3) == ['1.0', '1.5', '1.10']
+    picked = store.evenly_spaced(3, exclude=['1.5'])
+    assert len(picked) == 3 and '1.5' not in picked
+    assert store.evenly_spaced(0) == []
+    assert len(store.evenly_spaced(20)) == 11
+
+def test_bytes_round_trip():
+    store = VersionStore(['1.0', '1.0rc1', '2.0'])
+    assert list(VersionStore.from_bytes(store.to_bytes())) == list(store)
+    with pytest.raises(ValueError):
+        VersionStore.from_bytes(b'not a store')